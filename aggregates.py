@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+from ingest import METRIC_COLUMNS
+from rollups import float32_value
+
+# -------------------------------------------------------------------------------------
+# Running aggregates
+# What it does: Keeps, per (facility, year), the sum, count and minimum of every metric over the non-anomalous
+# rows, plus the last readings of every metric per facility (the window used for trend detection).
+# They are built once at ingest. When rows are appended, only the new rows are aggregated and merged in:
+# sums and counts add up, minimums take the smaller one, and windows keep their newest readings.
+
+TREND_WINDOW = 5
+
+
+def annual_table(data: pd.DataFrame) -> pd.DataFrame:
+    """One groupby pass: (facility_name, year) → sum/count/min of each metric, and the number of rows."""
+    valid = data[~data["anomaly_flag"]]
+    metrics = valid[METRIC_COLUMNS].astype("float64")
+    groups = metrics.groupby([valid["facility_name"], valid["year"]], observed=True)
+    table = pd.concat({"sum": groups.sum(), "count": groups.count(), "min": groups.min()}, axis=1)
+    table[("rows", "")] = groups.size()
+    table.index = pd.MultiIndex.from_arrays(
+        [table.index.get_level_values(0).astype(str), table.index.get_level_values(1).astype(int)],
+        names=["facility_name", "year"],
+    )
+    return table
+
+
+def merge_tables(old: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    if old.empty:
+        return new
+    if new.empty:
+        return old
+    keys = old.index.union(new.index)
+    old, new = old.reindex(keys), new.reindex(keys)
+    merged = old.add(new, fill_value=0)                                  # sum, count and rows add up
+    merged["min"] = np.fmin(old["min"], new["min"])                      # fmin skips the NaN of missing groups
+    return merged
+
+
+def trend_windows(rows: pd.DataFrame) -> dict:
+    """Last TREND_WINDOW non-missing readings of each metric, for one facility's date-sorted rows."""
+    windows = {}
+    for col in METRIC_COLUMNS:
+        values = rows[col].to_numpy()
+        windows[col] = values[~np.isnan(values)][-TREND_WINDOW:]
+    return windows
+
+
+class YearSummary:
+    """Stats of one facility/year, read from the aggregates table (same interface as rollups.RangeSummary)."""
+
+    def __init__(self, row: pd.Series | None):
+        self.row = row
+
+    @property
+    def rows(self) -> int:
+        return 0 if self.row is None else int(self.row[("rows", "")])
+
+    @property
+    def empty(self) -> bool:
+        return self.rows == 0
+
+    def count(self, col: str) -> int:
+        return 0 if self.row is None else int(self.row[("count", col)])
+
+    def total(self, col: str) -> float:
+        return 0.0 if self.row is None else float(self.row[("sum", col)])
+
+    def mean(self, col: str) -> float:
+        count = self.count(col)
+        return self.total(col) / count if count else np.nan
+
+    def minimum(self, col: str) -> float:
+        if self.row is None or np.isnan(self.row[("min", col)]):
+            return np.nan
+        return float32_value(self.row[("min", col)])
+
+
+class RunningAggregates:
+
+    def __init__(self, table: pd.DataFrame, windows: dict):
+        self.table = table
+        self.windows = windows
+
+    @classmethod
+    def build(cls, data: pd.DataFrame, ranges: dict) -> "RunningAggregates":
+        windows = {name: trend_windows(data.iloc[lo:hi]) for name, (lo, hi) in ranges.items()}
+        return cls(annual_table(data), windows)
+
+    def updated(self, rows: pd.DataFrame, ranges: dict, rebuilt: dict) -> "RunningAggregates":
+        """
+        New aggregates with the (canonical, facility/date-sorted) rows added.
+        ranges: facility → row range of the new rows. rebuilt: facility → full block, for facilities whose
+        new rows were older than their latest reading, so their window has to be taken from the block again.
+        """
+        windows = dict(self.windows)
+        for name, (lo, hi) in ranges.items():
+            if name in rebuilt:
+                windows[name] = trend_windows(rebuilt[name])
+                continue
+            new = trend_windows(rows.iloc[lo:hi])
+            old = self.windows.get(name, {})
+            windows[name] = {
+                col: np.concatenate([old.get(col, new[col][:0]), new[col]])[-TREND_WINDOW:] for col in METRIC_COLUMNS
+            }
+        return RunningAggregates(merge_tables(self.table, annual_table(rows)), windows)
+
+    def years(self, facility_name: str) -> list[int]:
+        """Years in which the facility has non-anomalous rows."""
+        if facility_name not in self.table.index.get_level_values(0):
+            return []
+        return self.table.loc[facility_name].index.tolist()
+
+    def year_summary(self, facility_name: str, year) -> YearSummary:
+        if pd.isna(year):
+            return YearSummary(None)
+        key = (facility_name, int(year))
+        return YearSummary(self.table.loc[key] if key in self.table.index else None)
+
+    def window(self, facility_name: str, col: str) -> np.ndarray:
+        return self.windows.get(facility_name, {}).get(col, np.empty(0))
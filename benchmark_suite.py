@@ -0,0 +1,138 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import ingest
+import insights
+import models
+import slopes
+from benchmarks import BenchmarkTable, BENCH_CSV_PATH, load_benchmarks, compare_facilities
+from dataset import DatasetSnapshot, file_version
+from synthetic_data import generate
+
+# -------------------------------------------------------------------------------------
+# Performance benchmark suite
+# What it does: Times the insights and model functions on synthetic datasets (see synthetic_data.py) of growing
+# size, and writes wall time, peak memory and rows per second to a json file, together with the git commit,
+# so two commits can be compared. Each function is timed a few times and the best run is kept; peak memory is
+# measured in one more run with tracemalloc (which slows the code down, so it is not part of the timings).
+# Usage: python benchmark_suite.py --sizes 10000,100000,1000000 --output benchmark_results.json
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+METRIC = "co2_emitted_tonnes"
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None                                                       # Not a git checkout (e.g. the Docker image)
+
+
+def measure(func, repeat: int) -> tuple[float, float]:
+    """Best wall time of repeat runs (seconds), and the peak memory allocated by one run (MB)."""
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(seconds), peak / 2**20
+
+
+def cases(raw: pd.DataFrame, snapshot: DatasetSnapshot, bench: BenchmarkTable | None, train: bool) -> list[tuple[str, int, object]]:
+    """(name, rows the call works on, call). Single-facility functions run on the first facility."""
+    facility = snapshot.facility_names[0]
+    lo, hi = snapshot.index.ranges[facility]
+    dates = pd.to_datetime(snapshot.index.dates(facility)).dropna()    # Stored as int64 ns, missing dates are NaT
+    start = dates[0].strftime(ingest.DATE_FORMAT)                       # The facility's whole history
+    end = dates[-1].strftime(ingest.DATE_FORMAT)
+    data = snapshot.data
+    rows = snapshot.row_count
+
+    found = [
+        ("ingest.to_canonical", rows, lambda: ingest.to_canonical(raw)),
+        ("DatasetSnapshot", rows, lambda: DatasetSnapshot(data, "benchmark", "synthetic")),
+        ("insights.annual_stats", hi - lo, lambda: insights.annual_stats(snapshot, facility)),
+        ("insights.annual_stats_table", rows, lambda: insights.annual_stats_table(snapshot)),
+        ("insights.stats_by_range", hi - lo, lambda: insights.stats_by_range(snapshot, facility, start, end)),
+        ("insights.get_percent_changes", hi - lo, lambda: insights.get_percent_changes(facility, snapshot, METRIC)),
+        ("insights.trends", hi - lo, lambda: insights.trends(facility, snapshot, METRIC)),
+        ("slopes.trend_table", rows, lambda: slopes.trend_table(snapshot)),
+    ]
+    if bench is not None:
+        found.append(("benchmarks.compare_facilities", rows, lambda: compare_facilities(snapshot, bench)))
+    if train:
+        found.append(("models.LGBM_regressor", hi - lo, lambda: models.LGBM_regressor(facility, data)))
+    return found
+
+
+def run(sizes: list[int], facilities: int, years: int, anomaly_rate: float, seed: int, repeat: int,
+        train: bool, bench_path: str | None) -> dict:
+    bench = BenchmarkTable(load_benchmarks(bench_path), file_version(bench_path)) if bench_path and os.path.exists(bench_path) else None
+    results = []
+    for size in sizes:
+        print(f"Generating {size} rows")                                 # STEP 1: Synthetic upload csv rows, in memory
+        raw = generate(size, facilities=facilities, years=years, anomaly_rate=anomaly_rate, seed=seed)
+        snapshot = DatasetSnapshot(ingest.to_canonical(raw), "benchmark", "synthetic")   # STEP 2: What the store hands out
+
+        for name, rows, func in cases(raw, snapshot, bench, train):       # STEP 3: Time every function
+            seconds, peak_mb = measure(func, repeat)
+            results.append({
+                "function": name,
+                "dataset_rows": size,
+                "rows": rows,
+                "seconds": seconds,
+                "peak_memory_mb": peak_mb,
+                "rows_per_second": rows / seconds if seconds > 0 else None,
+            })
+            print(f"{size:>12} {name:<32} {seconds:10.4f}s {peak_mb:10.1f} MB")
+        del raw, snapshot
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+        },
+        "config": {"sizes": sizes, "facilities": facilities, "years": years, "anomaly_rate": anomaly_rate,
+                   "seed": seed, "repeat": repeat},
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the insights and model functions on synthetic data.")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES), help="Dataset rows, comma separated")
+    parser.add_argument("--facilities", type=int, default=4)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--anomaly-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per function, the best one is kept")
+    parser.add_argument("--skip-training", action="store_true", help="Don't benchmark models.LGBM_regressor")
+    parser.add_argument("--bench-csv", default=BENCH_CSV_PATH)
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    report = run([int(size) for size in args.sizes.split(",")], args.facilities, args.years, args.anomaly_rate,
+                 args.seed, args.repeat, not args.skip_training, args.bench_csv)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
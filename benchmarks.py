@@ -0,0 +1,162 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from ingest import METRIC_COLUMNS, SEASONS
+from dataset import as_snapshot, file_version
+from features import category_codes
+
+# -------------------------------------------------------------------------------------
+# Global benchmarks
+# What it does: Loads bench.csv once (and again only when the file changes), one benchmark row per
+# (region, storage_site_type, season). Facility readings are compared to their benchmark with one merge
+# on those keys, then every deviation and underperformance flag is computed on whole columns: the cost is
+# one join, for one facility or for all of them, instead of a loop over readings.
+
+BENCH_CSV_PATH = os.getenv("BENCH_CSV_PATH", os.path.join(".", "bench.csv"))
+
+BENCH_KEYS = ["region", "storage_site_type", "season"]
+
+# For these metrics a value above the benchmark is worse, for the others a value below it
+LOWER_IS_BETTER = {"co2_emitted_tonnes"}
+
+
+def load_benchmarks(path: str) -> pd.DataFrame:
+    """One row per (region, storage_site_type, season), the metric columns renamed to <metric>_benchmark."""
+    raw = pd.read_csv(path)
+    metrics = [col for col in METRIC_COLUMNS if col in raw.columns]
+    bench = raw[BENCH_KEYS + metrics].dropna(subset=BENCH_KEYS)
+    bench = bench.assign(
+        region=bench["region"].str.strip(),
+        storage_site_type=bench["storage_site_type"].str.strip(),
+        season=bench["season"].str.strip().str.title(),                  # bench.csv has "spring", the dataset "Spring"
+    )
+    unknown = set(bench["season"]) - set(SEASONS)
+    if unknown:
+        raise ValueError(f"Unknown season(s) in {path}: {', '.join(sorted(unknown))}")
+    bench = bench.groupby(BENCH_KEYS, as_index=False)[metrics].mean()       # Duplicated keys: their mean
+    return bench.rename(columns={col: f"{col}_benchmark" for col in metrics})
+
+
+class BenchmarkTable:
+
+    def __init__(self, bench: pd.DataFrame, version: str):
+        self.bench = bench
+        self.version = version
+        self.metrics = [col.removesuffix("_benchmark") for col in bench.columns if col.endswith("_benchmark")]
+        # The join is on integer codes of the key values, not on strings
+        self.categories = {col: sorted(bench[col].unique()) for col in BENCH_KEYS}
+        self._coded = bench.assign(**{col: category_codes(bench[col], self.categories[col]) for col in BENCH_KEYS})
+
+    def check(self, metrics: list[str] | None) -> list[str]:
+        """The metrics to compare (default: every metric with a benchmark). Raises ValueError for the others."""
+        metrics = metrics or self.metrics
+        unknown = [col for col in metrics if col not in self.metrics]
+        if unknown:
+            raise ValueError(f"No benchmark for variable(s): {', '.join(unknown)}")
+        return metrics
+
+    def compare(self, readings: pd.DataFrame, metrics: list[str] | None = None) -> pd.DataFrame:
+        """
+        The readings with, for each metric: its benchmark, deviation (value - benchmark), deviation_percent and an
+        underperforming flag. Readings without a benchmark for their keys get NaN and are never flagged.
+        """
+        metrics = self.check(metrics)
+        # Categoricals of the dataset are recoded per category; values without a benchmark get -1 and match nothing
+        keys = pd.DataFrame({col: category_codes(readings[col], self.categories[col]) for col in BENCH_KEYS})
+        bench = self._coded[BENCH_KEYS + [f"{col}_benchmark" for col in metrics]]
+        merged = keys.merge(bench, how="left", on=BENCH_KEYS, validate="many_to_one")    # The one join; keeps the order
+
+        compared = readings.reset_index(drop=True)
+        for col in metrics:
+            value = compared[col].to_numpy(dtype=np.float64)
+            benchmark = merged[f"{col}_benchmark"].to_numpy(dtype=np.float64)
+            deviation = value - benchmark
+            with np.errstate(divide="ignore", invalid="ignore"):
+                deviation_percent = np.where(benchmark != 0, deviation / np.abs(benchmark) * 100, np.nan)
+            worse = deviation > 0 if col in LOWER_IS_BETTER else deviation < 0      # False where either side is NaN
+            compared[f"{col}_benchmark"] = benchmark
+            compared[f"{col}_deviation"] = deviation
+            compared[f"{col}_deviation_percent"] = deviation_percent
+            compared[f"{col}_underperforming"] = worse
+        compared["benchmarked"] = merged[[f"{col}_benchmark" for col in metrics]].notna().any(axis=1).to_numpy()
+        return compared
+
+
+def summarize(compared: pd.DataFrame, metrics: list[str]) -> list[dict]:
+    """Per facility: readings, benchmarked readings, and for each metric the mean value, benchmark and deviation, and how many readings underperformed."""
+    aggregations = {"rows": ("facility_name", "size"), "benchmarked_rows": ("benchmarked", "sum")}
+    for col in metrics:
+        aggregations[f"{col}|mean"] = (col, "mean")
+        aggregations[f"{col}|benchmark"] = (f"{col}_benchmark", "mean")
+        aggregations[f"{col}|deviation"] = (f"{col}_deviation", "mean")
+        aggregations[f"{col}|deviation_percent"] = (f"{col}_deviation_percent", "mean")
+        aggregations[f"{col}|underperforming_rows"] = (f"{col}_underperforming", "sum")
+    table = compared.groupby("facility_name", observed=True, sort=False).agg(**aggregations)
+
+    summary = []
+    for name, row in zip(table.index, table.to_dict(orient="records")):
+        item = {"facility_name": str(name), "rows": int(row["rows"]), "benchmarked_rows": int(row["benchmarked_rows"]), "metrics": []}
+        for col in metrics:
+            underperforming = int(row[f"{col}|underperforming_rows"])
+            item["metrics"].append({
+                "variable": col,
+                "mean": _number(row[f"{col}|mean"]),
+                "benchmark": _number(row[f"{col}|benchmark"]),
+                "deviation": _number(row[f"{col}|deviation"]),
+                "deviation_percent": _number(row[f"{col}|deviation_percent"]),
+                "underperforming_rows": underperforming,
+                "underperforming_share": underperforming / item["benchmarked_rows"] if item["benchmarked_rows"] else None,
+            })
+        summary.append(item)
+    return summary
+
+
+def _number(value) -> float | None:
+    return None if pd.isna(value) else float(value)                       # NaN is not valid json
+
+
+def compare_facilities(data, bench: BenchmarkTable, facility_names: list[str] | None = None, metrics: list[str] | None = None) -> pd.DataFrame:
+    """The readings of some facilities (default: all), compared to the benchmarks, see BenchmarkTable.compare."""
+    data = as_snapshot(data)
+    if data.empty:
+        raise ValueError("The dataset is empty. Please set the CSV data first.")
+    metrics = bench.check(metrics)
+    missing = [name for name in facility_names or [] if name not in data.index]
+    if missing:
+        raise ValueError(f"Facility '{missing[0]}' not found in the dataset.")
+
+    columns = ["date", "facility_name", *BENCH_KEYS, *metrics]
+    if facility_names:
+        readings = pd.concat([data.rows(name, columns=columns) for name in facility_names])   # Index slices, no scan
+    else:
+        readings = data.select(columns)
+    return bench.compare(readings, metrics)
+
+
+class BenchmarkStore:
+    """Loads the benchmark csv once, and again only when the file changes."""
+
+    def __init__(self, path: str = BENCH_CSV_PATH):
+        self.path = path
+        self._table = None
+        self._stat = None
+        self._lock = threading.Lock()
+
+    def get(self) -> BenchmarkTable:
+        st = os.stat(self.path)                                             # FileNotFoundError if there is no benchmark file
+        stat = (st.st_mtime_ns, st.st_size)
+        if stat == self._stat:
+            return self._table
+        with self._lock:
+            if stat != self._stat:
+                print(f"Loading benchmarks from {self.path}")
+                self._table = BenchmarkTable(load_benchmarks(self.path), file_version(self.path))
+                self._stat = stat
+            return self._table
+
+
+# One store per process, shared by the FastAPI app and the gRPC servicer
+benchmark_store = BenchmarkStore()
@@ -0,0 +1,473 @@
+import copy
+import hashlib
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import ingest
+from rollups import FacilityRollup, RangeSummary
+from aggregates import RunningAggregates
+from storage import ArrowStorage, MAX_APPEND_FILES
+
+# Csv saved by earlier versions of the service. Csv is now only the upload format, the data itself is
+# kept in columnar files (see storage.py). An existing csv is converted once, on first use.
+CSV_PATH = os.getenv("CSV_DATASET_PATH", os.path.join(".", "csv_dataset.csv"))
+
+# Columns needed to build the index, rollups and aggregates. The others are only read when asked for
+CORE_COLUMNS = ["date", "facility_name", "anomaly_flag", "year"] + ingest.METRIC_COLUMNS
+
+UPLOAD_CHUNK_SIZE = 1 << 20        # Uploads are read/streamed in chunks of 1 MiB
+
+
+# -------------------------------------------------------------------------------------
+# Facility index
+# What it does: The dataset is kept sorted by (facility_name, date), so the rows of one facility are a
+# contiguous block. The index maps each facility to its block, and a date range inside the block is found
+# with a binary search. Filtering on facility/dates is then a slice, instead of a scan of the whole table.
+# A block's dates are kept as a list of sorted segments (the upload, then one per append), so an append
+# only adds a segment and moves the block ranges, without copying the dates of the whole table.
+
+def sort_by_facility(data: pd.DataFrame) -> pd.DataFrame:
+    # Missing dates go first: NaT is the smallest int64, so the dates stay sorted for searchsorted
+    data = data[data["facility_name"].notna()]            # Rows without a facility can't be looked up, see ingest.to_canonical
+    data = data.sort_values(["facility_name", "date"], kind="stable", na_position="first")
+    return data.reset_index(drop=True)
+
+
+def _to_ns(date) -> int:
+    return pd.Timestamp(date).as_unit("ns").value
+
+
+class FacilityIndex:
+
+    def __init__(self, data: pd.DataFrame):
+        names = data["facility_name"]
+        if not isinstance(names.dtype, pd.CategoricalDtype):
+            names = names.astype("category")
+        codes = names.cat.codes.to_numpy()
+
+        starts = np.flatnonzero(np.diff(codes, prepend=np.int64(-2)))        # First row of each facility block
+        stops = np.append(starts[1:], len(codes))
+        categories = names.cat.categories
+        self.ranges = {
+            categories[codes[start]]: (int(start), int(stop))
+            for start, stop in zip(starts, stops)
+            if codes[start] >= 0                                                # Rows without a facility name
+        }
+        dates = data["date"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        self.segments = {name: [dates[lo:hi]] for name, (lo, hi) in self.ranges.items()}
+        self.row_count = len(dates)
+
+    def extended(self, new: "FacilityIndex", rebuilt: dict) -> "FacilityIndex":
+        """
+        The index once the rows indexed by new are appended: each facility's block gets their dates as one more
+        segment, and the blocks after it move down. rebuilt: facility → dates of the blocks that were re-sorted.
+        """
+        index = FacilityIndex.__new__(FacilityIndex)
+        index.ranges, index.segments = {}, {}
+        position = 0
+        for name in dict.fromkeys(self.names + new.names):
+            if name in rebuilt:
+                segments = [rebuilt[name]]
+            else:
+                segments = self.segments.get(name, []) + new.segments.get(name, [])
+            size = sum(len(segment) for segment in segments)
+            index.ranges[name] = (position, position + size)
+            index.segments[name] = segments
+            position += size
+        index.row_count = position
+        return index
+
+    def __contains__(self, facility_name) -> bool:
+        return facility_name in self.ranges
+
+    @property
+    def names(self) -> list:
+        return list(self.ranges)
+
+    def dates(self, facility_name: str) -> np.ndarray:
+        """Dates of a facility's rows (int64 ns, sorted)."""
+        segments = self.segments.get(facility_name, [])
+        if len(segments) == 1:
+            return segments[0]
+        return np.concatenate(segments) if segments else np.empty(0, dtype=np.int64)
+
+    def last_date(self, facility_name: str) -> int | None:
+        segments = [segment for segment in self.segments.get(facility_name, []) if len(segment)]
+        return int(segments[-1][-1]) if segments else None
+
+    def bounds(self, facility_name: str, start=None, end=None) -> tuple[int, int]:
+        """Row range [lo, hi) of a facility, optionally limited to start <= date <= end."""
+        lo, hi = self.ranges.get(facility_name, (0, 0))
+        segments = self.segments.get(facility_name, [])
+        first, last = lo, hi
+        # The segments follow each other in date order, so a position in the block is the sum over the segments
+        if start is not None:
+            first = lo + sum(int(np.searchsorted(segment, _to_ns(start), side="left")) for segment in segments)
+        if end is not None:
+            last = lo + sum(int(np.searchsorted(segment, _to_ns(end), side="right")) for segment in segments)
+        return first, max(first, last)
+
+
+def conform(table: pa.Table, schema: pa.Schema) -> pa.Table | None:
+    """The table with the columns and types of schema (missing columns are null), or None if it doesn't fit."""
+    if not set(table.column_names) <= set(schema.names):
+        return None
+    try:
+        columns = [
+            table.column(field.name).cast(field.type) if field.name in table.column_names else pa.nulls(len(table), field.type)
+            for field in schema
+        ]
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return None
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+# -------------------------------------------------------------------------------------
+# Snapshot of the source data
+# What it does: Holds one parsed and indexed copy of the dataset, tagged with its version.
+# Snapshots are never modified in place, a reload or an append produces a new one.
+# A snapshot loaded from storage keeps the memory-mapped Arrow table, and only turns the columns it needs into
+# pandas: the core columns for the index/rollups/aggregates, and per query the rows/columns asked for.
+# An appended snapshot is an Arrow table made of the previous table's facility blocks with the new rows
+# inserted after each of them (pa.concat_tables: the old buffers are shared, not copied).
+
+class DatasetSnapshot:
+
+    def __init__(self, data: pd.DataFrame, version: str, source: str):
+        self._data = sort_by_facility(data)
+        self.table = None
+        self._blocks = None
+        self._build(self._data, version, source)
+
+    @classmethod
+    def from_table(cls, table: pa.Table, version: str, source: str) -> "DatasetSnapshot":
+        """From a stored table, already sorted by (facility_name, date)."""
+        snapshot = cls.__new__(cls)
+        snapshot._data = None
+        snapshot.table = table
+        snapshot._blocks = None
+        core = table.select([col for col in CORE_COLUMNS if col in table.column_names]).to_pandas()
+        snapshot._build(core, version, source)
+        return snapshot
+
+    def _build(self, data: pd.DataFrame, version: str, source: str):
+        self.index = FacilityIndex(data)
+        self.rollups = {                                             # Prefix sums/min tables, see rollups.py
+            name: FacilityRollup(data.iloc[lo:hi]) for name, (lo, hi) in self.index.ranges.items()
+        }
+        self.aggregates = RunningAggregates.build(data, self.index.ranges)   # Per facility/year, see aggregates.py
+        self.version = version
+        self.source = source
+        self.loaded_at = datetime.now()
+        self._lock = threading.Lock()
+
+    @property
+    def data(self) -> pd.DataFrame:
+        """The full table as a DataFrame. For stored snapshots it is only materialized on first use."""
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    self._data = self.table.to_pandas()
+        return self._data
+
+    def reopened(self, table: pa.Table) -> "DatasetSnapshot":
+        """The same snapshot, reading its rows from table: a stored copy of them in the same order."""
+        snapshot = copy.copy(self)
+        snapshot.table = table
+        snapshot._data = None
+        snapshot._blocks = None
+        snapshot._lock = threading.Lock()
+        return snapshot
+
+    def facility_tables(self) -> dict[str, list[pa.Table]]:
+        """Each facility's rows as a list of Arrow tables, in date order (the upload's slice, then the appended ones)."""
+        if self._blocks is None:
+            table = self.table if self.table is not None else pa.Table.from_pandas(self._data, preserve_index=False)
+            self._blocks = {name: [table.slice(lo, hi - lo)] for name, (lo, hi) in self.index.ranges.items()}
+        return self._blocks
+
+    def appended(self, rows: pd.DataFrame, version: str, table: pa.Table | None = None) -> "DatasetSnapshot":
+        """
+        A new snapshot with (canonical) rows added. Facilities whose new rows come after their latest reading,
+        which is the normal case for a live feed, keep their block, rollup and aggregates and only extend them,
+        so the cost depends on the number of new rows (and of blocks), not on the size of the table.
+        Only facilities that received older (back-filled) rows get their block re-sorted and their rollup rebuilt.
+        table: the same rows as Arrow (e.g. a mapped append file), then rows only needs the CORE_COLUMNS.
+        """
+        if self.empty:
+            return DatasetSnapshot(rows if table is None else table.to_pandas(), version, self.source)
+        if table is None:
+            rows = sort_by_facility(rows)
+            table = pa.Table.from_pandas(rows, preserve_index=False)
+        else:
+            rows = rows.reset_index(drop=True)
+            order = rows.sort_values(["facility_name", "date"], kind="stable", na_position="first").index.to_numpy()
+            if (order != np.arange(len(order))).any():
+                rows, table = rows.iloc[order].reset_index(drop=True), table.take(order)
+        new_index = FacilityIndex(rows)
+        blocks, rollups = dict(self.facility_tables()), dict(self.rollups)
+        schema = next(iter(blocks.values()))[0].schema
+        conformed = conform(table, schema)
+        promote = conformed is None                                  # New columns/types: the schemas are merged below
+        rebuilt_dates, rebuilt_rows = {}, {}
+
+        for name, (lo, hi) in new_index.ranges.items():
+            new = rows.iloc[lo:hi]
+            piece = (table if promote else conformed).slice(lo, hi - lo)
+            last = self.index.last_date(name)
+            if name not in rollups:                                  # A new facility
+                blocks[name] = [piece]
+                rollups[name] = FacilityRollup(new)
+            elif new["date"].notna().all() and (last is None or _to_ns(new["date"].iloc[0]) >= last):
+                blocks[name] = blocks[name] + [piece]
+                rollups[name] = rollups[name].extended(new)
+            else:                                                    # Back-filled rows: re-sort this facility's block
+                combined = pa.concat_tables(blocks[name] + [piece], promote_options="permissive" if promote else "none")
+                dates = combined.column("date").to_numpy().astype("datetime64[ns]").view(np.int64)
+                order = np.argsort(dates, kind="stable")             # NaT is the smallest int64: missing dates first
+                blocks[name] = [combined.take(order)]
+                block = blocks[name][0].select([col for col in CORE_COLUMNS if col in combined.column_names]).to_pandas()
+                rollups[name] = FacilityRollup(block)
+                rebuilt_rows[name] = block
+                rebuilt_dates[name] = dates[order]
+
+        index = self.index.extended(new_index, rebuilt_dates)
+        tables = [table for name in index.names for table in blocks[name]]
+        if promote:
+            table = pa.concat_tables(tables, promote_options="permissive")
+            blocks = {name: [table.slice(lo, hi - lo)] for name, (lo, hi) in index.ranges.items()}
+        else:
+            table = pa.concat_tables(tables)
+
+        snapshot = DatasetSnapshot.__new__(DatasetSnapshot)
+        snapshot._data = None
+        snapshot.table = table
+        snapshot._blocks = blocks
+        snapshot._lock = threading.Lock()
+        snapshot.index = index
+        snapshot.rollups = rollups
+        snapshot.aggregates = self.aggregates.updated(rows, new_index.ranges, rebuilt_rows)
+        snapshot.version = version
+        snapshot.source = self.source
+        snapshot.loaded_at = datetime.now()
+        return snapshot
+
+    @property
+    def row_count(self) -> int:
+        return self.index.row_count
+
+    @property
+    def empty(self) -> bool:
+        return self.row_count == 0
+
+    @property
+    def facility_names(self) -> list:
+        return self.index.names
+
+    def rows(self, facility_name: str, start=None, end=None, columns: list[str] | None = None) -> pd.DataFrame:
+        """Rows of one facility (sorted by date), optionally limited to start <= date <= end and to some columns."""
+        lo, hi = self.index.bounds(facility_name, start, end)
+        if self._data is None:
+            base = self.index.ranges.get(facility_name, (lo, hi))[0]
+            part = self._facility_table(facility_name).slice(lo - base, hi - lo)   # Zero-copy slice of the mapped file
+            if columns is not None:
+                part = part.select(columns)
+            frame = part.to_pandas()
+            frame.index = pd.RangeIndex(lo, hi)
+            return frame
+        frame = self.data.iloc[lo:hi]
+        return frame if columns is None else frame[columns]
+
+    def _facility_table(self, facility_name: str) -> pa.Table:
+        if self._blocks is not None and facility_name in self._blocks:
+            blocks = self._blocks[facility_name]
+            return blocks[0] if len(blocks) == 1 else pa.concat_tables(blocks)
+        lo, hi = self.index.ranges.get(facility_name, (0, 0))
+        return self.table.slice(lo, hi - lo)
+
+    def select(self, columns: list[str]) -> pd.DataFrame:
+        """Some columns of every row, without materializing the others."""
+        if self._data is None:
+            return self.table.select(columns).to_pandas()
+        return self.data[columns]
+
+    def summary(self, facility_name: str, start=None, end=None) -> RangeSummary:
+        """Totals/means/minimums of a facility's non-anomalous rows in a date range, without touching the rows."""
+        base = self.index.ranges[facility_name][0]
+        lo, hi = self.index.bounds(facility_name, start, end)
+        return RangeSummary(self.rollups[facility_name], lo - base, hi - base)
+
+
+def as_snapshot(data) -> DatasetSnapshot:
+    """Lets the insights functions also be called with a plain (canonical) DataFrame."""
+    if isinstance(data, DatasetSnapshot):
+        return data
+    return DatasetSnapshot(data, version="", source="")
+
+
+def file_version(path: str, block_size: int = 1 << 20) -> str:
+    """Content hash of a file, used as its dataset version."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+# -------------------------------------------------------------------------------------
+# Dataset store
+# What it does: Loads the stored data once and hands the same in-memory snapshot to every request.
+# It is only loaded again when the storage manifest changes to a different version (upload or append,
+# possibly by another process like the gRPC server).
+
+class DatasetStore:
+
+    def __init__(self, storage: ArrowStorage | None = None, csv_path: str = CSV_PATH):
+        self.storage = storage or ArrowStorage()
+        self.csv_path = csv_path
+        self._lock = threading.Lock()
+        self._snapshot: DatasetSnapshot | None = None
+        self._stat = None
+
+    @property
+    def path(self) -> str:
+        return self.storage.folder
+
+    def load(self) -> DatasetSnapshot | None:
+        """Force a (re)load of the stored data."""
+        with self._lock:
+            return self._load_locked(self.storage.stat(), force=True)
+
+    def get(self) -> DatasetSnapshot | None:
+        """Current snapshot. Returns None if no csv was uploaded yet."""
+        stat = self.storage.stat()
+        if stat is not None and stat == self._stat:
+            return self._snapshot                      # Fast path: nothing written since the last load
+        with self._lock:
+            return self._load_locked(stat)
+
+    def _load_locked(self, stat, force: bool = False) -> DatasetSnapshot | None:
+        if stat is None:
+            if os.path.exists(self.csv_path):
+                return self._migrate_csv_locked()
+            return self._snapshot
+        if not force and stat == self._stat:           # Another request reloaded while we waited on the lock
+            return self._snapshot
+
+        for attempt in range(3):
+            manifest = self.storage.manifest()
+            if self._snapshot is not None and manifest["version"] == self._snapshot.version:
+                break                                  # Rewritten, but same content: keep the old snapshot
+            try:
+                self._snapshot = self._read_locked(manifest)
+                break
+            except FileNotFoundError:                  # Replaced by a newer upload while we were reading it
+                if attempt == 2:
+                    raise
+        self._stat = stat
+        return self._snapshot
+
+    def _read_locked(self, manifest: dict) -> DatasetSnapshot:
+        print(f"Loading dataset {self.path} (version {manifest['version']})")
+        table = self.storage.read(manifest["base"])
+        snapshot = DatasetSnapshot.from_table(table, table.schema.metadata[b"version"].decode(), self.path)
+        for entry in manifest["appends"]:                            # Mapped too, only their core columns become pandas
+            rows = self.storage.read(entry["name"])
+            core = rows.select([col for col in CORE_COLUMNS if col in rows.column_names]).to_pandas()
+            snapshot = snapshot.appended(core, entry["version"], rows)
+        return snapshot
+
+    def _migrate_csv_locked(self) -> DatasetSnapshot:
+        print(f"Converting {self.csv_path} to columnar storage in {self.path}")
+        return self._publish_locked(ingest.read_csv(self.csv_path), file_version(self.csv_path))
+
+    def publish(self, data: pd.DataFrame, version: str) -> DatasetSnapshot:
+        """Replaces the dataset with data that was already parsed (e.g. during a streamed upload)."""
+        with self._lock:
+            return self._publish_locked(data, version)
+
+    def _publish_locked(self, data: pd.DataFrame, version: str) -> DatasetSnapshot:
+        # Saved, then served from the mapped file: the parsed DataFrame is not kept
+        with self.storage.lock:
+            name = self.storage.write_base(sort_by_facility(data), version)
+            snapshot = DatasetSnapshot.from_table(self.storage.read(name), version, self.path)
+            self._snapshot = snapshot
+            self._stat = self.storage.stat()
+        return snapshot
+
+    def begin_upload(self) -> "CsvUpload":
+        return CsvUpload(self)
+
+    def append(self, rows: pd.DataFrame) -> DatasetSnapshot:
+        """
+        Adds new readings (raw columns, dates as dd/mm/yyyy) to the stored and the in-memory data.
+        The snapshot is extended instead of reloaded, see DatasetSnapshot.appended.
+        """
+        new = ingest.to_canonical(rows)                              # Raises ValueError on bad rows, before anything is written
+        undated = int(new["date"].isna().sum())
+        if undated:                                                  # An upload keeps them (NaT), but a feed row without a date is an error
+            raise ValueError(f"{undated} row(s) have an invalid date. Use the dd/mm/yyyy format.")
+        new = sort_by_facility(new)
+        # The storage lock is held from reading the current version to writing the new one, so an append by
+        # another process (the gRPC server) can't slip in between and be lost
+        with self._lock, self.storage.lock:
+            current = self._load_locked(self.storage.stat())
+            # Chained version: the old version + a hash of the new rows, so nothing has to be hashed again
+            digest = hashlib.sha256(f"{current.version if current else ''}".encode())
+            digest.update(pd.util.hash_pandas_object(new, index=False).to_numpy().tobytes())
+            version = digest.hexdigest()[:16]
+
+            if current is None:
+                return self._publish_locked(new, version)
+            snapshot = current.appended(new, version)
+            if self.storage.write_append(new, version) >= MAX_APPEND_FILES:
+                # Fold the append files into one base, written from the Arrow blocks in the snapshot's row order,
+                # so the snapshot can read from it as is
+                name = self.storage.write_base(snapshot.table if snapshot.table is not None else snapshot.data, version)
+                snapshot = snapshot.reopened(self.storage.read(name))
+            self._snapshot = snapshot
+            self._stat = self.storage.stat()
+            return snapshot
+
+
+# -------------------------------------------------------------------------------------
+# Streamed upload
+# What it does: Receives an uploaded csv chunk by chunk. Each chunk is hashed and parsed right away
+# (see ingest.CsvStreamParser), so the whole file is never held in memory as raw text.
+# On commit the parsed data is saved in columnar form and becomes the store's snapshot.
+
+class CsvUpload:
+
+    def __init__(self, store: DatasetStore):
+        self.store = store
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._parser = ingest.CsvStreamParser()
+
+    def write(self, chunk: bytes):
+        self._digest.update(chunk)
+        self._parser.feed(chunk)                       # Raises ValueError as soon as the data is invalid
+        self.size += len(chunk)
+
+    def commit(self) -> DatasetSnapshot:
+        data = self._parser.finish()
+        return self.store.publish(data, self._digest.hexdigest()[:16])
+
+    def abort(self):
+        self._parser = None                            # Nothing was written yet, just drop the parsed batches
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+
+
+# One store per process, shared by the FastAPI app and the gRPC servicer
+store = DatasetStore()
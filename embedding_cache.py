@@ -0,0 +1,94 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# -------------------------------------------------------------------------------------
+# Embedding cache
+# What it does: Keeps the embeddings computed by the RAG pipeline (questions and indexed chunks), keyed by a
+# hash of the embedding model name and the text, so the same text is never encoded twice. The memory tier
+# drops the least recently used vectors when full, and an optional SQLite file keeps them across restarts
+# (re-indexing after a restart, or the same question asked again).
+
+EMBED_CACHE_SIZE = int(os.getenv("RAG_EMBED_CACHE_SIZE", 10_000))                      # Vectors kept in memory
+EMBED_CACHE_PATH = os.getenv("RAG_EMBED_CACHE_PATH", os.path.join(".", "rag_embeddings.sqlite3")) or None   # Empty = memory only
+
+
+def embedding_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\n{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+
+    def __init__(self, max_entries: int = EMBED_CACHE_SIZE, path: str | None = EMBED_CACHE_PATH):
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: list[str]) -> dict[str, np.ndarray]:
+        """The cached vectors among keys (memory first, then disk)."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = vector
+            on_disk = self._read_disk([key for key in keys if key not in found])
+            for key, vector in on_disk.items():
+                self._remember(key, vector)                                 # Promote to memory
+            found.update(on_disk)
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, vectors: dict[str, np.ndarray]):
+        with self._lock:
+            for key, vector in vectors.items():
+                self._remember(key, vector)
+            self._write_disk(vectors)
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)                              # Least recently used
+
+    # Disk tier: one row per vector, stored as float32 bytes
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        return self._conn
+
+    def _read_disk(self, keys: list[str]) -> dict[str, np.ndarray]:
+        if self.path is None or not keys:
+            return {}
+        found = {}
+        for start in range(0, len(keys), 500):                             # SQLite limits the number of parameters
+            part = keys[start:start + 500]
+            rows = self._db().execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({', '.join('?' * len(part))})", part
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def _write_disk(self, vectors: dict[str, np.ndarray]):
+        if self.path is None or not vectors:
+            return
+        with self._db() as conn:                                           # One transaction
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in vectors.items()],
+            )
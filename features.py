@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+
+from ingest import parse_dates, SEASONS, SEASON_BY_MONTH
+
+# -------------------------------------------------------------------------------------
+# Model features
+# What it does: The one feature pipeline used to train (models.py) and to score (model_registry.py) the LightGBM
+# models. Categorical columns become integer codes of a vocabulary (the list of known values) that is saved with
+# the model, so a model always sees the same code for the same value. The season is looked up from the month
+# with an array, and every step works on whole columns, so millions of rows are encoded without a python loop.
+
+FEATURE_COLS = ["co2_emitted_tonnes", "region", "storage_site_type", "season"]
+CATEGORICAL_COLS = ["region", "storage_site_type", "season"]
+TARGET_COL = "co2_captured_tonnes"
+
+
+def season_from_dates(dates: pd.Series) -> pd.Series:
+    """Season of each date, as a categorical with the SEASONS categories. Dates can be parsed or dd/mm/yyyy strings."""
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = parse_dates(dates)
+    codes = SEASON_BY_MONTH[dates.dt.month.fillna(0).to_numpy(dtype=np.int8)]
+    return pd.Series(pd.Categorical.from_codes(codes, categories=SEASONS), index=dates.index)
+
+
+def with_season(rows: pd.DataFrame) -> pd.DataFrame:
+    """The season can be left out (or empty) and taken from the date instead."""
+    if "season" in rows.columns and not rows["season"].isna().any():
+        return rows
+    rows = rows.copy()
+    if "date" in rows.columns:
+        from_date = season_from_dates(rows["date"])
+    else:
+        from_date = pd.Series(pd.Categorical.from_codes(np.full(len(rows), -1), categories=SEASONS), index=rows.index)
+    if "season" in rows.columns:
+        rows["season"] = rows["season"].astype(object).fillna(from_date.astype(object))
+    else:
+        rows["season"] = from_date
+    return rows
+
+
+def _categories(values: pd.Series) -> pd.Index:
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.remove_unused_categories().cat.categories.astype(str)   # Only the distinct values, not every row
+    return pd.Index(values.dropna().astype(str).unique())
+
+
+def build_vocabulary(rows: pd.DataFrame) -> dict[str, list[str]]:
+    """
+    The known values of each categorical feature. Seasons always get the fixed SEASONS order; the other columns
+    their distinct values, sorted (the codes the LabelEncoders of older models gave them).
+    """
+    vocabulary = {}
+    for col in CATEGORICAL_COLS:
+        vocabulary[col] = list(SEASONS) if col == "season" else sorted(_categories(rows[col]))
+    return vocabulary
+
+
+def extend_vocabulary(vocabulary: dict[str, list[str]], rows: pd.DataFrame) -> dict[str, list[str]]:
+    """Adds the values not seen yet at the end, so the existing codes don't change (incremental training)."""
+    extended = {}
+    for col, known in vocabulary.items():
+        new = _categories(rows[col]).difference(known, sort=False)
+        extended[col] = list(known) + sorted(new)
+    return extended
+
+
+def vocabulary_from_encoders(encoders: dict) -> dict[str, list[str]]:
+    """Models saved before the vocabulary have one LabelEncoder per column: its classes_ are the vocabulary."""
+    return {col: [str(value) for value in encoder.classes_] for col, encoder in encoders.items()}
+
+
+def saved_vocabulary(saved: dict) -> dict[str, list[str]]:
+    """The vocabulary of a saved model file (see models.save_model)."""
+    return saved["vocabulary"] if "vocabulary" in saved else vocabulary_from_encoders(saved["encoders"])
+
+
+def category_codes(values: pd.Series, categories: list[str]) -> np.ndarray:
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.cat.rename_categories(values.cat.categories.astype(str))   # Recodes the categories, not the rows
+    elif not pd.api.types.is_object_dtype(values) and not pd.api.types.is_string_dtype(values):
+        values = values.astype("string")
+    return pd.Categorical(values, categories=categories).codes.astype(np.int32)
+
+
+def encode(rows: pd.DataFrame, vocabulary: dict[str, list[str]], features: list[str] | None = None) -> pd.DataFrame:
+    """
+    The model input: codes for the categorical features, float64 for the others. Unknown or missing categories
+    get code -1, which LightGBM treats as missing.
+    """
+    features = features or FEATURE_COLS
+    rows = with_season(rows) if "season" in features else rows
+    missing = [col for col in features if col not in rows.columns]
+    if missing:
+        raise ValueError(f"Missing feature(s): {', '.join(missing)}")
+
+    encoded = {}
+    for col in features:
+        if col in vocabulary:
+            encoded[col] = category_codes(rows[col], vocabulary[col])
+        else:
+            encoded[col] = pd.to_numeric(rows[col], errors="coerce").to_numpy(dtype=np.float64)
+    return pd.DataFrame(encoded, index=rows.index)
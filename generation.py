@@ -0,0 +1,222 @@
+import copy
+import os
+import queue
+import threading
+import time
+
+# -------------------------------------------------------------------------------------
+# Local LLM generation scheduler
+# What it does: Questions asked at the same time are answered together: the scheduler waits a few milliseconds
+# for more questions, pads them into one batch and makes one model.generate call for all of them. The instruction
+# preamble every prompt starts with is encoded once, and its KV cache is copied into every batch, so only the
+# question part of each prompt is run through the model. Tokens are streamed back to each request as they are
+# generated, and each request reports how long it waited in the queue and its tokens per second.
+
+RAG_MAX_BATCH_SIZE = int(os.getenv("RAG_MAX_BATCH_SIZE", 4))            # Questions per generate call
+RAG_BATCH_WAIT_MS = float(os.getenv("RAG_BATCH_WAIT_MS", 20))           # How long the first question waits for others
+
+_DONE = object()
+
+
+class GenerationRequest:
+    """One prompt (without the shared prefix). Its text arrives in pieces, see stream()."""
+
+    def __init__(self, suffix: str, max_new_tokens: int):
+        self.suffix = suffix
+        self.max_new_tokens = max_new_tokens
+        self.submitted_at = time.perf_counter()
+        self.started_at = None
+        self.finished_at = None
+        self.new_tokens = 0
+        self.batch_size = 0
+        self.error = None
+        self._pieces = queue.Queue()
+
+    def stream(self):
+        """Yields the generated text piece by piece, until the answer is complete."""
+        while True:
+            piece = self._pieces.get()
+            if piece is _DONE:
+                break
+            yield piece
+        if self.error is not None:
+            raise self.error
+
+    def result(self) -> str:
+        return "".join(self.stream())
+
+    @property
+    def metrics(self) -> dict:
+        generation_seconds = (self.finished_at or time.perf_counter()) - (self.started_at or self.submitted_at)
+        return {
+            "queue_seconds": (self.started_at or time.perf_counter()) - self.submitted_at,
+            "generation_seconds": generation_seconds,
+            "new_tokens": self.new_tokens,
+            "tokens_per_second": self.new_tokens / generation_seconds if generation_seconds > 0 else None,
+            "batch_size": self.batch_size,
+        }
+
+    def _push(self, text: str):
+        if text:
+            self._pieces.put(text)
+
+    def _finish(self, error: Exception | None = None):
+        if self.finished_at is None:
+            self.error = error
+            self.finished_at = time.perf_counter()
+            self._pieces.put(_DONE)
+
+
+class BatchStreamer:
+    """
+    Receives the tokens of a batched generate call (the transformers streamer interface: put/end) and hands
+    each row's text to its request. A row is finished at its end-of-sequence token or its own max_new_tokens.
+    """
+
+    def __init__(self, tokenizer, requests: list[GenerationRequest]):
+        self.tokenizer = tokenizer
+        self.requests = requests
+        self.eos_ids = _eos_ids(tokenizer)
+        self._tokens = [[] for _ in requests]
+        self._sent = [""] * len(requests)
+        self._prompt_seen = False
+
+    def put(self, value):
+        if not self._prompt_seen:                                       # The first call is the prompt itself
+            self._prompt_seen = True
+            return
+        for row, token in enumerate(value.reshape(-1).tolist()):
+            request = self.requests[row]
+            if request.finished_at is not None:
+                continue
+            if token in self.eos_ids:
+                self._flush(row, final=True)
+                request._finish()
+                continue
+            self._tokens[row].append(token)
+            request.new_tokens += 1
+            self._flush(row, final=False)
+            if request.new_tokens >= request.max_new_tokens:
+                self._flush(row, final=True)
+                request._finish()
+
+    def end(self):
+        for row, request in enumerate(self.requests):
+            if request.finished_at is None:
+                self._flush(row, final=True)
+                request._finish()
+
+    def _flush(self, row: int, final: bool):
+        text = self.tokenizer.decode(self._tokens[row], skip_special_tokens=True)
+        if not final and text.endswith("�"):
+            return                                                      # Half of a multi-byte character, wait for the rest
+        self.requests[row]._push(text[len(self._sent[row]):])
+        self._sent[row] = text
+
+
+def _eos_ids(tokenizer) -> set[int]:
+    eos = tokenizer.eos_token_id
+    return set(eos) if isinstance(eos, (list, tuple)) else {eos}
+
+
+class GenerationScheduler:
+    """
+    Micro-batches the requests submitted from any thread into generate calls, on one worker thread.
+    get_llm returns (tokenizer, model) and is called on the worker, so the model is loaded on first use.
+    """
+
+    def __init__(self, get_llm, prefix: str = "", device: str = "cpu",
+                 max_batch_size: int = RAG_MAX_BATCH_SIZE, max_wait_ms: float = RAG_BATCH_WAIT_MS,
+                 sampling: dict | None = None):
+        self.get_llm = get_llm
+        self.prefix = prefix
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.sampling = sampling or {"do_sample": True, "temperature": 0.7, "top_p": 0.9}
+        self._queue = queue.Queue()
+        self._prefix_ids = None
+        self._prefix_cache = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, suffix: str, max_new_tokens: int = 300) -> GenerationRequest:
+        request = GenerationRequest(suffix, max_new_tokens)
+        self._start()
+        self._queue.put(request)
+        return request
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="llm-generation", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]                                 # STEP 1: Wait for a question
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:                     # STEP 2: Collect the ones asked meanwhile
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                self._generate(batch)                                   # STEP 3: One generate call for the batch
+            except Exception as e:
+                print(f"Generation failed: {e}")
+                for request in batch:
+                    request._finish(e)
+
+    def _prefix_state(self, tokenizer, model):
+        """Token ids and KV cache of the shared prefix, computed once."""
+        if self._prefix_ids is None:
+            import torch
+            from transformers import DynamicCache
+
+            ids = tokenizer(self.prefix, return_tensors="pt").to(self.device)
+            with torch.no_grad():
+                output = model(**ids, past_key_values=DynamicCache(), use_cache=True)
+            self._prefix_ids = ids["input_ids"][0].tolist()
+            self._prefix_cache = output.past_key_values
+        return self._prefix_ids, self._prefix_cache
+
+    def _generate(self, batch: list[GenerationRequest]):
+        import torch
+
+        tokenizer, model = self.get_llm()
+        pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        prefix_ids, prefix_cache = self._prefix_state(tokenizer, model) if self.prefix else ([], None)
+
+        # Prompt = prefix, padding, question: the padding goes between them so every row starts with the cached
+        # prefix. The attention mask hides the padding (and the position ids are taken from the mask)
+        suffixes = [tokenizer(request.suffix, add_special_tokens=not prefix_ids)["input_ids"] for request in batch]
+        width = max(len(ids) for ids in suffixes)
+        input_ids = [prefix_ids + [pad_id] * (width - len(ids)) + ids for ids in suffixes]
+        attention_mask = [[1] * len(prefix_ids) + [0] * (width - len(ids)) + [1] * len(ids) for ids in suffixes]
+
+        options = {}
+        if prefix_cache is not None:
+            cache = copy.deepcopy(prefix_cache)                         # generate extends the cache in place
+            cache.batch_repeat_interleave(len(batch))
+            options["past_key_values"] = cache
+
+        now = time.perf_counter()
+        for request in batch:
+            request.started_at = now
+            request.batch_size = len(batch)
+        streamer = BatchStreamer(tokenizer, batch)
+        with torch.no_grad():
+            model.generate(
+                input_ids=torch.tensor(input_ids, device=self.device),
+                attention_mask=torch.tensor(attention_mask, device=self.device),
+                max_new_tokens=max(request.max_new_tokens for request in batch),
+                pad_token_id=pad_id,
+                streamer=streamer,
+                **self.sampling,
+                **options,
+            )
+        streamer.end()
@@ -1,36 +1,103 @@
 import asyncio
 import base64
+import functools
+import json
 import os
 from io import BytesIO
 
 import grpc
+import httpx
 from concurrent import futures
 from datetime import datetime
 import pandas as pd
 from protos import service_pb2
 from protos import service_pb2_grpc
-import time
-from insights import annual_stats
-from kenjaAI import get_esg_report
+from insights import annual_stats, annual_stats_table, period_stats
+from benchmarks import benchmark_store, compare_facilities, summarize
+from slopes import trend_cache, select_trends, TREND_STABLE_PERCENT
+from kenjaAI import get_cached_esg_report, stream_cached_esg_report, generate_esg_reports, kenja_client, CircuitOpenError, REPORT_BATCH_CONCURRENCY
+from dataset import store
+from jobs import job_queue, report_job_key, DONE
+from model_registry import model_registry, ModelNotFoundError
+from training import submit_training, submit_tuning, shutdown_pool
+
+# The servicer runs on one event loop (grpc.aio): waiting on Kenja AI costs no thread, so many reports can be
+# in flight at once. The pandas/parsing work is CPU-bound and would block the loop, so it runs on a few threads.
+GRPC_WORKERS = int(os.getenv("GRPC_WORKERS", 4))
+executor = futures.ThreadPoolExecutor(max_workers=GRPC_WORKERS, thread_name_prefix="grpc-pandas")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Runs func in the bounded executor, without blocking the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+
+def stats_message(stats_dict: dict) -> service_pb2.StatsData:
+    return service_pb2.StatsData(
+        facility_name=stats_dict["facility_name"],
+        total_annual_emissions=stats_dict["total_annual_emissions"],
+        mean_annual_emissions=stats_dict["mean_annual_emissions"],
+        mean_capture_efficiency=stats_dict["mean_capture_efficiency"],
+        mean_storage_integrity=stats_dict["mean_storage_integrity"],
+        minimum_capture_efficiency=stats_dict["minimum_capture_efficiency"],
+        minimum_storage_integrity=stats_dict["minimum_storage_integrity"],
+        total_captured_tonnes = stats_dict["total_captured_tonnes"],
+        total_stored_tonnes = stats_dict["total_stored_tonnes"],
+        date_time = stats_dict["date_time"],
+    )
+
+
+def job_message(job: dict, deduplicated: bool = False) -> service_pb2.JobStatus:
+    return service_pb2.JobStatus(
+        job_id=job["id"],
+        status=job["status"],
+        error=job["error"] or "",
+        deduplicated=deduplicated,
+        created_at=job["created_at"],
+        updated_at=job["updated_at"],
+    )
+
+
+def reading_row(reading: service_pb2.Reading) -> dict:
+    # Unset optional metrics are missing values, not 0.0
+    return {
+        field.name: getattr(reading, field.name) if not field.has_presence or reading.HasField(field.name) else None
+        for field in reading.DESCRIPTOR.fields
+    }
 
 
 class EsgReportService(service_pb2_grpc.EsgReportServiceServicer):
 
-    def UploadCSV(self, request, context):
+    async def UploadCSV(self, request, context):
         print("Upload request is running")
-        global csv_path, data
-        timestamp = datetime.now().astimezone().strftime("%Y%m%d%H%M%S")
-        csv_path = f"./csv_dataset" + ".csv"
+        async def chunks():
+            yield request.file_content
+        return await self._upload(chunks(), context)
+
 
-        with open(csv_path, "wb") as f:
-            f.write(request.file_content)
+    async def UploadCSVStream(self, request_iterator, context):
+        print("Streamed upload request is running")
+        async def chunks():
+            async for chunk in request_iterator:
+                yield chunk.data
+        return await self._upload(chunks(), context)
 
+
+    async def _upload(self, chunks, context):
         try:
-            data = pd.read_csv(csv_path)
+            with store.begin_upload() as upload:      # Each chunk is parsed as it arrives
+                async for chunk in chunks:
+                    await run_blocking(upload.write, chunk)
+                snapshot = await run_blocking(upload.commit)
             return service_pb2.UploadCSVResponse(
                 status="success",
-                message=f"CSV uploaded and saved to {csv_path}"
+                message=f"CSV uploaded and saved to {store.path} ({snapshot.row_count} rows, version {snapshot.version})"
             )
+        except ValueError as e:
+            print("Error:", e)
+            context.set_details(str(e))
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            return service_pb2.UploadCSVResponse(status="failed", message=str(e))
         except Exception as e:
             print("Error:", e)
             context.set_details(str(e))
@@ -38,12 +105,34 @@ class EsgReportService(service_pb2_grpc.EsgReportServiceServicer):
             return service_pb2.UploadCSVResponse(status="failed", message="error")
 
 
-    def GenerateEsgReport(self, request, context):
+    async def AppendRows(self, request, context):
+        print("Append request is running")
+        if not request.rows:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details("No rows to append.")
+            return service_pb2.AppendRowsResponse(status="failed", message="No rows to append.")
+
+        rows = pd.DataFrame([reading_row(row) for row in request.rows])
+        try:
+            snapshot = await run_blocking(store.append, rows)
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return service_pb2.AppendRowsResponse(status="failed", message=str(e))
+
+        return service_pb2.AppendRowsResponse(
+            status="success",
+            message=f"{len(request.rows)} rows appended to {store.path}",
+            version=snapshot.version,
+            rows=snapshot.row_count,
+        )
+
+
+    async def GenerateEsgReport(self, request, context):
         print("Generating EsgReport request in gRPC")
-        global data, file_path
-        csv_path = fr".\csv_dataset.csv"
+        snapshot = await run_blocking(store.get)
 
-        if not os.path.exists(csv_path):
+        if snapshot is None:
             context.set_code(grpc.StatusCode.NOT_FOUND)
             context.set_details("CSV not found on server. Please check the file name.")
             return service_pb2.GenerateEsgReportResponse(
@@ -59,9 +148,7 @@ class EsgReportService(service_pb2_grpc.EsgReportServiceServicer):
             )
         )
 
-        data = pd.read_csv(csv_path)
-
-        if data.empty:
+        if snapshot.empty:
             context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
             context.set_details("No csv loaded. Use /set_csv/ before anything.")
             return service_pb2.GenerateEsgReportResponse(
@@ -80,21 +167,24 @@ class EsgReportService(service_pb2_grpc.EsgReportServiceServicer):
                 )
             )
 
-        stats_dict = annual_stats(data, request.facility_name)
-        esg_report = asyncio.run(get_esg_report(stats_dict))
-
-        stats = service_pb2.StatsData(
-            facility_name=stats_dict["facility_name"],
-            total_annual_emissions=stats_dict["total_annual_emissions"],
-            mean_annual_emissions=stats_dict["mean_annual_emissions"],
-            mean_capture_efficiency=stats_dict["mean_capture_efficiency"],
-            mean_storage_integrity=stats_dict["mean_storage_integrity"],
-            minimum_capture_efficiency=stats_dict["minimum_capture_efficiency"],
-            minimum_storage_integrity=stats_dict["minimum_storage_integrity"],
-            total_captured_tonnes = stats_dict["total_captured_tonnes"],
-            total_stored_tonnes = stats_dict["total_stored_tonnes"],
-            date_time = stats_dict["date_time"],
-        )
+        try:
+            stats_dict = await run_blocking(annual_stats, snapshot, request.facility_name)
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return service_pb2.GenerateEsgReportResponse()
+        try:
+            esg_report = await get_cached_esg_report(stats_dict, snapshot.version)
+        except CircuitOpenError as e:
+            context.set_code(grpc.StatusCode.UNAVAILABLE)
+            context.set_details(str(e))
+            return service_pb2.GenerateEsgReportResponse(esg_report="", stats_data=stats_message(stats_dict))
+        except httpx.HTTPError as e:
+            context.set_code(grpc.StatusCode.UNAVAILABLE)
+            context.set_details(f"Kenja AI request failed: {str(e)}")
+            return service_pb2.GenerateEsgReportResponse(esg_report="", stats_data=stats_message(stats_dict))
+
+        stats = stats_message(stats_dict)
 
         return service_pb2.GenerateEsgReportResponse(
             esg_report=esg_report,
@@ -102,19 +192,281 @@ class EsgReportService(service_pb2_grpc.EsgReportServiceServicer):
         )
 
 
+    async def GenerateEsgReportStream(self, request, context):
+        print("Streaming EsgReport request in gRPC")
+        snapshot = await run_blocking(store.get)
+
+        if snapshot is None or snapshot.empty:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details("CSV not found on server. Please upload a csv first.")
+            return
+
+        try:
+            stats_dict = await run_blocking(annual_stats, snapshot, request.facility_name)
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return
+        yield service_pb2.EsgReportChunk(stats_data=stats_message(stats_dict))     # Sent before the report is generated
+
+        try:
+            async for text in stream_cached_esg_report(stats_dict, snapshot.version):
+                yield service_pb2.EsgReportChunk(text=text)
+        except (CircuitOpenError, httpx.HTTPError) as e:
+            context.set_code(grpc.StatusCode.UNAVAILABLE)
+            context.set_details(f"Kenja AI request failed: {str(e)}")
+
+
+    async def GenerateEsgReportBatch(self, request, context):
+        print("EsgReport batch request in gRPC")
+        snapshot = await run_blocking(store.get)
+
+        if snapshot is None or snapshot.empty:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details("CSV not found on server. Please upload a csv first.")
+            return
+
+        try:                                          # Stats of every facility in one pass, then the reports concurrently
+            payloads = await run_blocking(
+                period_stats, snapshot, list(request.facility_names), request.start_date or None, request.end_date or None
+            )
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return
+
+        max_concurrency = request.max_concurrency or REPORT_BATCH_CONCURRENCY
+        async for stats_dict, esg_report, error in generate_esg_reports(payloads, snapshot.version, max_concurrency):
+            yield service_pb2.EsgReportBatchItem(
+                facility_name=stats_dict["facility_name"],
+                esg_report=esg_report or "",
+                stats_data=stats_message(stats_dict),
+                error=error or "",
+            )
+
+
+    async def SubmitEsgReportJob(self, request, context):
+        print("EsgReport job submitted in gRPC")
+        snapshot = await run_blocking(store.get)
+
+        if snapshot is None or snapshot.empty:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details("CSV not found on server. Please upload a csv first.")
+            return service_pb2.JobStatus()
+
+        start_date, end_date = request.start_date or None, request.end_date or None
+        try:
+            found = await run_blocking(period_stats, snapshot, [request.facility_name], start_date, end_date)
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return service_pb2.JobStatus()
+        if not found or found[0]["rows"] == 0:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details(f"No data available for facility '{request.facility_name}'.")
+            return service_pb2.JobStatus()
+        stats_dict = found[0]
+
+        key = report_job_key(request.facility_name, start_date, end_date, snapshot.version)
+        job, deduplicated = await run_blocking(job_queue.submit, key, {"stats_data": stats_dict, "version": snapshot.version})
+        return job_message(job, deduplicated)
+
+
+    async def GetJob(self, request, context):
+        job = await run_blocking(job_queue.get, request.job_id)
+        if job is None:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details("Job not found.")
+            return service_pb2.JobStatus()
+        return job_message(job)
+
+
+    async def GetJobResult(self, request, context):
+        job = await run_blocking(job_queue.get, request.job_id)
+        if job is None:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details("Job not found.")
+            return service_pb2.JobResult()
+        if job["status"] != DONE:                    # Still running, or failed: the status says which
+            return service_pb2.JobResult(job=job_message(job))
+        if "esg_report" not in job["result"]:        # Training/tuning job
+            return service_pb2.JobResult(job=job_message(job), result_json=json.dumps(job["result"], default=str))
+        return service_pb2.JobResult(
+            job=job_message(job),
+            esg_report=job["result"]["esg_report"],
+            stats_data=stats_message(job["result"]["stats_data"]),
+        )
+
+
+    async def TrainLgbmBatch(self, request, context):
+        print("Training batch request in gRPC")
+        snapshot = await run_blocking(store.get)
+
+        if snapshot is None or snapshot.empty:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details("CSV not found on server. Please upload a csv first.")
+            return service_pb2.TrainBatchResponse()
+
+        facility_names = list(request.facility_names) or snapshot.facility_names
+        missing = [name for name in facility_names if name not in snapshot.index]
+        if missing:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(f"Facility '{missing[0]}' not found in the dataset.")
+            return service_pb2.TrainBatchResponse()
+
+        submitted = await run_blocking(
+            submit_training, facility_names, snapshot.version, request.lr or 0.05, request.depth or 5, request.incremental
+        )
+        return service_pb2.TrainBatchResponse(jobs=[
+            service_pb2.TrainJob(facility_name=name, job=job_message(job, deduplicated))
+            for name, (job, deduplicated) in zip(facility_names, submitted)
+        ])
+
+
+    async def TuneLgbm(self, request, context):
+        print("Tuning request in gRPC")
+        snapshot = await run_blocking(store.get)
+
+        if snapshot is None or request.facility_name not in snapshot.index:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details(f"Facility '{request.facility_name}' not found in the dataset.")
+            return service_pb2.JobStatus()
+        if request.n_splits == 1 or request.n_splits < 0:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details("n_splits must be at least 2.")
+            return service_pb2.JobStatus()
+
+        job, deduplicated = await run_blocking(
+            submit_tuning, request.facility_name, snapshot.version, list(request.lrs), list(request.depths), request.n_splits or 5
+        )
+        return job_message(job, deduplicated)
+
+
+    async def PredictBatch(self, request, context):
+        try:
+            model = await run_blocking(model_registry.get, request.facility_name)
+        except ModelNotFoundError as e:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details(str(e))
+            return service_pb2.PredictBatchResponse()
+
+        rows = pd.DataFrame(
+            {
+                "co2_emitted_tonnes": [row.co2_emitted_tonnes for row in request.rows],
+                "region": [row.region for row in request.rows],
+                "storage_site_type": [row.storage_site_type for row in request.rows],
+                "season": [row.season or None for row in request.rows],
+                "date": [row.date or None for row in request.rows],
+            }
+        )
+        try:
+            predictions = await run_blocking(model.predict, rows)
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return service_pb2.PredictBatchResponse()
+        return service_pb2.PredictBatchResponse(model_version=model.version, predictions=predictions.tolist())
+
 
-def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    async def GetAnnualStatsBatch(self, request, context):
+        print("Annual stats batch request in gRPC")
+        snapshot = await run_blocking(store.get)
+
+        if snapshot is None or snapshot.empty:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details("CSV not found on server. Please upload a csv first.")
+            return service_pb2.AnnualStatsBatchResponse()
+
+        try:
+            table = await run_blocking(annual_stats_table, snapshot, list(request.facility_names))
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return service_pb2.AnnualStatsBatchResponse()
+
+        date_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows = [
+            service_pb2.AnnualStatsRow(year=0 if pd.isna(row["year"]) else int(row["year"]),     # 0: no non-anomalous rows
+                                       stats_data=stats_message({**row, "date_time": date_time}))
+            for row in table.to_dict(orient="records")
+        ]
+        return service_pb2.AnnualStatsBatchResponse(rows=rows)
+
+    async def GetBenchmarkComparison(self, request, context):
+        print("Benchmark comparison request in gRPC")
+        snapshot = await run_blocking(store.get)
+
+        if snapshot is None or snapshot.empty:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details("CSV not found on server. Please upload a csv first.")
+            return service_pb2.BenchmarkResponse()
+
+        variables = list(request.variables) or None
+        try:
+            bench = await run_blocking(benchmark_store.get)
+            compared = await run_blocking(compare_facilities, snapshot, bench, list(request.facility_names), variables)
+        except FileNotFoundError:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details("Benchmark file not found on server.")
+            return service_pb2.BenchmarkResponse()
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return service_pb2.BenchmarkResponse()
+
+        facilities = [
+            service_pb2.FacilityBenchmark(
+                facility_name=item["facility_name"],
+                rows=item["rows"],
+                benchmarked_rows=item["benchmarked_rows"],
+                metrics=[service_pb2.MetricDeviation(**{k: v for k, v in metric.items() if v is not None}) for metric in item["metrics"]],
+            )
+            for item in await run_blocking(summarize, compared, variables or bench.metrics)
+        ]
+        return service_pb2.BenchmarkResponse(benchmark_version=bench.version, facilities=facilities)
+
+    async def GetTrendsBatch(self, request, context):
+        print("Trends batch request in gRPC")
+        snapshot = await run_blocking(store.get)
+
+        if snapshot is None or snapshot.empty:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details("CSV not found on server. Please upload a csv first.")
+            return service_pb2.TrendsBatchResponse()
+
+        stable_percent = request.stable_percent if request.HasField("stable_percent") else TREND_STABLE_PERCENT
+        try:
+            table = await run_blocking(trend_cache.get, snapshot, list(request.windows), stable_percent)
+            table = select_trends(table, list(request.facility_names), list(request.variables))
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return service_pb2.TrendsBatchResponse()
+
+        rows = [
+            service_pb2.TrendRow(**{key: value for key, value in row.items() if not pd.isna(value)})
+            for row in table.to_dict(orient="records")
+        ]
+        return service_pb2.TrendsBatchResponse(dataset_version=snapshot.version, rows=rows)
+
+
+async def serve():
+    server = grpc.aio.server()
     service_pb2_grpc.add_EsgReportServiceServicer_to_server(EsgReportService(), server)
     server.add_insecure_port('[::]:50051')
     print("Starting server on port 50051...")
-    server.start()
+    await server.start()
     try:
-        while True:
-            time.sleep(86400)
-    except KeyboardInterrupt:
+        await server.wait_for_termination()
+    finally:
         print("Stopping server...")
-        server.stop(0)
+        await server.stop(5)
+        await kenja_client.aclose()
+        executor.shutdown(wait=False)
+        shutdown_pool()
 
 if __name__ == '__main__':
-    serve()
\ No newline at end of file
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,197 @@
+import io
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# -------------------------------------------------------------------------------------
+# Canonical schema of the source data
+# What it does: Every uploaded csv is converted ONCE into these types, so the insights functions
+# never have to parse dates or guess the type of a column again.
+
+DATE_FORMAT = "%d/%m/%Y"                     # The format of the "date" column in the uploaded csv
+
+CATEGORICAL_COLUMNS = ["facility_id", "facility_name", "country", "region", "storage_site_type"]
+
+METRIC_COLUMNS = [
+    "co2_emitted_tonnes",
+    "co2_captured_tonnes",
+    "co2_stored_tonnes",
+    "capture_efficiency_percent",
+    "storage_integrity_percent",
+]
+
+REQUIRED_COLUMNS = ["date", "facility_name"]
+
+SEASONS = ["Winter", "Spring", "Summer", "Autumn"]
+
+# Month → season, as a lookup array. Index 0 is for missing/invalid dates
+SEASON_BY_MONTH = np.array([-1, 0, 0, 1, 1, 2, 2, 2, 2, 2, 3, 3, 0], dtype=np.int8)
+
+TRUE_STRINGS = {"true", "1", "yes", "y", "t"}
+
+
+def parse_dates(values) -> pd.Series:
+    return pd.to_datetime(values, format=DATE_FORMAT, dayfirst=True, errors="coerce")
+
+
+def to_bool(values: pd.Series) -> pd.Series:
+    if pd.api.types.is_bool_dtype(values):
+        return values.astype(bool)
+    # Csv exports write TRUE/FALSE, True/False or 1/0, and empty cells mean "no anomaly"
+    return values.astype("string").str.strip().str.lower().isin(TRUE_STRINGS).astype(bool)
+
+
+def add_calendar_columns(data: pd.DataFrame) -> pd.DataFrame:
+    """Adds year/month/season derived from an already parsed "date" column."""
+    month = data["date"].dt.month
+    data["year"] = data["date"].dt.year.astype("Int16")
+    data["month"] = month.astype("Int8")
+    codes = SEASON_BY_MONTH[month.fillna(0).to_numpy(dtype=np.int8)]
+    data["season"] = pd.Categorical.from_codes(codes, categories=SEASONS)
+    return data
+
+
+def to_canonical(raw: pd.DataFrame) -> pd.DataFrame:
+    missing = [col for col in REQUIRED_COLUMNS if col not in raw.columns]
+    if missing:
+        raise ValueError(f"The csv is missing the required column(s): {', '.join(missing)}")
+
+    unnamed = int(raw["facility_name"].isna().sum())
+    if unnamed:                                  # They could never be queried, the data is indexed by facility
+        raise ValueError(f"{unnamed} row(s) have no facility_name.")
+
+    data = raw.copy()
+
+    # STEP 1: Dates are parsed once, here
+    if not pd.api.types.is_datetime64_any_dtype(data["date"]):
+        data["date"] = parse_dates(data["date"])
+
+    # STEP 2: Repeated text columns become categoricals
+    for col in CATEGORICAL_COLUMNS:
+        if col in data.columns:
+            data[col] = data[col].astype("category")
+
+    # STEP 3: A real boolean anomaly flag. Files without the column have no anomalies
+    if "anomaly_flag" in data.columns:
+        data["anomaly_flag"] = to_bool(data["anomaly_flag"])
+    else:
+        data["anomaly_flag"] = False
+
+    # STEP 4: Metrics as float32, missing metric columns become empty columns
+    for col in METRIC_COLUMNS:
+        if col in data.columns:
+            data[col] = pd.to_numeric(data[col], errors="coerce").astype(np.float32)
+        else:
+            data[col] = np.float32(np.nan)
+
+    # STEP 5: Precomputed calendar columns
+    return add_calendar_columns(data)
+
+
+def read_csv(source, **kwargs) -> pd.DataFrame:
+    """Reads a csv (path or file object) straight into the canonical schema."""
+    dtypes = {col: "category" for col in CATEGORICAL_COLUMNS}
+    dtypes["date"] = str
+    dtypes["anomaly_flag"] = str
+    return to_canonical(pd.read_csv(source, dtype=dtypes, **kwargs))
+
+
+def concat(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenates canonical frames, keeping the categorical columns categorical."""
+    frames = [frame for frame in frames if not frame.empty] or frames[:1]
+    if len(frames) == 1:
+        return frames[0]
+    data = pd.concat(frames, ignore_index=True)
+    for col in CATEGORICAL_COLUMNS:
+        if col in data.columns and not isinstance(data[col].dtype, pd.CategoricalDtype):
+            data[col] = union_categoricals([frame[col] for frame in frames], ignore_order=True)
+    return data
+
+
+# -------------------------------------------------------------------------------------
+# Incremental csv parsing
+# What it does: Takes the raw bytes of an upload in chunks of any size. As soon as enough complete lines have
+# arrived, they are parsed into the canonical schema, so only one batch of raw text is held in memory at a time,
+# and a bad header is rejected with the first chunk instead of after the whole upload.
+# Each chunk is scanned once, carrying the quote state over from the previous one, to know where the last
+# complete line ends (notes may contain newlines inside quotes). A single row that never ends (e.g. an
+# unbalanced quote) is rejected once it passes max_row_bytes, instead of buffering the rest of the upload.
+
+QUOTE, NEWLINE = ord('"'), ord("\n")
+
+
+class CsvStreamParser:
+
+    def __init__(self, batch_bytes: int = 8 << 20, max_row_bytes: int = 16 << 20):
+        self.batch_bytes = batch_bytes
+        self.max_row_bytes = max_row_bytes
+        self.header: bytes | None = None
+        self.frames: list[pd.DataFrame] = []
+        self.rows = 0
+        self._pending = bytearray()
+        self._cut = 0                                  # End of the last complete line in _pending (0: none yet)
+        self._quoted = False                           # Whether the end of _pending is inside a quoted field
+
+    def feed(self, chunk: bytes):
+        start = len(self._pending)
+        self._pending += chunk
+        if self.header is None:
+            end = self._pending.find(b"\n")
+            if end < 0:
+                self._check_size()
+                return
+            self.header = bytes(self._pending[:end + 1])
+            del self._pending[:end + 1]
+            self._check_header()
+            start = 0
+        self._scan(start)
+        if len(self._pending) >= self.batch_bytes and self._cut > 0:
+            self._parse(bytes(self._pending[:self._cut]))
+            del self._pending[:self._cut]
+            self._cut = 0                              # The quote state at the end is unchanged: the cut was outside quotes
+        self._check_size()
+
+    def finish(self) -> pd.DataFrame:
+        if self.header is None:
+            if not self._pending.strip():
+                raise ValueError("The csv is empty.")
+            self.header = bytes(self._pending) + b"\n"
+            self._pending.clear()
+            self._check_header()
+        if self._pending.strip() or not self.frames:
+            self._parse(bytes(self._pending))
+            self._pending.clear()
+        return concat(self.frames)
+
+    def _check_header(self):
+        columns = pd.read_csv(io.BytesIO(self.header), nrows=0).columns
+        missing = [col for col in REQUIRED_COLUMNS if col not in columns]
+        if missing:
+            raise ValueError(f"The csv is missing the required column(s): {', '.join(missing)}")
+
+    def _scan(self, start: int):
+        """Forward pass over the bytes added since start: remembers the end of the last line outside quotes."""
+        new = np.frombuffer(bytes(self._pending[start:]), dtype=np.uint8)
+        if len(new) == 0:
+            return
+        inside = np.logical_xor.accumulate(new == QUOTE) ^ self._quoted    # Quote state after each byte
+        ends = np.flatnonzero((new == NEWLINE) & ~inside)
+        if len(ends):
+            self._cut = start + int(ends[-1]) + 1
+        self._quoted = bool(inside[-1])
+
+    def _check_size(self):
+        if len(self._pending) - self._cut > self.max_row_bytes:
+            raise ValueError(
+                f"Could not parse the csv near row {self.rows + 1}: a row is longer than {self.max_row_bytes >> 20} MiB "
+                "(is a quote left open?)"
+            )
+
+    def _parse(self, body: bytes):
+        try:
+            frame = read_csv(io.BytesIO(self.header + body))
+        except (pd.errors.ParserError, UnicodeDecodeError) as e:
+            raise ValueError(f"Could not parse the csv near row {self.rows + 1}: {e}") from e
+        self.rows += len(frame)
+        self.frames.append(frame)
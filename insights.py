@@ -6,16 +6,28 @@ from typing import Literal        # used in type hints to restrict a variable or
 import numpy as np                # Tool for working with numbers
 from datetime import datetime
 
+from ingest import parse_dates, add_calendar_columns, METRIC_COLUMNS
+from dataset import as_snapshot
+from benchmarks import BenchmarkTable, BENCH_KEYS, benchmark_store, compare_facilities, summarize
+
+# All functions below expect the canonical dataset produced by ingest.py (parsed dates, boolean
+# anomaly_flag, precomputed year/month/season), which is what the dataset store hands out.
+# They take the store's snapshot, where each facility is a date-sorted slice of the table, so
+# filtering on a facility and a date range is a binary search instead of a scan over every row.
+# A plain DataFrame also works, it is sorted and indexed first.
+
+
 # -------------------------------------------------------------------------------------
 # FUNCTION 1: Get/list facility names
 # What it does: Returns a list of unique facility names available in the dataset. Useful to know which facilities can be queried.
 
 def facility_names(data):
     #global data, names
+    data = as_snapshot(data)
     if data.empty:                                        # STEP 1: If dataset is empty → return warning
         return "Set a csv source data first"
     else:
-        names = list(set(data["facility_name"]))          # STEP 2: Collect unique names from the "facility_name" column
+        names = data.facility_names                       # STEP 2: Collect unique names from the facility index
         return names                                      # STEP 3: Output = list of facility names
 
 # -------------------------------------------------------------------------------------
@@ -23,17 +35,19 @@ def facility_names(data):
 # What it does: Detects short-term trend of a chosen variable (e.g. emissions or efficiency). Uses the last 5 records of that facility.
 
 def trends(facility_name: str, data, variable: str):
-    filtered = data[data["facility_name"] == facility_name].dropna(subset=[variable])     # STEP 1: Filter dataset for the requested facility + variable (column)
+    data = as_snapshot(data)
+    if variable in METRIC_COLUMNS:
+        last_5 = data.aggregates.window(facility_name, variable)    # STEP 1+2: Last 5 raw values of the variable, kept up to date on ingest/append
+    else:
+        last_5 = data.rows(facility_name, columns=[variable])[variable].dropna().tail(5).to_numpy()   # Other columns: slice the facility (sorted by date)
 
-    if filtered.empty:
+    if len(last_5) == 0:
         return "No data to get trends."
 
-    last_5 = filtered[variable].tail(5)                          # STEP 2: Take last 5 raw values of the chosen variable
-
     # Compare first and last
-    if last_5.iloc[-1] > last_5.iloc[0]:                         # STEP 3: Compare first vs last value → Rising / Falling / Stable
+    if last_5[-1] > last_5[0]:                                   # STEP 3: Compare first vs last value → Rising / Falling / Stable
         return f"{variable} Rising"
-    elif last_5.iloc[-1] < last_5.iloc[0]:
+    elif last_5[-1] < last_5[0]:
         return f"{variable} Falling!"
     else:
         return f"{variable} Stable"
@@ -51,9 +65,9 @@ def get_percent_changes(facility_name: str, data, variable: str):
         raise ValueError(f"Invalid facility name. Please check the facility name")
     """
 
-    filtered = data[data["facility_name"] == facility_name].dropna(subset=[variable]).copy()     # STEP 1: Filter rows for facility + drop missing values
+    filtered = as_snapshot(data).rows(facility_name, columns=["date", variable]).dropna(subset=[variable])   # STEP 1: Slice rows for facility + drop missing values
 
-    filtered["percent_changes"] = filtered[variable].pct_change()*100                            # STEP 2: Calculate percent change from one record to the next
+    filtered["percent_changes"] = filtered[variable].astype(np.float64).pct_change()*100        # STEP 2: Calculate percent change from one record to the next (float64: float32 is not valid json)
     filtered["percent_changes"] = filtered["percent_changes"].fillna(0)                          # STEP 3: Replace missing changes (first row) with 0
     changes = filtered[["date", "percent_changes"]]                                              # STEP 4: Output = table of dates + percent changes
 
@@ -64,44 +78,105 @@ def get_percent_changes(facility_name: str, data, variable: str):
 # What it does: Summarizes annual performance metrics for a facility. Returns totals, means, and minimums for the last year.
 
 def annual_stats(data: pd.DataFrame, facility_name: str, fallback: bool = True) -> dict:
-    
+    data = as_snapshot(data)
+
     if data.empty:                                                                              # STEP 1: Validate dataset and facility
         raise ValueError("The dataset is empty. Please set the CSV data first.")
     
-    if facility_name not in data["facility_name"].unique():
+    if facility_name not in data.index:
         raise ValueError(f"Facility '{facility_name}' not found in the dataset.")
     
     # We will not include outliers, therefore dont need anomalies
-    data = data[(data["facility_name"] == facility_name) & (data["anomaly_flag"] == False)].copy()    # STEP 2: Keep only rows for this facility, excluding anomalies
-    
-    # Pandas really needs its own datetime dataframe
-    data["date"] = pd.to_datetime(data["date"], format="%d/%m/%Y", dayfirst=True, errors="coerce")    # STEP 3: Ensure date column is in proper format + extract year
-    data["year"] = data["date"].dt.year
+    years = data.aggregates.years(facility_name)                                                # STEP 2: Years with non-anomalous rows, from the running aggregates
 
-    current_year = data["year"].max()     # STEP 4: Check the latest year, this will not work without datetime format. Pick last full year (target), or fallback to current year
+    current_year = max(years) if years else np.nan     # STEP 3: Check the latest year. Pick last full year (target), or fallback to current year
     target_year = current_year - 1    #Add the last year as target 
 
-    filtered = data[data["year"] == target_year]
+    filtered = data.aggregates.year_summary(facility_name, target_year)                         # Sums/counts/mins per facility+year, no pass over the rows
 
     # back to current year if previous year has no data
     if fallback and filtered.empty:
-        filtered = data[data["year"] == current_year]
+        filtered = data.aggregates.year_summary(facility_name, current_year)
     timeNow = datetime.now()
     formattedTime = timeNow.strftime("%Y-%m-%d %H:%M:%S")
-    stats = {                                             # STEP 5: Calculate ESG metrics
+    stats = {                                             # STEP 4: Calculate ESG metrics
         "facility_name": facility_name,
-        "total_annual_emissions": filtered['co2_emitted_tonnes'].sum(),
-        "mean_annual_emissions": filtered['co2_emitted_tonnes'].mean(),
-        "mean_capture_efficiency": filtered['capture_efficiency_percent'].mean(),
-        "mean_storage_integrity": filtered['storage_integrity_percent'].mean(),
-        "minimum_capture_efficiency": filtered['capture_efficiency_percent'].min(),
-        "minimum_storage_integrity": filtered['storage_integrity_percent'].min(),
-        "total_captured_tonnes": filtered['co2_captured_tonnes'].sum(),
-        "total_stored_tonnes": filtered['co2_stored_tonnes'].sum(),
+        "total_annual_emissions": filtered.total('co2_emitted_tonnes'),
+        "mean_annual_emissions": filtered.mean('co2_emitted_tonnes'),
+        "mean_capture_efficiency": filtered.mean('capture_efficiency_percent'),
+        "mean_storage_integrity": filtered.mean('storage_integrity_percent'),
+        "minimum_capture_efficiency": filtered.minimum('capture_efficiency_percent'),
+        "minimum_storage_integrity": filtered.minimum('storage_integrity_percent'),
+        "total_captured_tonnes": filtered.total('co2_captured_tonnes'),
+        "total_stored_tonnes": filtered.total('co2_stored_tonnes'),
         "date_time": formattedTime,
     }
 
-    return stats                                          # STEP 6: Output = ESG summary dictionary
+    return stats                                          # STEP 5: Output = ESG summary dictionary
+
+# -------------------------------------------------------------------------------------
+# FUNCTION 4b: Annual Statistics for many facilities at once
+# What it does: Same metrics as annual_stats, for every facility (or a list of them), from ONE groupby pass
+# over the data instead of one filter per facility. That groupby (facility, year → sum/count/min) is done at
+# ingest and kept up to date on append, see aggregates.py. Returns a compact table, one row per facility.
+
+ANNUAL_AGGREGATES = {
+    "total_annual_emissions": ("co2_emitted_tonnes", "sum"),
+    "mean_annual_emissions": ("co2_emitted_tonnes", "mean"),
+    "mean_capture_efficiency": ("capture_efficiency_percent", "mean"),
+    "mean_storage_integrity": ("storage_integrity_percent", "mean"),
+    "minimum_capture_efficiency": ("capture_efficiency_percent", "min"),
+    "minimum_storage_integrity": ("storage_integrity_percent", "min"),
+    "total_captured_tonnes": ("co2_captured_tonnes", "sum"),
+    "total_stored_tonnes": ("co2_stored_tonnes", "sum"),
+}
+
+
+def annual_stats_table(data: pd.DataFrame, facility_names: list[str] | None = None, fallback: bool = True) -> pd.DataFrame:
+    data = as_snapshot(data)
+
+    if data.empty:                                                                              # STEP 1: Validate dataset and facilities
+        raise ValueError("The dataset is empty. Please set the CSV data first.")
+
+    if facility_names:
+        missing = [name for name in facility_names if name not in data.index]
+        if missing:
+            raise ValueError(f"Facility '{missing[0]}' not found in the dataset.")
+
+    grouped = data.aggregates.table                                                             # STEP 2+3: Non-anomalous rows per facility and year
+    if facility_names:
+        grouped = grouped[grouped.index.get_level_values("facility_name").isin(facility_names)]
+
+    table = pd.DataFrame({"rows": grouped[("rows", "")]}, index=grouped.index)
+    for name, (col, fn) in ANNUAL_AGGREGATES.items():
+        if fn == "mean":
+            table[name] = grouped[("sum", col)] / grouped[("count", col)].where(grouped[("count", col)] > 0)
+        else:
+            table[name] = grouped[(fn, col)]
+    table = table.reset_index()
+
+    # STEP 4: Per facility, keep last year (latest year - 1), or fall back to the latest year
+    current_year = table.groupby("facility_name")["year"].transform("max")
+    is_target = table["year"] == current_year - 1
+    has_target = is_target.groupby(table["facility_name"]).transform("any")
+    keep = is_target | (fallback & ~has_target & (table["year"] == current_year))
+    table = table[keep].set_index("facility_name")
+
+    # Facilities without a non-anomalous row keep their row, with the values annual_stats gives them (totals 0, no means/minimums)
+    names = list(dict.fromkeys(facility_names or data.facility_names))
+    table = table.reindex(names).rename_axis("facility_name").reset_index()
+    table["year"] = table["year"].astype("Int64")
+    table["rows"] = table["rows"].fillna(0).astype(np.int64)
+    for name, (col, fn) in ANNUAL_AGGREGATES.items():
+        if fn == "sum":
+            table[name] = table[name].fillna(0.0)
+
+    # Minimums are real float32 readings, report them with their shortest repr (98.017, not 98.01699829101562)
+    for col in ["minimum_capture_efficiency", "minimum_storage_integrity"]:
+        table[col] = table[col].astype(np.float32).astype(str).astype(np.float64)
+
+    return table                                                                                # STEP 5: Output = one row per requested facility
+
 
 # -------------------------------------------------------------------------------------
 # FUNCTION 5: Stats by Custom Date Range
@@ -115,79 +190,141 @@ def stats_by_range(data: pd.DataFrame, facility_name: str, start_date: str, end_
     This has caused some issues before.
     """
 
+    data = as_snapshot(data)
+
     if data.empty:                                                                             # STEP 1: Validate dataset + facility
         raise ValueError("No data found. Set the source CSV data before anything.")
 
-    if facility_name not in data["facility_name"].unique():
+    if facility_name not in data.index:
         raise ValueError(f"Facility '{facility_name}' not found in the source csv.")
 
-    filtered = data[(data["facility_name"] == facility_name) & (data["anomaly_flag"] == False)].copy() # STEP 2: Filter rows for facility, excluding anomalies
-    
-    filtered["date"] = pd.to_datetime(filtered["date"], format="%d/%m/%Y", dayfirst=True, errors="coerce") # Making sure that the dates col is properly formatted
-
     # Ensure valid start and end date
     """
     Using coerce for error for now, because this is poc.
     Might use different error becavior later on in production
     """
-    start_date = pd.to_datetime(start_date, format="%d/%m/%Y", dayfirst=True, errors="coerce")      # STEP 3: Convert start/end dates to datetime
-    end_date = pd.to_datetime(end_date, format="%d/%m/%Y", dayfirst=True, errors="coerce")
+    start_date = parse_dates(start_date)                                                            # STEP 3: Convert start/end dates to datetime
+    end_date = parse_dates(end_date)
 
     if pd.isna(start_date) or pd.isna(end_date):
         raise ValueError("Invalid start_date or end_date format or both. Use ther dd/mm/yyyy format.")
 
-    date_filtered = filtered[(filtered["date"] >= start_date) & (filtered["date"] <= end_date)]     # STEP 4: Filter dataset for that range
+    date_filtered = data.summary(facility_name, start_date, end_date)                                # STEP 4: Look up that range (binary search on the sorted dates + prefix sums, see rollups.py)
 
     if date_filtered.empty:
         return {"message": f"No data available for {facility_name} between {start_date.date()} and {end_date.date()}"}
 
     stats = {                                                                                       # STEP 5: Calculate metrics
         "Date range": f"{start_date.date()} to {end_date.date()}",
-        "Total emissions": f"{date_filtered['co2_emitted_tonnes'].sum()} tonnes",
-        "Mean emissions": f"{date_filtered['co2_emitted_tonnes'].mean()} tonnes",
-        "Mean efficiency": f"{date_filtered['capture_efficiency_percent'].mean()} %",
-        "Mean storage integrity": f"{date_filtered['storage_integrity_percent'].mean()} %",
-        "Minimum efficiency": f"{date_filtered['capture_efficiency_percent'].min()} %",
-        "Minimum storage integrity": f"{date_filtered['storage_integrity_percent'].min()} %"
+        "Total emissions": f"{date_filtered.total('co2_emitted_tonnes')} tonnes",
+        "Mean emissions": f"{date_filtered.mean('co2_emitted_tonnes')} tonnes",
+        "Mean efficiency": f"{date_filtered.mean('capture_efficiency_percent')} %",
+        "Mean storage integrity": f"{date_filtered.mean('storage_integrity_percent')} %",
+        "Minimum efficiency": f"{date_filtered.minimum('capture_efficiency_percent')} %",
+        "Minimum storage integrity": f"{date_filtered.minimum('storage_integrity_percent')} %"
     }
 
     return f"The metrics for the {facility_name} facility are as below", stats                     # STEP 6: Output = text + metrics dictionary
 
+# -------------------------------------------------------------------------------------
+# FUNCTION 5b: Stats of many facilities for a date range, or for their last year
+# What it does: Same metrics (and keys) as annual_stats, for a list of facilities and a period, so they can be
+# passed straight to the report generation. A date range is read from each facility's rollups, see rollups.py.
+
+RANGE_SUMMARY = {"sum": "total", "mean": "mean", "min": "minimum"}          # ANNUAL_AGGREGATES fn → RangeSummary method
+
+
+def range_stats_table(data: pd.DataFrame, facility_names: list[str] | None, start_date: str, end_date: str) -> pd.DataFrame:
+    data = as_snapshot(data)
+
+    if data.empty:                                                                              # STEP 1: Validate dataset, facilities and dates
+        raise ValueError("The dataset is empty. Please set the CSV data first.")
+    facility_names = facility_names or data.facility_names
+    missing = [name for name in facility_names if name not in data.index]
+    if missing:
+        raise ValueError(f"Facility '{missing[0]}' not found in the dataset.")
+
+    start, end = parse_dates(start_date), parse_dates(end_date)
+    if pd.isna(start) or pd.isna(end):
+        raise ValueError("Invalid start_date or end_date format or both. Use ther dd/mm/yyyy format.")
+
+    rows = []
+    for name in facility_names:                                                                 # STEP 2: One range lookup per facility
+        summary = data.summary(name, start, end)
+        row = {"facility_name": name, "rows": summary.rows}                                     # rows 0: no data in the range
+        for key, (col, fn) in ANNUAL_AGGREGATES.items():
+            row[key] = getattr(summary, RANGE_SUMMARY[fn])(col)
+        rows.append(row)
+    return pd.DataFrame(rows, columns=["facility_name", "rows", *ANNUAL_AGGREGATES])           # STEP 3: Output = one row per facility
+
+
+def period_stats(data: pd.DataFrame, facility_names: list[str] | None = None, start_date: str | None = None, end_date: str | None = None) -> list[dict]:
+    """
+    Stats dicts (annual_stats format) for many facilities: their last year, or start_date..end_date if given.
+    "rows" is the number of non-anomalous readings the stats come from: 0 means there is no data for the period.
+    """
+    if bool(start_date) != bool(end_date):
+        raise ValueError("Give both start_date and end_date, or neither for the last year.")
+    if start_date and end_date:
+        table = range_stats_table(data, facility_names, start_date, end_date)
+    else:
+        table = annual_stats_table(data, facility_names)
+    formattedTime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return [{**row, "date_time": formattedTime} for row in table.to_dict(orient="records")]
+
+
 # -------------------------------------------------------------------------------------
 # FUNCTION 6: Add Season Column
 # What it does: Add a "season" column in a df based on month of the year. Example: Jan = Winter, Jul = Summer.
 
 def add_season(data: pd.DataFrame) -> pd.DataFrame:
-    data = data.copy()                                        # STEP 1: Copy dataset + ensure date is datetime
-    # Ensure 'date' is datetime
-    data["date"] = pd.to_datetime(data["date"], format="%d/%m/%Y", dayfirst=True, errors="coerce")
-    data["month"] = data["date"].dt.month
-
-    def month_to_season(month: int) -> str:                   # STEP 2: Map month → season
-        if month in [12, 1, 2]:
-            return "Winter"
-        elif month in [3, 4]:
-            return "Spring"
-        elif month in [5, 6, 7, 8, 9]:
-            return "Summer"
-        elif month in [10, 11]:
-            return "Autumn"
-        else:
-            return None  # in case of missing or invalid dates
+    if "season" in data.columns and pd.api.types.is_datetime64_any_dtype(data["date"]):
+        return data                                                  # Canonical data already has the season, computed once at ingest
 
-    data["season"] = data["month"].apply(month_to_season)
-    return data                                                      # STEP 3: Output = enriched dataset with new "season" column
+    data = data.copy()                                               # STEP 1: Copy dataset + ensure date is datetime
+    if not pd.api.types.is_datetime64_any_dtype(data["date"]):
+        data["date"] = parse_dates(data["date"])
+    return add_calendar_columns(data)                                # STEP 2: Map month → season (Jan = Winter, Jul = Summer, ...)
+                                                                     # STEP 3: Output = enriched dataset with new "season" column
 
 # -------------------------------------------------------------------------------------
 # FUNCTION 7: Compare with Global Benchmarks
-# What it does: Compares facility performance with global benchmark values. Benchmarks are filtered by facility’s type and region.
-
-def global_bench(data, bench, facility_name: str):
-    filtered = data[data["facility_name"] == "facility_name"]        # STEP 1: Filter facility data
-    filtered = add_season(filtered)
-    fc_type = filtered["storage_site_type"].drop_duplicates().tolist()         # STEP 2: Extract facility attributes
-    region = filtered["region"].drop_duplicates().tolist()
-    benchmarks = bench[bench["storage_site_type"].isin(fc_type) & bench["region"].isin(region)]           # STEP 3: Filter global benchmarks by facility type + region
-    
-    #Will compare the entries to the benchmark and return facilities that underperformed
-    return filtered, benchmarks                                                              # STEP 4: Output = (facility dataset with season, benchmark subset)
+# What it does: Compares facility performance with global benchmark values. Benchmarks are matched on the facility's
+# region, storage site type and season (see benchmarks.py).
+
+def global_bench(data, bench: BenchmarkTable, facility_name: str):
+    data = as_snapshot(data)
+    if facility_name not in data.index:
+        raise ValueError(f"Facility '{facility_name}' not found in the dataset.")
+    filtered = add_season(data.rows(facility_name))                                             # STEP 1: Slice facility rows (season precomputed)
+    keys = filtered[BENCH_KEYS].astype(str).drop_duplicates()                                   # STEP 2: Extract facility attributes
+    benchmarks = bench.bench.merge(keys, on=BENCH_KEYS)                                         # STEP 3: Benchmarks of the facility's region + type + seasons
+
+    return filtered, benchmarks                                                                 # STEP 4: Output = (facility dataset with season, benchmark subset)
+
+
+# -------------------------------------------------------------------------------------
+# FUNCTION 8: Relative performance to global benchmarks
+# What it does: Every reading of a facility next to its benchmark, with the deviation and an underperformance flag,
+# plus a summary (mean deviation, number of underperforming readings). Example: "capture efficiency 3% below benchmark".
+
+def get_global_performance(facility_name: str, data, variable: str, bench: BenchmarkTable | None = None) -> dict:
+    bench = bench or benchmark_store.get()
+    compared = compare_facilities(data, bench, [facility_name], [variable])                      # STEP 1: Join readings to benchmarks (one merge)
+
+    columns = ["date", variable, f"{variable}_benchmark", f"{variable}_deviation_percent", f"{variable}_underperforming"]
+    table = compared[columns].rename(columns={                                                  # STEP 2: Keep the variable's comparison columns
+        variable: "value",
+        f"{variable}_benchmark": "benchmark",
+        f"{variable}_deviation_percent": "deviation_percent",
+        f"{variable}_underperforming": "underperforming",
+    })
+    numbers = ["value", "benchmark", "deviation_percent"]
+    table = table.astype({col: np.float64 for col in numbers})                                  # Metrics are float32, which is not valid json either
+    table = table.astype(object).where(table.notna(), None)                                     # NaN is not valid json
+
+    return {                                                                                    # STEP 3: Output = summary + per reading comparison
+        "message": f"The performance of {variable} for the facility {facility_name}, relative to the global benchmarks",
+        "summary": summarize(compared, [variable])[0],
+        "readings": table.to_dict(orient="records"),
+    }
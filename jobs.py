@@ -0,0 +1,275 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import httpx
+
+from kenjaAI import get_cached_esg_report, CircuitOpenError
+
+# -------------------------------------------------------------------------------------
+# Background report jobs
+# What it does: A report request becomes a job: submit returns a job id right away, a pool of workers generates
+# the report, and the client polls for the status/result. A finished report is kept, so a client that timed out
+# can still fetch it. Requests with the same key (facility, period, dataset version) while a job for it is
+# queued or running get that job instead of a new one (single-flight), so they share one Kenja AI call.
+# Jobs are kept by a backend: in memory (one process), or in a SQLite file (survives restarts, and can be
+# shared by the FastAPI and gRPC processes). In SQLite each unfinished job has an owner (the process that runs it),
+# which keeps its updated_at fresh every JOB_HEARTBEAT seconds. A queued or running job without a heartbeat
+# (its process stopped or restarted) is marked failed, at startup and by the other processes, and is not joined.
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOB_BACKEND = os.getenv("JOB_BACKEND", "memory")                       # "memory" or "sqlite"
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(".", "jobs.sqlite3"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", 24 * 60 * 60))       # Finished jobs are kept this long (seconds)
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", 15 * 60))         # An unfinished job older than this is not joined
+JOB_HEARTBEAT = float(os.getenv("JOB_HEARTBEAT", 10))                  # SQLite: seconds between owner heartbeats
+JOB_ORPHAN_AFTER = 3 * JOB_HEARTBEAT                                   # An unfinished job without a heartbeat this long is failed
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+FINISHED = (DONE, FAILED)
+INTERRUPTED = "The server stopped before the job finished. Please submit it again."
+
+
+def new_job(key: str, params: dict) -> dict:
+    now = time.time()
+    return {
+        "id": uuid.uuid4().hex,
+        "key": key,
+        "status": QUEUED,
+        "params": params,
+        "result": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+class InMemoryJobBackend:
+
+    def __init__(self):
+        self._jobs: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def create_unless_active(self, job: dict) -> dict | None:
+        """Saves job, unless an unfinished job with the same key exists: then that one is returned instead."""
+        with self._lock:
+            now = time.time()
+            for existing in self._jobs.values():
+                if existing["key"] == job["key"] and existing["status"] not in FINISHED and now - existing["created_at"] < JOB_STALE_AFTER:
+                    return dict(existing)
+            self._prune(now)
+            self._jobs[job["id"]] = dict(job)
+            return None
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields, updated_at=time.time())
+
+    def heartbeat(self):
+        """Jobs in memory end with the process, nothing to keep alive."""
+
+    def _prune(self, now: float):
+        expired = [job_id for job_id, job in self._jobs.items() if job["status"] in FINISHED and now - job["updated_at"] > JOB_RESULT_TTL]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+class SqliteJobBackend:
+
+    COLUMNS = "id, key, status, params, result, error, created_at, updated_at"
+
+    def __init__(self, path: str = JOB_DB_PATH):
+        self.path = path
+        self.owner = uuid.uuid4().hex                                     # This process
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")                # Readers in other processes don't block writers
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                       id TEXT PRIMARY KEY, key TEXT NOT NULL, status TEXT NOT NULL, params TEXT, result TEXT,
+                       error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, status)")
+            if "owner" not in [column[1] for column in self._conn.execute("PRAGMA table_info(jobs)")]:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")      # Files from before owners
+        self.fail_orphans()                                               # Jobs left queued/running by a stopped process
+
+    def create_unless_active(self, job: dict) -> dict | None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")                         # Check + insert as one step, also across processes
+            try:
+                now = time.time()
+                row = self._conn.execute(
+                    f"SELECT {self.COLUMNS} FROM jobs WHERE key = ? AND status IN (?, ?) AND created_at > ? AND updated_at > ? "
+                    "ORDER BY created_at LIMIT 1",
+                    (job["key"], QUEUED, RUNNING, now - JOB_STALE_AFTER, now - JOB_ORPHAN_AFTER),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute(
+                        "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (DONE, FAILED, now - JOB_RESULT_TTL)
+                    )
+                    self._conn.execute(
+                        f"INSERT INTO jobs ({self.COLUMNS}, owner) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (job["id"], job["key"], job["status"], json.dumps(job["params"]), None, None, job["created_at"], job["updated_at"],
+                         self.owner),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._to_job(row) if row is not None else None
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {self.COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row is not None else None
+
+    def update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        for name in ("params", "result"):
+            if name in fields:
+                fields[name] = json.dumps(fields[name])
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def heartbeat(self):
+        """Keeps this process's unfinished jobs alive, and fails the ones other processes left behind."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET updated_at = ? WHERE owner = ? AND status IN (?, ?)", (time.time(), self.owner, QUEUED, RUNNING)
+            )
+        self.fail_orphans()
+
+    def fail_orphans(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE status IN (?, ?) AND updated_at < ? AND owner IS NOT ?",
+                (FAILED, INTERRUPTED, time.time(), QUEUED, RUNNING, time.time() - JOB_ORPHAN_AFTER, self.owner),
+            )
+        if cursor.rowcount:
+            print(f"Marked {cursor.rowcount} interrupted job(s) as failed")
+        return cursor.rowcount
+
+    @staticmethod
+    def _to_job(row) -> dict:
+        job_id, key, status, params, result, error, created_at, updated_at = row
+        return {
+            "id": job_id,
+            "key": key,
+            "status": status,
+            "params": json.loads(params) if params else None,
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+
+class JobQueue:
+    """
+    Runs jobs with `runner` (an async function: params → result dict) on a pool of workers. The workers live on
+    their own event loop thread, so jobs can be submitted from any thread or event loop (FastAPI, gRPC).
+    """
+
+    def __init__(self, runner, backend=None, workers: int = JOB_WORKERS):
+        self.runner = runner
+        self.backend = backend or InMemoryJobBackend()
+        self.workers = workers
+        self._loop = None
+        self._queue = None
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, params: dict) -> tuple[dict, bool]:
+        """Returns (job, deduplicated). deduplicated is True if an identical job was already queued or running."""
+        job = new_job(key, params)
+        existing = self.backend.create_unless_active(job)
+        if existing is not None:
+            return existing, True
+        self._start()
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, job["id"])
+        return job, False
+
+    def get(self, job_id: str) -> dict | None:
+        return self.backend.get(job_id)
+
+    def _start(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            started = threading.Event()
+
+            def run():
+                self._loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(self._loop)
+                self._queue = asyncio.Queue()
+                for _ in range(self.workers):
+                    self._loop.create_task(self._work())
+                self._loop.create_task(self._heartbeat())
+                started.set()
+                self._loop.run_forever()
+
+            threading.Thread(target=run, name="job-workers", daemon=True).start()
+            started.wait()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT)
+            try:
+                await asyncio.to_thread(self.backend.heartbeat)
+            except Exception as e:
+                print(f"Job heartbeat failed: {e}")
+
+    async def _work(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self.backend.get(job_id)
+            if job is None or job["status"] in FINISHED:                  # Failed as interrupted in the meantime
+                continue
+            self.backend.update(job_id, status=RUNNING)
+            try:
+                result = await self.runner(job["params"])
+            except Exception as e:
+                print(f"Job {job_id} failed: {e}")
+                self.backend.update(job_id, status=FAILED, error=str(e))
+            else:
+                self.backend.update(job_id, status=DONE, result=result)
+
+
+def job_status(job: dict) -> dict:
+    """What the poll endpoints return (the result is fetched separately)."""
+    return {key: job[key] for key in ("id", "status", "error", "created_at", "updated_at")}
+
+
+def report_job_key(facility_name: str, start_date: str | None, end_date: str | None, version: str) -> str:
+    period = f"{start_date}..{end_date}" if start_date and end_date else "annual"
+    return f"{facility_name}|{period}|{version}"
+
+
+async def run_report_job(params: dict) -> dict:
+    # params: the stats computed at submit time (dataset version fixed), see service.py/grpc_server.py
+    try:
+        esg_report = await get_cached_esg_report(params["stats_data"], params["version"])
+    except (CircuitOpenError, httpx.HTTPError) as e:
+        raise RuntimeError(f"Kenja AI request failed: {str(e)}") from e
+    return {"esg_report": esg_report, "stats_data": params["stats_data"]}
+
+
+def make_backend():
+    if JOB_BACKEND == "sqlite":
+        return SqliteJobBackend(JOB_DB_PATH)
+    return InMemoryJobBackend()
+
+
+# One queue per process, shared by the FastAPI app and the gRPC servicer
+job_queue = JobQueue(run_report_job, make_backend())
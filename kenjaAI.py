@@ -1,21 +1,30 @@
+import asyncio
+import contextlib
 import httpx
+import json
 import os
+import random
+import threading
+import time
+import weakref
 from dotenv import load_dotenv
 
+from report_cache import report_cache, report_key
+
 load_dotenv()
 
 KENJA_AI_URL = os.environ.get("KENJA_AI_URL")
 KENJA_AI_SECRET = os.getenv("KENJA_AI_SECRET")
 KENJA_CORPUS_ID = os.getenv("KENJA_CORPUS_ID")
 KENJA_CONVERSATION_ID = os.getenv("KENJA_CONVERSATION_ID")
+KENJA_MAX_CONCURRENCY = int(os.getenv("KENJA_MAX_CONCURRENCY", 8))     # Upstream calls in flight at once
+REPORT_BATCH_CONCURRENCY = int(os.getenv("REPORT_BATCH_CONCURRENCY", 4))   # Reports generated at once by one batch
 
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
-async def get_esg_report(payload:dict):
 
-    headers = {
-        "Authorization": f"Bearer {KENJA_AI_SECRET}",
-        "Content-Type": "application/json",
-    }
+def esg_report_request(payload:dict) -> dict:
+    """The request body sent to Kenja AI for a report. Also what the report cache is keyed on."""
     ai_prompt = f"""Create a professional ESG (Environmental, Social, Governance) report for a Carbon Capture and Storage (CCS) facility.
                  Generate a complete ESG (Environmental, Social, Governance) report in Markdown style. 
 
@@ -51,12 +60,293 @@ async def get_esg_report(payload:dict):
          "llm_inference_provider_id": "openai",
          "llm_model_id": "openai.gpt-4.1-mini"
     }
-    time_out = httpx.Timeout(60.0, connect=10.0)
-    max_attempts = 3
-    backoff = 1.0
-    url = f"{KENJA_AI_URL}chatbot/conversations/{KENJA_CONVERSATION_ID}/messages"
-    async with httpx.AsyncClient(timeout=time_out) as client:
-        response = await client.post(url, headers=headers, json=request_body)
-        response.raise_for_status()
-        esg_output = response.json()
-        return esg_output["response"]["content"]
\ No newline at end of file
+    return request_body
+
+
+# -------------------------------------------------------------------------------------
+# Kenja AI client
+# What it does: One long-lived client instead of a new connection per report. It keeps a connection pool
+# (keep-alive), retries 429/5xx/timeouts with exponential backoff and jitter, caps the number of calls in
+# flight, and stops calling an upstream that keeps failing for a while (circuit breaker).
+# httpx clients and asyncio semaphores belong to one event loop, so each loop gets its own pool. The FastAPI
+# app and the gRPC server (grpc.aio) each run on one loop, so all their requests share the same pool.
+
+class CircuitOpenError(RuntimeError):
+    """Kenja AI failed too many times in a row, calls are refused until the reset timeout has passed."""
+
+
+class CircuitBreaker:
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = None                         # Token of the call testing a half-open circuit
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self) -> object | None:
+        """Raises CircuitOpenError, or returns the call's token: pass it to failed() and release()."""
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half-open" and self._trial is not None):
+                raise CircuitOpenError("Kenja AI is unavailable, try again later.")
+            if state == "half-open":
+                self._trial = object()             # Let one call through to test the upstream
+                return self._trial
+            return None                            # Not the trial call
+
+    def succeeded(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = None
+
+    def release(self, token: object | None):
+        with self._lock:
+            if token is not None and self._trial is token:
+                self._trial = None                 # The trial call ended without a result (e.g. cancelled)
+
+    def failed(self, token: object | None = None):
+        with self._lock:
+            self.failures += 1
+            if token is not None and self._trial is token:
+                self._trial = None
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+
+class KenjaClient:
+
+    def __init__(self, base_url: str | None = None, secret: str | None = None,
+                 max_attempts: int = 3, backoff: float = 1.0, max_backoff: float = 20.0,
+                 max_concurrency: int = KENJA_MAX_CONCURRENCY, timeout: httpx.Timeout | None = None,
+                 breaker: CircuitBreaker | None = None, transport: httpx.AsyncBaseTransport | None = None):
+        self.base_url = base_url if base_url is not None else KENJA_AI_URL
+        self.secret = secret if secret is not None else KENJA_AI_SECRET
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout or httpx.Timeout(60.0, connect=10.0)
+        self.breaker = breaker or CircuitBreaker()
+        self.transport = transport                     # e.g. httpx.MockTransport in tests
+        self._pools = weakref.WeakKeyDictionary()      # event loop → (httpx client, semaphore)
+
+    def _pool(self) -> tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        pool = self._pools.get(loop)
+        if pool is None or pool[0].is_closed:
+            client = httpx.AsyncClient(
+                base_url=self.base_url or "",
+                timeout=self.timeout,
+                headers={"Authorization": f"Bearer {self.secret}", "Content-Type": "application/json"},
+                limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+                transport=self.transport,
+            )
+            pool = (client, asyncio.Semaphore(self.max_concurrency))
+            self._pools[loop] = pool
+        return pool
+
+    def _delay(self, attempt: int, response: httpx.Response | None) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                pass
+        # Full jitter: anywhere between 0 and the exponential backoff, so retries don't all arrive together
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def post(self, path: str, json: dict) -> httpx.Response:
+        """POST with retries. Raises CircuitOpenError, or the httpx error of the last attempt."""
+        token = self.breaker.before_call()
+        try:
+            return await self._post(path, json, token)
+        finally:
+            self.breaker.release(token)
+
+    async def _post(self, path: str, json: dict, token: object | None) -> httpx.Response:
+        client, semaphore = self._pool()
+        for attempt in range(self.max_attempts):
+            response = None
+            try:
+                async with semaphore:
+                    response = await client.post(path, json=json)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()        # Other 4xx: our request is wrong, retrying won't help
+                    self.breaker.succeeded()
+                    return response
+                error = httpx.HTTPStatusError(f"Kenja AI returned {response.status_code}", request=response.request, response=response)
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                error = e
+            except httpx.HTTPStatusError:
+                self.breaker.succeeded()               # The upstream is up, don't count it as an outage
+                raise
+            if attempt + 1 < self.max_attempts:
+                delay = self._delay(attempt, response)
+                print(f"Kenja AI call failed ({error}), retry {attempt + 1} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+        self.breaker.failed(token)
+        raise error
+
+    @contextlib.asynccontextmanager
+    async def stream(self, path: str, json: dict):
+        """
+        POST whose response body is read as it arrives. Retries like post(), but only until the response
+        starts: once the body is being read, an error is raised to the caller. The call counts against the
+        concurrency cap until the body is fully read.
+        """
+        token = self.breaker.before_call()
+        try:
+            client, semaphore = self._pool()
+            for attempt in range(self.max_attempts):
+                response, started = None, False
+                try:
+                    async with semaphore, client.stream("POST", path, json=json, headers={"Accept": "text/event-stream"}) as response:
+                        if response.status_code not in RETRY_STATUSES:
+                            if response.is_error:
+                                await response.aread()
+                            response.raise_for_status()
+                            self.breaker.succeeded()
+                            started = True
+                            yield response
+                            return
+                    error = httpx.HTTPStatusError(f"Kenja AI returned {response.status_code}", request=response.request, response=response)
+                except (httpx.TimeoutException, httpx.TransportError) as e:
+                    if started:
+                        raise
+                    error = e
+                except httpx.HTTPStatusError:
+                    if not started:
+                        self.breaker.succeeded()
+                    raise
+                if attempt + 1 < self.max_attempts:
+                    delay = self._delay(attempt, response)
+                    print(f"Kenja AI call failed ({error}), retry {attempt + 1} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+            self.breaker.failed(token)
+            raise error
+        finally:
+            self.breaker.release(token)
+
+    async def aclose(self):
+        """Closes the pool of the current event loop."""
+        pool = self._pools.pop(asyncio.get_running_loop(), None)
+        if pool is not None:
+            await pool[0].aclose()
+
+
+# One client per process, shared by the FastAPI app and the gRPC servicer
+kenja_client = KenjaClient()
+
+
+async def get_esg_report(payload:dict):
+
+    request_body = esg_report_request(payload)
+    url = f"chatbot/conversations/{KENJA_CONVERSATION_ID}/messages"
+    response = await kenja_client.post(url, json=request_body)
+    esg_output = response.json()
+    return esg_output["response"]["content"]
+
+
+def _event_text(data: str) -> str:
+    # One server-sent event from Kenja AI: a json delta ({"delta": ...}, {"content": ...} or the full message format), or plain text
+    try:
+        event = json.loads(data)
+    except ValueError:
+        return data
+    if not isinstance(event, dict):
+        return str(event)
+    if isinstance(event.get("response"), dict):
+        event = event["response"]
+    return event.get("delta") or event.get("content") or ""
+
+
+async def stream_esg_report(payload:dict):
+    """
+    Yields the report text as it is generated. If Kenja AI answers with server-sent events, each event is
+    forwarded as it arrives. Otherwise (a plain json answer) the whole report is yielded once.
+    """
+    request_body = esg_report_request(payload)
+    url = f"chatbot/conversations/{KENJA_CONVERSATION_ID}/messages"
+    async with kenja_client.stream(url, json=request_body) as response:
+        if not response.headers.get("Content-Type", "").startswith("text/event-stream"):
+            await response.aread()
+            yield response.json()["response"]["content"]
+            return
+
+        data = []
+        async for line in response.aiter_lines():
+            if line.startswith("data:"):
+                data.append(line[5:].removeprefix(" "))
+            elif not line and data:                  # A blank line ends the event
+                event, data = "\n".join(data), []
+                if event == "[DONE]":
+                    return
+                text = _event_text(event)
+                if text:
+                    yield text
+        if data and "\n".join(data) != "[DONE]":
+            text = _event_text("\n".join(data))
+            if text:
+                yield text
+
+
+async def get_cached_esg_report(payload:dict, version:str):
+    """Same as get_esg_report, but a report already generated from the same data is reused (see report_cache.py)."""
+    key = report_key(esg_report_request(payload))
+    esg_report = report_cache.get(key, version)
+    if esg_report is None:
+        esg_report = await get_esg_report(payload)
+        report_cache.put(key, version, esg_report)
+    return esg_report
+
+
+async def stream_cached_esg_report(payload:dict, version:str):
+    """Streamed version of get_cached_esg_report. A cached report is yielded at once, a new one is cached once complete."""
+    key = report_key(esg_report_request(payload))
+    esg_report = report_cache.get(key, version)
+    if esg_report is not None:
+        yield esg_report
+        return
+    parts = []
+    async for text in stream_esg_report(payload):
+        parts.append(text)
+        yield text
+    report_cache.put(key, version, "".join(parts))
+
+
+async def generate_esg_reports(payloads:list[dict], version:str, max_concurrency:int = REPORT_BATCH_CONCURRENCY):
+    """
+    Generates the reports of many stats payloads concurrently, at most max_concurrency at a time, and yields
+    (payload, report, error) as each one completes, so the total time is about the slowest report.
+    A failed report gives error (and report None), the others still complete. A payload without data for its
+    period ("rows" 0, see insights.period_stats) gives an error at once, without a Kenja AI request.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def generate(payload):
+        if payload.get("rows", 1) == 0:
+            return payload, None, f"No data available for {payload['facility_name']} in this period."
+        async with semaphore:
+            try:
+                return payload, await get_cached_esg_report(payload, version), None
+            except (CircuitOpenError, httpx.HTTPError) as e:
+                return payload, None, f"Kenja AI request failed: {str(e)}"
+
+    tasks = [asyncio.create_task(generate(payload)) for payload in payloads]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:                          # Client went away: stop the reports still waiting
+            task.cancel()
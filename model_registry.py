@@ -0,0 +1,100 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from features import FEATURE_COLS, encode, saved_vocabulary
+
+# -------------------------------------------------------------------------------------
+# Model registry
+# What it does: Loads the models saved by /train_lgbm (model + feature vocabulary) once, and keeps them in memory,
+# keyed by facility and model version (a hash of the saved file). Before a model is used the file is checked
+# (a stat, no read): if it was retrained, by this or another process, the new version is loaded.
+# The least recently used models are dropped when more than MODEL_CACHE_SIZE are loaded.
+
+MODEL_DIR = os.getenv("MODEL_DIR", "saved_models")
+MODEL_CACHE_SIZE = int(os.getenv("MODEL_CACHE_SIZE", 8))
+
+
+class ModelNotFoundError(LookupError):
+    """No model was trained for the facility yet."""
+
+
+class LoadedModel:
+
+    def __init__(self, facility_name: str, version: str, model, vocabulary: dict, features: list[str] | None = None):
+        self.facility_name = facility_name
+        self.version = version
+        self.model = model
+        self.vocabulary = vocabulary
+        self.features = features or FEATURE_COLS
+
+    def features_frame(self, rows: pd.DataFrame) -> pd.DataFrame:
+        """The model input for many rows at once, encoded like the training rows (features.encode)."""
+        return encode(rows, self.vocabulary, self.features)
+
+    def predict(self, rows: pd.DataFrame) -> np.ndarray:
+        """Scores all rows with one model.predict call."""
+        if len(rows) == 0:
+            return np.empty(0)
+        return np.asarray(self.model.predict(self.features_frame(rows)), dtype=np.float64)
+
+
+class ModelRegistry:
+
+    def __init__(self, folder: str = MODEL_DIR, max_models: int = MODEL_CACHE_SIZE):
+        self.folder = folder
+        self.max_models = max_models
+        self._models: OrderedDict[tuple[str, str], LoadedModel] = OrderedDict()   # (facility, version) → model
+        self._current: dict[str, tuple[tuple, str]] = {}                          # facility → (file stat, version)
+        self._lock = threading.Lock()
+
+    def path(self, facility_name: str) -> str:
+        return os.path.join(self.folder, f"{facility_name}_lgbm.pkl")
+
+    def get(self, facility_name: str) -> LoadedModel:
+        """The latest saved model of the facility. Raises ModelNotFoundError if none was trained."""
+        path = self.path(facility_name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            raise ModelNotFoundError(f"No model trained for {facility_name}. Use /train_lgbm first.") from None
+        stat = (st.st_mtime_ns, st.st_size)
+
+        with self._lock:
+            current = self._current.get(facility_name)
+            if current is not None and current[0] == stat:
+                model = self._models.get((facility_name, current[1]))
+                if model is not None:
+                    self._models.move_to_end((facility_name, current[1]))
+                    return model
+
+            model = self._load(facility_name, path)                   # New or retrained: (re)load it
+            self._current[facility_name] = (stat, model.version)
+            self._models[(facility_name, model.version)] = model
+            self._models.move_to_end((facility_name, model.version))
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+            return model
+
+    def invalidate(self, facility_name: str):
+        with self._lock:
+            self._current.pop(facility_name, None)
+
+    @staticmethod
+    def _load(facility_name: str, path: str) -> LoadedModel:
+        with open(path, "rb") as f:
+            content = f.read()
+        version = hashlib.sha256(content).hexdigest()[:16]
+        print(f"Loading model for {facility_name} (version {version})")
+        saved = joblib.load(io.BytesIO(content))                      # Older files have LabelEncoders instead of a vocabulary
+        return LoadedModel(facility_name, version, saved["model"], saved_vocabulary(saved), saved.get("features"))
+
+
+# One registry per process, shared by the FastAPI app and the gRPC servicer
+model_registry = ModelRegistry()
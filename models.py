@@ -1,43 +1,165 @@
+import os
+import time
+import joblib
 import lightgbm as lgb
-from sklearn.preprocessing import LabelEncoder
+import numpy as np
+from sklearn.model_selection import TimeSeriesSplit
 import pandas as pd
 
-def LGBM_regressor(facility_name: str, data: pd.DataFrame, 
-                  lr: float = 0.05, depth:int = 5
-                  ):
-    
-    filtered = data[data["facility_name"] == facility_name].dropna(
-        subset=["co2_emitted_tonnes", "region", "storage_site_type", "season", "co2_captured_tonnes"]
-    )
+from features import FEATURE_COLS, CATEGORICAL_COLS, TARGET_COL, with_season, build_vocabulary, extend_vocabulary, saved_vocabulary, encode
+
+NUM_ROUNDS = 200
+INCREMENTAL_ROUNDS = 50      # Extra trees added per incremental update
 
+
+def training_rows(facility_name: str, data: pd.DataFrame) -> pd.DataFrame:
+    filtered = with_season(data[data["facility_name"] == facility_name]).dropna(subset=FEATURE_COLS + [TARGET_COL])
     if filtered.empty:
         raise ValueError(f"No valid data found for facility {facility_name}")
+    if "date" in filtered.columns:
+        filtered = filtered.sort_values("date", kind="stable")          # Oldest first, for time-series splits
+    return filtered
 
-    
-    features = filtered[["co2_emitted_tonnes", "region", "storage_site_type", "season"]].copy()
-    target   = filtered["co2_captured_tonnes"]
 
-    
-    categorical_cols = ["region", "storage_site_type", "season"]
-    encoders = {}
-    for col in categorical_cols:
-        le = LabelEncoder()
-        features[col] = le.fit_transform(features[col].astype(str))
-        encoders[col] = le  # saving encoders for later predictions
+def encode_features(rows: pd.DataFrame, vocabulary: dict | None = None) -> tuple[pd.DataFrame, dict]:
+    """Categorical codes of the features (see features.py). Builds a new vocabulary, or reuses the given one."""
+    vocabulary = vocabulary or build_vocabulary(rows)
+    return encode(rows, vocabulary), vocabulary   # saving the vocabulary for later predictions
 
-    
-    training_data = lgb.Dataset(features, label=target, categorical_feature=categorical_cols)
 
-    # Parameters
-    params = {
+def lgbm_params(lr: float, depth: int, threads: int = 0) -> dict:
+    return {
         "objective": "regression",
         "metric": "rmse",
         "learning_rate": lr,
         "num_leaves": (2**depth)-1,
-        "verbose": -1
+        "verbose": -1,
+        "num_threads": threads  # 0 = LightGBM default (all cores)
     }
 
+
+def LGBM_regressor(facility_name: str, data: pd.DataFrame,
+                  lr: float = 0.05, depth:int = 5, threads: int = 0, num_rounds: int = NUM_ROUNDS
+                  ):
+
+    filtered = training_rows(facility_name, data)
+    features, vocabulary = encode_features(filtered)
+    target   = filtered[TARGET_COL]
+
+    training_data = lgb.Dataset(features, label=target, categorical_feature=CATEGORICAL_COLS)
+
     # Train model on all available data
-    model = lgb.train(params, training_data, num_boost_round=200)
+    model = lgb.train(lgbm_params(lr, depth, threads), training_data, num_boost_round=num_rounds)
+
+    return model, vocabulary
+
+
+def LGBM_continue(saved: dict, new_rows: pd.DataFrame, threads: int = 0, num_rounds: int = INCREMENTAL_ROUNDS):
+    """
+    Warm start: adds num_rounds trees to a saved model, fitted on the new rows only (init_model).
+    Categories the model has never seen are added at the end of its vocabulary, so the old codes keep their meaning.
+    """
+    vocabulary = extend_vocabulary(saved_vocabulary(saved), new_rows)
+    features, _ = encode_features(new_rows, vocabulary)
+    training_data = lgb.Dataset(features, label=new_rows[TARGET_COL], categorical_feature=CATEGORICAL_COLS)
+    params = lgbm_params(saved["params"]["lr"], saved["params"]["depth"], threads)
+    return lgb.train(params, training_data, num_boost_round=num_rounds, init_model=saved["model"]), vocabulary
+
+
+def save_model(path: str, model, vocabulary: dict, **metadata):
+    """Writes to a temp file and renames it, so a reader never sees a half-written model."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    joblib.dump({"model": model, "vocabulary": vocabulary, "features": FEATURE_COLS, **metadata}, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _trained_until(rows: pd.DataFrame) -> str | None:
+    return str(rows["date"].max()) if "date" in rows.columns and rows["date"].notna().any() else None
+
+
+def train_and_save(facility_name: str, data: pd.DataFrame, path: str, lr: float = 0.05, depth: int = 5, threads: int = 0,
+                   incremental: bool = False, num_rounds: int = NUM_ROUNDS) -> dict:
+    """
+    Trains and saves one facility's model. Runs in a training worker process, see training.py.
+    incremental: continue the saved model on the rows newer than the ones it was trained on. Falls back to a full
+    training if there is no saved model, or it has no training date (older model files).
+    """
+    started = time.perf_counter()
+    rows = training_rows(facility_name, data)
+    saved = joblib.load(path) if incremental and os.path.exists(path) else None
 
-    return model, encoders
+    if incremental and saved is not None and saved.get("trained_until") is not None:
+        new_rows = rows[rows["date"] > pd.Timestamp(saved["trained_until"])]
+        if new_rows.empty:
+            return {"facility_name": facility_name, "path": path, "mode": "unchanged", "rows": 0, "seconds": time.perf_counter() - started}
+        model, vocabulary = LGBM_continue(saved, new_rows, threads)
+        save_model(path, model, vocabulary, params=saved["params"], trained_until=_trained_until(rows),
+                   num_rounds=saved.get("num_rounds", NUM_ROUNDS) + INCREMENTAL_ROUNDS)
+        return {"facility_name": facility_name, "path": path, "mode": "incremental", "rows": len(new_rows),
+                "trees": model.num_trees(), "seconds": time.perf_counter() - started}
+
+    model, vocabulary = LGBM_regressor(facility_name, rows, lr, depth, threads, num_rounds)
+    save_model(path, model, vocabulary, params={"lr": lr, "depth": depth}, trained_until=_trained_until(rows), num_rounds=num_rounds)
+    return {"facility_name": facility_name, "path": path, "mode": "full", "rows": len(rows), "lr": lr, "depth": depth,
+            "seconds": time.perf_counter() - started}
+
+
+# -------------------------------------------------------------------------------------
+# Hyperparameter search
+# What it does: Time-series cross-validation (train on the past, validate on the next block of dates) for every
+# lr/depth pair of a grid. Each fit stops early once the validation error stops improving, so the number of
+# rounds is found instead of fixed. Each (config, fold) is a separate task, so they run in parallel, see training.py.
+
+def cv_folds(rows: pd.DataFrame, n_splits: int) -> list[tuple[np.ndarray, np.ndarray]]:
+    return list(TimeSeriesSplit(n_splits=n_splits).split(rows))
+
+
+def cv_fold(features: pd.DataFrame, target: pd.Series, train_idx: np.ndarray, valid_idx: np.ndarray, lr: float, depth: int,
+            threads: int = 1, max_rounds: int = 2000, early_stopping: int = 50) -> dict:
+    """Fits one fold with early stopping. Returns its validation rmse, best number of rounds and timing."""
+    started = time.perf_counter()
+    train = lgb.Dataset(features.iloc[train_idx], label=target.iloc[train_idx], categorical_feature=CATEGORICAL_COLS)
+    valid = lgb.Dataset(features.iloc[valid_idx], label=target.iloc[valid_idx], categorical_feature=CATEGORICAL_COLS, reference=train)
+    model = lgb.train(
+        lgbm_params(lr, depth, threads), train, num_boost_round=max_rounds, valid_sets=[valid],
+        callbacks=[lgb.early_stopping(early_stopping, verbose=False)],
+    )
+    return {
+        "lr": lr,
+        "depth": depth,
+        "rmse": float(model.best_score["valid_0"]["rmse"]),
+        "best_iteration": int(model.best_iteration or max_rounds),
+        "train_rows": len(train_idx),
+        "valid_rows": len(valid_idx),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+# A tuning run's features and target are written to one file, which each worker process reads once and keeps
+# for the run's other folds, instead of every (config, fold) task pickling the whole frame to the pool
+_cv_data: dict[str, tuple[pd.DataFrame, pd.Series]] = {}
+
+
+def save_cv_data(features: pd.DataFrame, target: pd.Series, path: str):
+    pd.to_pickle((features, target), path)
+
+
+def cv_fold_from_file(path: str, train_idx: np.ndarray, valid_idx: np.ndarray, lr: float, depth: int, threads: int = 1) -> dict:
+    """cv_fold on the data of save_cv_data. Runs in a worker process."""
+    if path not in _cv_data:
+        _cv_data.clear()                                        # Only the current run's data is kept
+        _cv_data[path] = pd.read_pickle(path)
+    features, target = _cv_data[path]
+    return cv_fold(features, target, train_idx, valid_idx, lr, depth, threads)
+
+
+def summarize_cv(folds: list[dict]) -> tuple[dict, list[dict]]:
+    """Mean rmse per (lr, depth), sorted best first. Returns (best config, all configs)."""
+    table = pd.DataFrame(folds).groupby(["lr", "depth"]).agg(
+        rmse=("rmse", "mean"), rmse_std=("rmse", "std"), best_iteration=("best_iteration", "mean"), seconds=("seconds", "sum")
+    )
+    table = table.sort_values("rmse").reset_index()
+    table["best_iteration"] = table["best_iteration"].round().astype(int)
+    configs = table.to_dict(orient="records")
+    return configs[0], configs
@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x14protos/service.proto\x12\x0c\x65sgReporting\"(\n\x10UploadCSVRequest\x12\x14\n\x0c\x66ile_content\x18\x01 \x01(\x0c\"4\n\x11UploadCSVResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\"1\n\x18GenerateEsgReportRequest\x12\x15\n\rfacility_name\x18\x01 \x01(\t\"\xb8\x02\n\tStatsData\x12\x15\n\rfacility_name\x18\x01 \x01(\t\x12\x1e\n\x16total_annual_emissions\x18\x02 \x01(\x01\x12\x1d\n\x15mean_annual_emissions\x18\x03 \x01(\x01\x12\x1f\n\x17mean_capture_efficiency\x18\x04 \x01(\x01\x12\x1e\n\x16mean_storage_integrity\x18\x05 \x01(\x01\x12\"\n\x1aminimum_capture_efficiency\x18\x06 \x01(\x01\x12!\n\x19minimum_storage_integrity\x18\x07 \x01(\x01\x12\x1d\n\x15total_captured_tonnes\x18\x08 \x01(\x01\x12\x1b\n\x13total_stored_tonnes\x18\t \x01(\x01\x12\x11\n\tdate_time\x18\n \x01(\t\"\\\n\x19GenerateEsgReportResponse\x12\x12\n\nesg_report\x18\x01 \x01(\t\x12+\n\nstats_data\x18\x02 \x01(\x0b\x32\x17.esgReporting.StatsData2\xc6\x01\n\x10\x45sgReportService\x12L\n\tUploadCSV\x12\x1e.esgReporting.UploadCSVRequest\x1a\x1f.esgReporting.UploadCSVResponse\x12\x64\n\x11GenerateEsgReport\x12&.esgReporting.GenerateEsgReportRequest\x1a\'.esgReporting.GenerateEsgReportResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x14protos/service.proto\x12\x0c\x65sgReporting\"(\n\x10UploadCSVRequest\x12\x14\n\x0c\x66ile_content\x18\x01 \x01(\x0c\"\x1e\n\x0eUploadCSVChunk\x12\x0c\n\x04\x64\x61ta\x18\x01 \x01(\x0c\"4\n\x11UploadCSVResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\"\xda\x03\n\x07Reading\x12\x0c\n\x04\x64\x61te\x18\x01 \x01(\t\x12\x13\n\x0b\x66\x61\x63ility_id\x18\x02 \x01(\t\x12\x15\n\rfacility_name\x18\x03 \x01(\t\x12\x0f\n\x07\x63ountry\x18\x04 \x01(\t\x12\x0e\n\x06region\x18\x05 \x01(\t\x12\x19\n\x11storage_site_type\x18\x06 \x01(\t\x12\x1f\n\x12\x63o2_emitted_tonnes\x18\x07 \x01(\x01H\x00\x88\x01\x01\x12 \n\x13\x63o2_captured_tonnes\x18\x08 \x01(\x01H\x01\x88\x01\x01\x12\x1e\n\x11\x63o2_stored_tonnes\x18\t \x01(\x01H\x02\x88\x01\x01\x12\'\n\x1a\x63\x61pture_efficiency_percent\x18\n \x01(\x01H\x03\x88\x01\x01\x12&\n\x19storage_integrity_percent\x18\x0b \x01(\x01H\x04\x88\x01\x01\x12\x14\n\x0c\x61nomaly_flag\x18\x0c \x01(\x08\x12\r\n\x05notes\x18\r \x01(\tB\x15\n\x13_co2_emitted_tonnesB\x16\n\x14_co2_captured_tonnesB\x14\n\x12_co2_stored_tonnesB\x1d\n\x1b_capture_efficiency_percentB\x1c\n\x1a_storage_integrity_percent\"8\n\x11\x41ppendRowsRequest\x12#\n\x04rows\x18\x01 \x03(\x0b\x32\x15.esgReporting.Reading\"T\n\x12\x41ppendRowsResponse\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0f\n\x07version\x18\x03 \x01(\t\x12\x0c\n\x04rows\x18\x04 \x01(\x03\"1\n\x18GenerateEsgReportRequest\x12\x15\n\rfacility_name\x18\x01 \x01(\t\"\xb8\x02\n\tStatsData\x12\x15\n\rfacility_name\x18\x01 \x01(\t\x12\x1e\n\x16total_annual_emissions\x18\x02 \x01(\x01\x12\x1d\n\x15mean_annual_emissions\x18\x03 \x01(\x01\x12\x1f\n\x17mean_capture_efficiency\x18\x04 \x01(\x01\x12\x1e\n\x16mean_storage_integrity\x18\x05 \x01(\x01\x12\"\n\x1aminimum_capture_efficiency\x18\x06 \x01(\x01\x12!\n\x19minimum_storage_integrity\x18\x07 \x01(\x01\x12\x1d\n\x15total_captured_tonnes\x18\x08 \x01(\x01\x12\x1b\n\x13total_stored_tonnes\x18\t \x01(\x01\x12\x11\n\tdate_time\x18\n \x01(\t\"\\\n\x19GenerateEsgReportResponse\x12\x12\n\nesg_report\x18\x01 \x01(\t\x12+\n\nstats_data\x18\x02 \x01(\x0b\x32\x17.esgReporting.StatsData\"Z\n\x0e\x45sgReportChunk\x12-\n\nstats_data\x18\x01 \x01(\x0b\x32\x17.esgReporting.StatsDataH\x00\x12\x0e\n\x04text\x18\x02 \x01(\tH\x00\x42\t\n\x07\x63ontent\"n\n\x15\x45sgReportBatchRequest\x12\x16\n\x0e\x66\x61\x63ility_names\x18\x01 \x03(\t\x12\x12\n\nstart_date\x18\x02 \x01(\t\x12\x10\n\x08\x65nd_date\x18\x03 \x01(\t\x12\x17\n\x0fmax_concurrency\x18\x04 \x01(\x05\"{\n\x12\x45sgReportBatchItem\x12\x15\n\rfacility_name\x18\x01 \x01(\t\x12\x12\n\nesg_report\x18\x02 \x01(\t\x12+\n\nstats_data\x18\x03 \x01(\x0b\x32\x17.esgReporting.StatsData\x12\r\n\x05\x65rror\x18\x04 \x01(\t\"O\n\x10ReportJobRequest\x12\x15\n\rfacility_name\x18\x01 \x01(\t\x12\x12\n\nstart_date\x18\x02 \x01(\t\x12\x10\n\x08\x65nd_date\x18\x03 \x01(\t\"\x1c\n\nJobRequest\x12\x0e\n\x06job_id\x18\x01 \x01(\t\"x\n\tJobStatus\x12\x0e\n\x06job_id\x18\x01 \x01(\t\x12\x0e\n\x06status\x18\x02 \x01(\t\x12\r\n\x05\x65rror\x18\x03 \x01(\t\x12\x14\n\x0c\x64\x65\x64uplicated\x18\x04 \x01(\x08\x12\x12\n\ncreated_at\x18\x05 \x01(\x01\x12\x12\n\nupdated_at\x18\x06 \x01(\x01\"\x87\x01\n\tJobResult\x12$\n\x03job\x18\x01 \x01(\x0b\x32\x17.esgReporting.JobStatus\x12\x12\n\nesg_report\x18\x02 \x01(\t\x12+\n\nstats_data\x18\x03 \x01(\x0b\x32\x17.esgReporting.StatsData\x12\x13\n\x0bresult_json\x18\x04 \x01(\t\"q\n\nPredictRow\x12\x1a\n\x12\x63o2_emitted_tonnes\x18\x01 \x01(\x01\x12\x0e\n\x06region\x18\x02 \x01(\t\x12\x19\n\x11storage_site_type\x18\x03 \x01(\t\x12\x0e\n\x06season\x18\x04 \x01(\t\x12\x0c\n\x04\x64\x61te\x18\x05 \x01(\t\"T\n\x13PredictBatchRequest\x12\x15\n\rfacility_name\x18\x01 \x01(\t\x12&\n\x04rows\x18\x02 \x03(\x0b\x32\x18.esgReporting.PredictRow\"B\n\x14PredictBatchResponse\x12\x15\n\rmodel_version\x18\x01 \x01(\t\x12\x13\n\x0bpredictions\x18\x02 \x03(\x01\"[\n\x11TrainBatchRequest\x12\x16\n\x0e\x66\x61\x63ility_names\x18\x01 \x03(\t\x12\n\n\x02lr\x18\x02 \x01(\x01\x12\r\n\x05\x64\x65pth\x18\x03 \x01(\x05\x12\x13\n\x0bincremental\x18\x04 \x01(\x08\"S\n\x0bTuneRequest\x12\x15\n\rfacility_name\x18\x01 \x01(\t\x12\x0b\n\x03lrs\x18\x02 \x03(\x01\x12\x0e\n\x06\x64\x65pths\x18\x03 \x03(\x05\x12\x10\n\x08n_splits\x18\x04 \x01(\x05\"G\n\x08TrainJob\x12\x15\n\rfacility_name\x18\x01 \x01(\t\x12$\n\x03job\x18\x02 \x01(\x0b\x32\x17.esgReporting.JobStatus\":\n\x12TrainBatchResponse\x12$\n\x04jobs\x18\x01 \x03(\x0b\x32\x16.esgReporting.TrainJob\"1\n\x17\x41nnualStatsBatchRequest\x12\x16\n\x0e\x66\x61\x63ility_names\x18\x01 \x03(\t\"K\n\x0e\x41nnualStatsRow\x12\x0c\n\x04year\x18\x01 \x01(\x05\x12+\n\nstats_data\x18\x02 \x01(\x0b\x32\x17.esgReporting.StatsData\"F\n\x18\x41nnualStatsBatchResponse\x12*\n\x04rows\x18\x01 \x03(\x0b\x32\x1c.esgReporting.AnnualStatsRow\"=\n\x10\x42\x65nchmarkRequest\x12\x16\n\x0e\x66\x61\x63ility_names\x18\x01 \x03(\t\x12\x11\n\tvariables\x18\x02 \x03(\t\"\x9d\x02\n\x0fMetricDeviation\x12\x10\n\x08variable\x18\x01 \x01(\t\x12\x11\n\x04mean\x18\x02 \x01(\x01H\x00\x88\x01\x01\x12\x16\n\tbenchmark\x18\x03 \x01(\x01H\x01\x88\x01\x01\x12\x16\n\tdeviation\x18\x04 \x01(\x01H\x02\x88\x01\x01\x12\x1e\n\x11\x64\x65viation_percent\x18\x05 \x01(\x01H\x03\x88\x01\x01\x12\x1c\n\x14underperforming_rows\x18\x06 \x01(\x05\x12\"\n\x15underperforming_share\x18\x07 \x01(\x01H\x04\x88\x01\x01\x42\x07\n\x05_meanB\x0c\n\n_benchmarkB\x0c\n\n_deviationB\x14\n\x12_deviation_percentB\x18\n\x16_underperforming_share\"\x82\x01\n\x11\x46\x61\x63ilityBenchmark\x12\x15\n\rfacility_name\x18\x01 \x01(\t\x12\x0c\n\x04rows\x18\x02 \x01(\x05\x12\x18\n\x10\x62\x65nchmarked_rows\x18\x03 \x01(\x05\x12.\n\x07metrics\x18\x04 \x03(\x0b\x32\x1d.esgReporting.MetricDeviation\"c\n\x11\x42\x65nchmarkResponse\x12\x19\n\x11\x62\x65nchmark_version\x18\x01 \x01(\t\x12\x33\n\nfacilities\x18\x02 \x03(\x0b\x32\x1f.esgReporting.FacilityBenchmark\"\x80\x01\n\x12TrendsBatchRequest\x12\x16\n\x0e\x66\x61\x63ility_names\x18\x01 \x03(\t\x12\x11\n\tvariables\x18\x02 \x03(\t\x12\x0f\n\x07windows\x18\x03 \x03(\x05\x12\x1b\n\x0estable_percent\x18\x04 \x01(\x01H\x00\x88\x01\x01\x42\x11\n\x0f_stable_percent\"\xb2\x01\n\x08TrendRow\x12\x15\n\rfacility_name\x18\x01 \x01(\t\x12\x10\n\x08variable\x18\x02 \x01(\t\x12\x0e\n\x06window\x18\x03 \x01(\x05\x12\x10\n\x08readings\x18\x04 \x01(\x05\x12\x12\n\x05slope\x18\x05 \x01(\x01H\x00\x88\x01\x01\x12\x1b\n\x0e\x63hange_percent\x18\x06 \x01(\x01H\x01\x88\x01\x01\x12\r\n\x05trend\x18\x07 \x01(\tB\x08\n\x06_slopeB\x11\n\x0f_change_percent\"T\n\x13TrendsBatchResponse\x12\x17\n\x0f\x64\x61taset_version\x18\x01 \x01(\t\x12$\n\x04rows\x18\x02 \x03(\x0b\x32\x16.esgReporting.TrendRow2\x84\n\n\x10\x45sgReportService\x12L\n\tUploadCSV\x12\x1e.esgReporting.UploadCSVRequest\x1a\x1f.esgReporting.UploadCSVResponse\x12R\n\x0fUploadCSVStream\x12\x1c.esgReporting.UploadCSVChunk\x1a\x1f.esgReporting.UploadCSVResponse(\x01\x12O\n\nAppendRows\x12\x1f.esgReporting.AppendRowsRequest\x1a .esgReporting.AppendRowsResponse\x12\x64\n\x11GenerateEsgReport\x12&.esgReporting.GenerateEsgReportRequest\x1a\'.esgReporting.GenerateEsgReportResponse\x12\x61\n\x17GenerateEsgReportStream\x12&.esgReporting.GenerateEsgReportRequest\x1a\x1c.esgReporting.EsgReportChunk0\x01\x12\x61\n\x16GenerateEsgReportBatch\x12#.esgReporting.EsgReportBatchRequest\x1a .esgReporting.EsgReportBatchItem0\x01\x12M\n\x12SubmitEsgReportJob\x12\x1e.esgReporting.ReportJobRequest\x1a\x17.esgReporting.JobStatus\x12;\n\x06GetJob\x12\x18.esgReporting.JobRequest\x1a\x17.esgReporting.JobStatus\x12\x41\n\x0cGetJobResult\x12\x18.esgReporting.JobRequest\x1a\x17.esgReporting.JobResult\x12S\n\x0eTrainLgbmBatch\x12\x1f.esgReporting.TrainBatchRequest\x1a .esgReporting.TrainBatchResponse\x12>\n\x08TuneLgbm\x12\x19.esgReporting.TuneRequest\x1a\x17.esgReporting.JobStatus\x12U\n\x0cPredictBatch\x12!.esgReporting.PredictBatchRequest\x1a\".esgReporting.PredictBatchResponse\x12\x64\n\x13GetAnnualStatsBatch\x12%.esgReporting.AnnualStatsBatchRequest\x1a&.esgReporting.AnnualStatsBatchResponse\x12Y\n\x16GetBenchmarkComparison\x12\x1e.esgReporting.BenchmarkRequest\x1a\x1f.esgReporting.BenchmarkResponse\x12U\n\x0eGetTrendsBatch\x12 .esgReporting.TrendsBatchRequest\x1a!.esgReporting.TrendsBatchResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -33,14 +33,70 @@ if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
   _globals['_UPLOADCSVREQUEST']._serialized_start=38
   _globals['_UPLOADCSVREQUEST']._serialized_end=78
-  _globals['_UPLOADCSVRESPONSE']._serialized_start=80
-  _globals['_UPLOADCSVRESPONSE']._serialized_end=132
-  _globals['_GENERATEESGREPORTREQUEST']._serialized_start=134
-  _globals['_GENERATEESGREPORTREQUEST']._serialized_end=183
-  _globals['_STATSDATA']._serialized_start=186
-  _globals['_STATSDATA']._serialized_end=498
-  _globals['_GENERATEESGREPORTRESPONSE']._serialized_start=500
-  _globals['_GENERATEESGREPORTRESPONSE']._serialized_end=592
-  _globals['_ESGREPORTSERVICE']._serialized_start=595
-  _globals['_ESGREPORTSERVICE']._serialized_end=793
+  _globals['_UPLOADCSVCHUNK']._serialized_start=80
+  _globals['_UPLOADCSVCHUNK']._serialized_end=110
+  _globals['_UPLOADCSVRESPONSE']._serialized_start=112
+  _globals['_UPLOADCSVRESPONSE']._serialized_end=164
+  _globals['_READING']._serialized_start=167
+  _globals['_READING']._serialized_end=641
+  _globals['_APPENDROWSREQUEST']._serialized_start=643
+  _globals['_APPENDROWSREQUEST']._serialized_end=699
+  _globals['_APPENDROWSRESPONSE']._serialized_start=701
+  _globals['_APPENDROWSRESPONSE']._serialized_end=785
+  _globals['_GENERATEESGREPORTREQUEST']._serialized_start=787
+  _globals['_GENERATEESGREPORTREQUEST']._serialized_end=836
+  _globals['_STATSDATA']._serialized_start=839
+  _globals['_STATSDATA']._serialized_end=1151
+  _globals['_GENERATEESGREPORTRESPONSE']._serialized_start=1153
+  _globals['_GENERATEESGREPORTRESPONSE']._serialized_end=1245
+  _globals['_ESGREPORTCHUNK']._serialized_start=1247
+  _globals['_ESGREPORTCHUNK']._serialized_end=1337
+  _globals['_ESGREPORTBATCHREQUEST']._serialized_start=1339
+  _globals['_ESGREPORTBATCHREQUEST']._serialized_end=1449
+  _globals['_ESGREPORTBATCHITEM']._serialized_start=1451
+  _globals['_ESGREPORTBATCHITEM']._serialized_end=1574
+  _globals['_REPORTJOBREQUEST']._serialized_start=1576
+  _globals['_REPORTJOBREQUEST']._serialized_end=1655
+  _globals['_JOBREQUEST']._serialized_start=1657
+  _globals['_JOBREQUEST']._serialized_end=1685
+  _globals['_JOBSTATUS']._serialized_start=1687
+  _globals['_JOBSTATUS']._serialized_end=1807
+  _globals['_JOBRESULT']._serialized_start=1810
+  _globals['_JOBRESULT']._serialized_end=1945
+  _globals['_PREDICTROW']._serialized_start=1947
+  _globals['_PREDICTROW']._serialized_end=2060
+  _globals['_PREDICTBATCHREQUEST']._serialized_start=2062
+  _globals['_PREDICTBATCHREQUEST']._serialized_end=2146
+  _globals['_PREDICTBATCHRESPONSE']._serialized_start=2148
+  _globals['_PREDICTBATCHRESPONSE']._serialized_end=2214
+  _globals['_TRAINBATCHREQUEST']._serialized_start=2216
+  _globals['_TRAINBATCHREQUEST']._serialized_end=2307
+  _globals['_TUNEREQUEST']._serialized_start=2309
+  _globals['_TUNEREQUEST']._serialized_end=2392
+  _globals['_TRAINJOB']._serialized_start=2394
+  _globals['_TRAINJOB']._serialized_end=2465
+  _globals['_TRAINBATCHRESPONSE']._serialized_start=2467
+  _globals['_TRAINBATCHRESPONSE']._serialized_end=2525
+  _globals['_ANNUALSTATSBATCHREQUEST']._serialized_start=2527
+  _globals['_ANNUALSTATSBATCHREQUEST']._serialized_end=2576
+  _globals['_ANNUALSTATSROW']._serialized_start=2578
+  _globals['_ANNUALSTATSROW']._serialized_end=2653
+  _globals['_ANNUALSTATSBATCHRESPONSE']._serialized_start=2655
+  _globals['_ANNUALSTATSBATCHRESPONSE']._serialized_end=2725
+  _globals['_BENCHMARKREQUEST']._serialized_start=2727
+  _globals['_BENCHMARKREQUEST']._serialized_end=2788
+  _globals['_METRICDEVIATION']._serialized_start=2791
+  _globals['_METRICDEVIATION']._serialized_end=3076
+  _globals['_FACILITYBENCHMARK']._serialized_start=3079
+  _globals['_FACILITYBENCHMARK']._serialized_end=3209
+  _globals['_BENCHMARKRESPONSE']._serialized_start=3211
+  _globals['_BENCHMARKRESPONSE']._serialized_end=3310
+  _globals['_TRENDSBATCHREQUEST']._serialized_start=3313
+  _globals['_TRENDSBATCHREQUEST']._serialized_end=3441
+  _globals['_TRENDROW']._serialized_start=3444
+  _globals['_TRENDROW']._serialized_end=3622
+  _globals['_TRENDSBATCHRESPONSE']._serialized_start=3624
+  _globals['_TRENDSBATCHRESPONSE']._serialized_end=3708
+  _globals['_ESGREPORTSERVICE']._serialized_start=3711
+  _globals['_ESGREPORTSERVICE']._serialized_end=4995
 # @@protoc_insertion_point(module_scope)
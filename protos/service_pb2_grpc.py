@@ -39,11 +39,76 @@ class EsgReportServiceStub(object):
                 request_serializer=protos_dot_service__pb2.UploadCSVRequest.SerializeToString,
                 response_deserializer=protos_dot_service__pb2.UploadCSVResponse.FromString,
                 _registered_method=True)
+        self.UploadCSVStream = channel.stream_unary(
+                '/esgReporting.EsgReportService/UploadCSVStream',
+                request_serializer=protos_dot_service__pb2.UploadCSVChunk.SerializeToString,
+                response_deserializer=protos_dot_service__pb2.UploadCSVResponse.FromString,
+                _registered_method=True)
+        self.AppendRows = channel.unary_unary(
+                '/esgReporting.EsgReportService/AppendRows',
+                request_serializer=protos_dot_service__pb2.AppendRowsRequest.SerializeToString,
+                response_deserializer=protos_dot_service__pb2.AppendRowsResponse.FromString,
+                _registered_method=True)
         self.GenerateEsgReport = channel.unary_unary(
                 '/esgReporting.EsgReportService/GenerateEsgReport',
                 request_serializer=protos_dot_service__pb2.GenerateEsgReportRequest.SerializeToString,
                 response_deserializer=protos_dot_service__pb2.GenerateEsgReportResponse.FromString,
                 _registered_method=True)
+        self.GenerateEsgReportStream = channel.unary_stream(
+                '/esgReporting.EsgReportService/GenerateEsgReportStream',
+                request_serializer=protos_dot_service__pb2.GenerateEsgReportRequest.SerializeToString,
+                response_deserializer=protos_dot_service__pb2.EsgReportChunk.FromString,
+                _registered_method=True)
+        self.GenerateEsgReportBatch = channel.unary_stream(
+                '/esgReporting.EsgReportService/GenerateEsgReportBatch',
+                request_serializer=protos_dot_service__pb2.EsgReportBatchRequest.SerializeToString,
+                response_deserializer=protos_dot_service__pb2.EsgReportBatchItem.FromString,
+                _registered_method=True)
+        self.SubmitEsgReportJob = channel.unary_unary(
+                '/esgReporting.EsgReportService/SubmitEsgReportJob',
+                request_serializer=protos_dot_service__pb2.ReportJobRequest.SerializeToString,
+                response_deserializer=protos_dot_service__pb2.JobStatus.FromString,
+                _registered_method=True)
+        self.GetJob = channel.unary_unary(
+                '/esgReporting.EsgReportService/GetJob',
+                request_serializer=protos_dot_service__pb2.JobRequest.SerializeToString,
+                response_deserializer=protos_dot_service__pb2.JobStatus.FromString,
+                _registered_method=True)
+        self.GetJobResult = channel.unary_unary(
+                '/esgReporting.EsgReportService/GetJobResult',
+                request_serializer=protos_dot_service__pb2.JobRequest.SerializeToString,
+                response_deserializer=protos_dot_service__pb2.JobResult.FromString,
+                _registered_method=True)
+        self.TrainLgbmBatch = channel.unary_unary(
+                '/esgReporting.EsgReportService/TrainLgbmBatch',
+                request_serializer=protos_dot_service__pb2.TrainBatchRequest.SerializeToString,
+                response_deserializer=protos_dot_service__pb2.TrainBatchResponse.FromString,
+                _registered_method=True)
+        self.TuneLgbm = channel.unary_unary(
+                '/esgReporting.EsgReportService/TuneLgbm',
+                request_serializer=protos_dot_service__pb2.TuneRequest.SerializeToString,
+                response_deserializer=protos_dot_service__pb2.JobStatus.FromString,
+                _registered_method=True)
+        self.PredictBatch = channel.unary_unary(
+                '/esgReporting.EsgReportService/PredictBatch',
+                request_serializer=protos_dot_service__pb2.PredictBatchRequest.SerializeToString,
+                response_deserializer=protos_dot_service__pb2.PredictBatchResponse.FromString,
+                _registered_method=True)
+        self.GetAnnualStatsBatch = channel.unary_unary(
+                '/esgReporting.EsgReportService/GetAnnualStatsBatch',
+                request_serializer=protos_dot_service__pb2.AnnualStatsBatchRequest.SerializeToString,
+                response_deserializer=protos_dot_service__pb2.AnnualStatsBatchResponse.FromString,
+                _registered_method=True)
+        self.GetBenchmarkComparison = channel.unary_unary(
+                '/esgReporting.EsgReportService/GetBenchmarkComparison',
+                request_serializer=protos_dot_service__pb2.BenchmarkRequest.SerializeToString,
+                response_deserializer=protos_dot_service__pb2.BenchmarkResponse.FromString,
+                _registered_method=True)
+        self.GetTrendsBatch = channel.unary_unary(
+                '/esgReporting.EsgReportService/GetTrendsBatch',
+                request_serializer=protos_dot_service__pb2.TrendsBatchRequest.SerializeToString,
+                response_deserializer=protos_dot_service__pb2.TrendsBatchResponse.FromString,
+                _registered_method=True)
 
 
 class EsgReportServiceServicer(object):
@@ -55,12 +120,90 @@ class EsgReportServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def UploadCSVStream(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def AppendRows(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def GenerateEsgReport(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def GenerateEsgReportStream(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GenerateEsgReportBatch(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def SubmitEsgReportJob(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetJob(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetJobResult(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def TrainLgbmBatch(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def TuneLgbm(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def PredictBatch(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetAnnualStatsBatch(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetBenchmarkComparison(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetTrendsBatch(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_EsgReportServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -69,11 +212,76 @@ def add_EsgReportServiceServicer_to_server(servicer, server):
                     request_deserializer=protos_dot_service__pb2.UploadCSVRequest.FromString,
                     response_serializer=protos_dot_service__pb2.UploadCSVResponse.SerializeToString,
             ),
+            'UploadCSVStream': grpc.stream_unary_rpc_method_handler(
+                    servicer.UploadCSVStream,
+                    request_deserializer=protos_dot_service__pb2.UploadCSVChunk.FromString,
+                    response_serializer=protos_dot_service__pb2.UploadCSVResponse.SerializeToString,
+            ),
+            'AppendRows': grpc.unary_unary_rpc_method_handler(
+                    servicer.AppendRows,
+                    request_deserializer=protos_dot_service__pb2.AppendRowsRequest.FromString,
+                    response_serializer=protos_dot_service__pb2.AppendRowsResponse.SerializeToString,
+            ),
             'GenerateEsgReport': grpc.unary_unary_rpc_method_handler(
                     servicer.GenerateEsgReport,
                     request_deserializer=protos_dot_service__pb2.GenerateEsgReportRequest.FromString,
                     response_serializer=protos_dot_service__pb2.GenerateEsgReportResponse.SerializeToString,
             ),
+            'GenerateEsgReportStream': grpc.unary_stream_rpc_method_handler(
+                    servicer.GenerateEsgReportStream,
+                    request_deserializer=protos_dot_service__pb2.GenerateEsgReportRequest.FromString,
+                    response_serializer=protos_dot_service__pb2.EsgReportChunk.SerializeToString,
+            ),
+            'GenerateEsgReportBatch': grpc.unary_stream_rpc_method_handler(
+                    servicer.GenerateEsgReportBatch,
+                    request_deserializer=protos_dot_service__pb2.EsgReportBatchRequest.FromString,
+                    response_serializer=protos_dot_service__pb2.EsgReportBatchItem.SerializeToString,
+            ),
+            'SubmitEsgReportJob': grpc.unary_unary_rpc_method_handler(
+                    servicer.SubmitEsgReportJob,
+                    request_deserializer=protos_dot_service__pb2.ReportJobRequest.FromString,
+                    response_serializer=protos_dot_service__pb2.JobStatus.SerializeToString,
+            ),
+            'GetJob': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetJob,
+                    request_deserializer=protos_dot_service__pb2.JobRequest.FromString,
+                    response_serializer=protos_dot_service__pb2.JobStatus.SerializeToString,
+            ),
+            'GetJobResult': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetJobResult,
+                    request_deserializer=protos_dot_service__pb2.JobRequest.FromString,
+                    response_serializer=protos_dot_service__pb2.JobResult.SerializeToString,
+            ),
+            'TrainLgbmBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.TrainLgbmBatch,
+                    request_deserializer=protos_dot_service__pb2.TrainBatchRequest.FromString,
+                    response_serializer=protos_dot_service__pb2.TrainBatchResponse.SerializeToString,
+            ),
+            'TuneLgbm': grpc.unary_unary_rpc_method_handler(
+                    servicer.TuneLgbm,
+                    request_deserializer=protos_dot_service__pb2.TuneRequest.FromString,
+                    response_serializer=protos_dot_service__pb2.JobStatus.SerializeToString,
+            ),
+            'PredictBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.PredictBatch,
+                    request_deserializer=protos_dot_service__pb2.PredictBatchRequest.FromString,
+                    response_serializer=protos_dot_service__pb2.PredictBatchResponse.SerializeToString,
+            ),
+            'GetAnnualStatsBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetAnnualStatsBatch,
+                    request_deserializer=protos_dot_service__pb2.AnnualStatsBatchRequest.FromString,
+                    response_serializer=protos_dot_service__pb2.AnnualStatsBatchResponse.SerializeToString,
+            ),
+            'GetBenchmarkComparison': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetBenchmarkComparison,
+                    request_deserializer=protos_dot_service__pb2.BenchmarkRequest.FromString,
+                    response_serializer=protos_dot_service__pb2.BenchmarkResponse.SerializeToString,
+            ),
+            'GetTrendsBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetTrendsBatch,
+                    request_deserializer=protos_dot_service__pb2.TrendsBatchRequest.FromString,
+                    response_serializer=protos_dot_service__pb2.TrendsBatchResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'esgReporting.EsgReportService', rpc_method_handlers)
@@ -112,6 +320,60 @@ class EsgReportService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def UploadCSVStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(
+            request_iterator,
+            target,
+            '/esgReporting.EsgReportService/UploadCSVStream',
+            protos_dot_service__pb2.UploadCSVChunk.SerializeToString,
+            protos_dot_service__pb2.UploadCSVResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def AppendRows(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/esgReporting.EsgReportService/AppendRows',
+            protos_dot_service__pb2.AppendRowsRequest.SerializeToString,
+            protos_dot_service__pb2.AppendRowsResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def GenerateEsgReport(request,
             target,
@@ -138,3 +400,300 @@ class EsgReportService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def GenerateEsgReportStream(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/esgReporting.EsgReportService/GenerateEsgReportStream',
+            protos_dot_service__pb2.GenerateEsgReportRequest.SerializeToString,
+            protos_dot_service__pb2.EsgReportChunk.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GenerateEsgReportBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/esgReporting.EsgReportService/GenerateEsgReportBatch',
+            protos_dot_service__pb2.EsgReportBatchRequest.SerializeToString,
+            protos_dot_service__pb2.EsgReportBatchItem.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def SubmitEsgReportJob(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/esgReporting.EsgReportService/SubmitEsgReportJob',
+            protos_dot_service__pb2.ReportJobRequest.SerializeToString,
+            protos_dot_service__pb2.JobStatus.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetJob(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/esgReporting.EsgReportService/GetJob',
+            protos_dot_service__pb2.JobRequest.SerializeToString,
+            protos_dot_service__pb2.JobStatus.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetJobResult(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/esgReporting.EsgReportService/GetJobResult',
+            protos_dot_service__pb2.JobRequest.SerializeToString,
+            protos_dot_service__pb2.JobResult.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def TrainLgbmBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/esgReporting.EsgReportService/TrainLgbmBatch',
+            protos_dot_service__pb2.TrainBatchRequest.SerializeToString,
+            protos_dot_service__pb2.TrainBatchResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def TuneLgbm(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/esgReporting.EsgReportService/TuneLgbm',
+            protos_dot_service__pb2.TuneRequest.SerializeToString,
+            protos_dot_service__pb2.JobStatus.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def PredictBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/esgReporting.EsgReportService/PredictBatch',
+            protos_dot_service__pb2.PredictBatchRequest.SerializeToString,
+            protos_dot_service__pb2.PredictBatchResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetAnnualStatsBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/esgReporting.EsgReportService/GetAnnualStatsBatch',
+            protos_dot_service__pb2.AnnualStatsBatchRequest.SerializeToString,
+            protos_dot_service__pb2.AnnualStatsBatchResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetBenchmarkComparison(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/esgReporting.EsgReportService/GetBenchmarkComparison',
+            protos_dot_service__pb2.BenchmarkRequest.SerializeToString,
+            protos_dot_service__pb2.BenchmarkResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetTrendsBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/esgReporting.EsgReportService/GetTrendsBatch',
+            protos_dot_service__pb2.TrendsBatchRequest.SerializeToString,
+            protos_dot_service__pb2.TrendsBatchResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -1,9 +1,65 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
 import pandas as pd
-from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.config import Settings
-from transformers import AutoTokenizer, AutoModelForCausalLM
-import torch
+
+from features import season_from_dates
+from embedding_cache import EmbeddingCache, embedding_key
+from vector_index import make_backend, chunk_metadata, date_keys
+from generation import GenerationScheduler, GenerationRequest
+
+# sentence_transformers, chromadb, transformers and torch are imported when first used: importing them (and
+# loading the models) takes a long time and a lot of memory, so it is only done when a question is asked,
+# or in a background warm-up.
+
+RAG_EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", 64))       # Chunks per embedding model call
+RAG_INSERT_BATCH_SIZE = int(os.getenv("RAG_INSERT_BATCH_SIZE", 1000))    # Chunks per ChromaDB add/get call
+DOC_CHUNK_SIZE = 500                                                     # Characters per document chunk
+
+# Every prompt starts with this preamble: its KV cache is computed once and shared, see generation.py
+PROMPT_PREFIX = """
+You are an assistant answering questions about CO₂ capture.
+
+Context:
+"""
+
+# Csv column → label in the record text, in order
+RECORD_FIELDS = [
+    ("co2_emitted_tonnes", "CO2 Emitted: ", " tonnes"),
+    ("co2_captured_tonnes", "CO2 Captured: ", " tonnes"),
+    ("co2_stored_tonnes", "CO2 Stored: ", " tonnes"),
+    ("capture_efficiency_percent", "Capture Efficiency: ", "%"),
+    ("storage_integrity_percent", "Storage Integrity: ", "%"),
+    ("anomaly_flag", "Anomaly: ", ""),
+    ("notes", "Notes: ", ""),
+    ("season", "Season: ", ""),
+]
+
+
+def record_texts(df: pd.DataFrame) -> pd.Series:
+    """One descriptive text per csv row, built column by column (same text as formatting each row)."""
+    if "season" not in df.columns:
+        df = df.assign(season=season_from_dates(df["date"]))            # Uploaded csvs have no season column
+    text = lambda col: df[col].astype(str)
+    records = (
+        "Date: " + text("date") + " | Facility: " + text("facility_name") + " (" + text("facility_id") + ") "
+        + "in " + text("region") + ", " + text("country") + " | Storage Type: " + text("storage_site_type")
+    )
+    for col, label, unit in RECORD_FIELDS:
+        records = records + " | " + label + text(col) + unit
+    return records
+
+
+def chunk_id(text: str) -> str:
+    """Content hash: an unchanged chunk keeps its id, so re-indexing skips it."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def batches(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
 
 
 class RAGPipeline:
@@ -13,6 +69,7 @@ class RAGPipeline:
         llm_model_name: str = "microsoft/phi-3-mini-128k-instruct",
         db_path: str = "./chroma_db",
         device: str = "cpu",  # or "cuda" if GPU is available
+        embedding_cache: EmbeddingCache | None = None,
     ):
         """
         Initialize RAG pipeline whith,
@@ -20,104 +77,181 @@ class RAGPipeline:
         Sentence embeddings with MiniLM
         Local ChromaDB vector database
         Local Phi-3-mini-128k LLM
+
+        Nothing is loaded here: each part is loaded on first use (or by warm_up), once, even with concurrent requests.
         """
+        self.embedding_model_name = embedding_model_name
+        self.llm_model_name = llm_model_name
+        self.db_path = db_path
         self.device = device
-        self.embedder = SentenceTransformer(embedding_model_name)
-
-        # ChromaDB setup
-        settings = Settings(persist_directory=db_path)
-        self.client = chromadb.Client(settings)
-
-        # Create or get collection
-        collections = self.client.list_collections()
-        if "co2_rag" in [c.name for c in collections]:
-            self.collection = self.client.get_collection("co2_rag")
-        else:
-            self.collection = self.client.create_collection("co2_rag")
-
-        # Load local LLM
-        self.tokenizer = AutoTokenizer.from_pretrained(llm_model_name)
-        self.model = AutoModelForCausalLM.from_pretrained(llm_model_name)
-        self.model.to(self.device)
-        self.model.eval()
-
-    def load_data(self, csv_path: str, doc_path: str):
+        self.embedding_cache = embedding_cache or EmbeddingCache()
+        self.backend = make_backend(lambda: self.collection)            # RAG_VECTOR_BACKEND: ChromaDB or the local index
+        self.scheduler = GenerationScheduler(lambda: self.llm, PROMPT_PREFIX, device)   # Batches concurrent questions
+
+        self._embedder = None
+        self._collection = None
+        self._llm = None                                                 # (tokenizer, model)
+        self._embedder_lock = threading.Lock()
+        self._collection_lock = threading.Lock()
+        self._llm_lock = threading.Lock()
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            with self._embedder_lock:
+                if self._embedder is None:
+                    from sentence_transformers import SentenceTransformer
+                    print(f"Loading embedding model {self.embedding_model_name}")
+                    self._embedder = SentenceTransformer(self.embedding_model_name, device=self.device)
+        return self._embedder
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            with self._collection_lock:
+                if self._collection is None:
+                    import chromadb
+                    # ChromaDB setup, kept on disk so indexed chunks survive restarts
+                    client = chromadb.PersistentClient(path=self.db_path)
+                    self._collection = client.get_or_create_collection("co2_rag")
+        return self._collection
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            with self._llm_lock:
+                if self._llm is None:
+                    from transformers import AutoTokenizer, AutoModelForCausalLM
+                    print(f"Loading LLM {self.llm_model_name}")
+                    tokenizer = AutoTokenizer.from_pretrained(self.llm_model_name)
+                    model = AutoModelForCausalLM.from_pretrained(self.llm_model_name)
+                    model.to(self.device)
+                    model.eval()
+                    self._llm = (tokenizer, model)
+        return self._llm
+
+    @property
+    def tokenizer(self):
+        return self.llm[0]
+
+    @property
+    def model(self):
+        return self.llm[1]
+
+    def warm_up(self, background: bool = True) -> threading.Thread | None:
+        """Loads the embedder and the LLM now, by default in a background thread."""
+        def load():
+            try:
+                for part in ("embedder", "llm"):
+                    getattr(self, part)
+            except Exception as e:
+                print(f"RAG warm-up failed: {e}")
+            else:
+                print("RAG models loaded")
+
+        if not background:
+            load()
+            return None
+        thread = threading.Thread(target=load, name="rag-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """Embeddings of texts, one row each. Texts embedded before are read from the cache, not encoded again."""
+        keys = [embedding_key(self.embedding_model_name, text) for text in texts]
+        cached = self.embedding_cache.get_many(keys)
+        missing = {key: text for key, text in zip(keys, texts) if key not in cached}
+        if missing:
+            vectors = self.embedder.encode(list(missing.values()), batch_size=RAG_EMBED_BATCH_SIZE, show_progress_bar=False)
+            computed = dict(zip(missing, np.asarray(vectors, dtype=np.float32)))
+            self.embedding_cache.put_many(computed)
+            cached = {**cached, **computed}
+        return np.stack([cached[key] for key in keys]) if keys else np.empty((0, 0), dtype=np.float32)
+
+    def load_data(self, csv_path: str, doc_path: str) -> dict:
         """
         Load CSV and document, create embeddings, and store them in ChromaDB.
+        Only the chunks that are not indexed yet (new or changed rows) are embedded and written;
+        chunks of these sources that are gone from them are deleted. Returns the counts.
         """
         df = pd.read_csv(csv_path)
 
-        # Convert csv rows into descriptive text
-        records = [
-            f"Date: {row['date']} | Facility: {row['facility_name']} ({row['facility_id']}) "
-            f"in {row['region']}, {row['country']} | Storage Type: {row['storage_site_type']} | "
-            f"CO2 Emitted: {row['co2_emitted_tonnes']} tonnes | "
-            f"CO2 Captured: {row['co2_captured_tonnes']} tonnes | "
-            f"CO2 Stored: {row['co2_stored_tonnes']} tonnes | "
-            f"Capture Efficiency: {row['capture_efficiency_percent']}% | "
-            f"Storage Integrity: {row['storage_integrity_percent']}% | "
-            f"Anomaly: {row['anomaly_flag']} | Notes: {row['notes']} | "
-            f"Season: {row['season']}"
-            for _, row in df.iterrows()
+        # Convert csv rows into descriptive text, tagged with their facility and date for filtered retrieval
+        records = record_texts(df).tolist()
+        record_metadatas = [
+            chunk_metadata(csv_path, facility_name, date)
+            for facility_name, date in zip(df["facility_name"].astype(str), date_keys(df["date"]))
         ]
 
         # Load and chunk document
         with open(doc_path, "r", encoding="utf-8") as f:
             doc_text = f.read()
 
-        doc_chunks = [doc_text[i:i+500] for i in range(0, len(doc_text), 500)]
+        doc_chunks = [doc_text[i:i+DOC_CHUNK_SIZE] for i in range(0, len(doc_text), DOC_CHUNK_SIZE)]
+        doc_metadatas = [chunk_metadata(doc_path)] * len(doc_chunks)
 
-        # Combine CSV + document chunks
-        all_chunks = records + doc_chunks
+        counts = {"chunks": 0, "added": 0, "deleted": 0}
+        for source, chunks, metadatas in ((csv_path, records, record_metadatas), (doc_path, doc_chunks, doc_metadatas)):
+            result = self.index_chunks(source, chunks, metadatas)
+            for key in counts:
+                counts[key] += result[key]
+        self.backend.flush()
+        print(f"Indexed {counts['chunks']} chunks: {counts['added']} added, {counts['deleted']} deleted")
+        return counts
 
-        # Create embeddings
-        embeddings = self.embedder.encode(all_chunks, show_progress_bar=False)
+    def index_chunks(self, source: str, chunks: list[str], metadatas: list[dict]) -> dict:
+        """Adds the chunks of one source (file) that are missing from the index, in batches."""
+        by_id = {chunk_id(chunk): (chunk, metadata) for chunk, metadata in zip(chunks, metadatas)}   # Identical chunks are stored once
 
-        # Add to ChromaDB
-        for i, chunk in enumerate(all_chunks):
-            self.collection.add(
-                documents=[chunk],
-                embeddings=[embeddings[i].tolist()],
-                ids=[str(i)]
-            )
+        # STEP 1: Which ids are already indexed (one lookup per batch, no embeddings read)
+        existing = set()
+        for ids in batches(list(by_id), RAG_INSERT_BATCH_SIZE):
+            existing.update(self.backend.existing_ids(ids))
+        missing = [key for key in by_id if key not in existing]
 
-    def retrieve(self, query: str, k: int = 5):
+        # STEP 2: Embed and add only those, batch by batch
+        for ids in batches(missing, RAG_INSERT_BATCH_SIZE):
+            documents = [by_id[key][0] for key in ids]
+            self.backend.add(ids, documents, self.embed(documents), [by_id[key][1] for key in ids])
+
+        # STEP 3: Drop the chunks of this source that are not in it anymore (changed or removed rows)
+        stale = [key for key in self.backend.source_ids(source) if key not in by_id]
+        for ids in batches(stale, RAG_INSERT_BATCH_SIZE):
+            self.backend.delete(ids)
+
+        return {"chunks": len(by_id), "added": len(missing), "deleted": len(stale)}
+
+    def retrieve(self, query: str, k: int = 5, facility_name: str | None = None,
+                 start_date: str | None = None, end_date: str | None = None):
         """
         Retrieve top-k relevant chunks for a query.
+        Optionally only among the rows of one facility and/or dates (dd/mm/yyyy) in start_date..end_date.
         """
-        q_emb = self.embedder.encode([query])[0]
-        results = self.collection.query(
-            query_embeddings=[q_emb.tolist()],
-            n_results=k
-        )
-        return results['documents'][0]
-
-    def answer_question(self, query: str, max_new_tokens: int = 300) -> str:
-        
-        #This will generate a text using a local Phi 3 mini 128k.
-        
-        context = "\n".join(self.retrieve(query))
-        prompt = f"""
-You are an assistant answering questions about CO₂ capture.
+        start = int(date_keys(pd.Series([start_date]))[0]) if start_date else None
+        end = int(date_keys(pd.Series([end_date]))[0]) if end_date else None
+        if 0 in (start, end):
+            raise ValueError("Invalid start_date or end_date format or both. Use ther dd/mm/yyyy format.")
+        q_emb = self.embed([query])[0]
+        return self.backend.query(q_emb, k, facility_name, start, end)
 
-Context:
-{context}
+    def ask(self, query: str, max_new_tokens: int = 300, facility_name: str | None = None,
+            start_date: str | None = None, end_date: str | None = None) -> GenerationRequest:
+        """
+        Queues the question for the local LLM (batched with the questions asked at the same time).
+        The answer is streamed by request.stream(), request.metrics has its queue time and tokens per second.
+        """
+        context = "\n".join(self.retrieve(query, facility_name=facility_name, start_date=start_date, end_date=end_date))
+        suffix = f"""{context}
 
 Question: {query}
 Answer:
 """
+        return self.scheduler.submit(suffix, max_new_tokens)
 
-        # Tokenize and move to device
-        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
-
-        # Generate output
-        with torch.no_grad():
-            outputs = self.model.generate(
-                **inputs,
-                max_new_tokens=max_new_tokens,
-                do_sample=True,
-                temperature=0.7,
-                top_p=0.9
-            )
-
-        return self.tokenizer.decode(outputs[0], skip_special_tokens=True).strip()
+    def answer_question(self, query: str, max_new_tokens: int = 300, facility_name: str | None = None,
+                        start_date: str | None = None, end_date: str | None = None) -> str:
+        
+        #This will generate a text using a local Phi 3 mini 128k.
+        
+        request = self.ask(query, max_new_tokens, facility_name, start_date, end_date)
+        return request.result().strip()
@@ -0,0 +1,125 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# -------------------------------------------------------------------------------------
+# ESG report cache
+# What it does: Keeps the reports generated by Kenja AI, keyed by a hash of what was sent to it (the prompt
+# and model settings, so volatile fields like date_time that are not in the prompt don't count).
+# Entries expire after a TTL, the memory tier drops the least recently used ones when full, and an optional
+# disk tier keeps reports across restarts. Every entry belongs to a dataset version, which is part of its key:
+# a request still on an older snapshot doesn't drop (or get) the reports of the current one. Reports of the
+# older versions are no longer asked for, and leave with the TTL or the LRU.
+
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", 24 * 60 * 60))      # Seconds
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", 256))               # Reports kept in memory
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR") or None                   # Unset = memory only
+
+
+def report_key(request_body: dict) -> str:
+    content = json.dumps(request_body, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class ReportCache:
+
+    def __init__(self, ttl: float = REPORT_CACHE_TTL, max_entries: int = REPORT_CACHE_SIZE, folder: str | None = REPORT_CACHE_DIR):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.folder = folder
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, str], tuple[float, str]] = OrderedDict()   # (version, key) → (expires_at, report)
+        self._lock = threading.Lock()
+
+    def get(self, key: str, version: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get((version, key))
+            if entry is not None:
+                if entry[0] > time.time():
+                    self._entries.move_to_end((version, key))                  # Most recently used
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[(version, key)]
+
+            entry = self._read_disk(key, version)
+            if entry is not None:
+                self._remember((version, key), entry)                          # Promote to memory
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, version: str, report: str):
+        with self._lock:
+            entry = (time.time() + self.ttl, report)
+            self._remember((version, key), entry)
+            self._write_disk(key, version, entry)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._remove_disk(expired_only=False)
+
+    def _remember(self, key: tuple[str, str], entry: tuple[float, str]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)                                  # Least recently used
+
+    # Disk tier: one json file per report, named <dataset version>-<key>.json. Expired files (of any version)
+    # are removed when a report is written, by their modification time (written at expires_at - ttl).
+
+    def _disk_path(self, key: str, version: str) -> str:
+        return os.path.join(self.folder, f"{version}-{key}.json")
+
+    def _read_disk(self, key: str, version: str) -> tuple[float, str] | None:
+        if self.folder is None:
+            return None
+        path = self._disk_path(key, version)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if saved["expires_at"] <= time.time():
+            self._remove(path)
+            return None
+        return saved["expires_at"], saved["report"]
+
+    def _write_disk(self, key: str, version: str, entry: tuple[float, str]):
+        if self.folder is None:
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        path = self._disk_path(key, version)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"expires_at": entry[0], "report": entry[1]}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._remove_disk(expired_only=True)
+
+    def _remove_disk(self, expired_only: bool):
+        if self.folder is None:
+            return
+        written_before = time.time() - self.ttl
+        for path in glob.glob(os.path.join(self.folder, "*.json")):
+            try:
+                if not expired_only or os.path.getmtime(path) <= written_before:
+                    self._remove(path)
+            except OSError:
+                pass                                                           # Removed by another process
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# One cache per process, shared by the FastAPI app and the gRPC servicer
+report_cache = ReportCache()
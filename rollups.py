@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+
+from ingest import METRIC_COLUMNS
+
+# -------------------------------------------------------------------------------------
+# Range rollups
+# What it does: For one facility (rows sorted by date, anomalies excluded) keeps cumulative sums and counts,
+# and a sparse table for minimums. The totals, means and minimums of ANY date range are then a few array
+# lookups: total = sums[hi] - sums[lo], and the minimum is the smaller of two overlapping power-of-two blocks.
+# Appending rows only computes the entries of the new rows: the arrays grow in place (see GrowableArray).
+
+MIN_METRICS = ["capture_efficiency_percent", "storage_integrity_percent"]   # The metrics we report minimums for
+
+
+def float32_value(value) -> float:
+    """A float32 reading as a Python float with its shortest repr (98.017, not 98.01699829101562)."""
+    return float(str(np.float32(value)))
+
+
+def _cumulative(values: np.ndarray, start=0) -> np.ndarray:
+    # Prefix array with a leading 0, so the sum over [lo, hi) is out[hi] - out[lo]
+    out = np.empty(len(values) + 1, dtype=values.dtype)
+    out[0] = start
+    np.cumsum(values, out=out[1:])
+    out[1:] += start
+    return out
+
+
+class GrowableArray:
+    """
+    A 1-D array that can be extended without copying it. Every extension returns a new GrowableArray that
+    shares the buffer with the old one: the new values are written past the old length, which the old one
+    (used by an older snapshot) never reads. When the buffer is full, or was already extended from this
+    length, the values are copied into a buffer 1.5 times larger instead, so appends are amortized O(new values).
+    """
+
+    __slots__ = ("buffer", "size", "_written")
+
+    def __init__(self, values: np.ndarray):
+        self.buffer = values
+        self.size = len(values)
+        self._written = [self.size]                    # How far the shared buffer is filled
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+    @property
+    def values(self) -> np.ndarray:
+        return self.buffer[:self.size]
+
+    def extended(self, values: np.ndarray) -> "GrowableArray":
+        end = self.size + len(values)
+        buffer, written = self.buffer, self._written
+        if written[0] != self.size or end > len(buffer):
+            buffer = np.empty(max(end, self.size + self.size // 2 + 16), dtype=self.buffer.dtype)
+            buffer[:self.size] = self.values
+            written = [self.size]
+        buffer[self.size:end] = values
+        written[0] = end
+        array = GrowableArray.__new__(GrowableArray)
+        array.buffer, array.size, array._written = buffer, end, written
+        return array
+
+
+def _prefix(prefix: GrowableArray | None, values: np.ndarray) -> GrowableArray:
+    """Prefix array of values, or prefix extended with the cumulative sums of values."""
+    if prefix is None:
+        return GrowableArray(_cumulative(values))
+    return prefix.extended(_cumulative(values, prefix[-1])[1:])
+
+
+class SparseMin:
+    """Sparse table: level k holds the minimum of every block of 2**k values."""
+
+    def __init__(self, values: np.ndarray):
+        self.levels = [GrowableArray(np.asarray(values, dtype=np.float32))]
+        self._build_levels()
+
+    def __len__(self) -> int:
+        return len(self.levels[0])
+
+    def _build_levels(self):
+        # Only fills in the entries missing at the end of each level (all of them on a fresh build)
+        n = len(self)
+        k = 1
+        while (1 << k) <= n:
+            half = 1 << (k - 1)
+            size = n - (1 << k) + 1
+            prev = self.levels[k - 1].values
+            if k < len(self.levels):
+                start = len(self.levels[k])
+                self.levels[k] = self.levels[k].extended(np.minimum(prev[start:size], prev[start + half:size + half]))
+            else:
+                self.levels.append(GrowableArray(np.minimum(prev[:size], prev[half:size + half])))
+            k += 1
+
+    def copy(self) -> "SparseMin":
+        table = SparseMin.__new__(SparseMin)
+        table.levels = list(self.levels)               # extend() replaces levels, it never writes into what they can read
+        return table
+
+    def extend(self, values: np.ndarray):
+        self.levels[0] = self.levels[0].extended(np.asarray(values, dtype=np.float32))
+        self._build_levels()
+
+    def query(self, lo: int, hi: int) -> float:
+        """Minimum over [lo, hi). Returns inf for an empty range."""
+        if hi <= lo:
+            return np.inf
+        k = (hi - lo).bit_length() - 1
+        level = self.levels[k].buffer
+        return min(level[lo], level[hi - (1 << k)])
+
+
+class FacilityRollup:
+
+    def __init__(self, rows: pd.DataFrame):
+        self.valid_rows = None
+        self.counts = {col: None for col in METRIC_COLUMNS}
+        self.sums = {col: None for col in METRIC_COLUMNS}
+        self.mins = {col: SparseMin(np.empty(0, dtype=np.float32)) for col in MIN_METRICS}
+        self.extend(rows)
+
+    def __len__(self) -> int:
+        return len(self.valid_rows) - 1
+
+    def extended(self, rows: pd.DataFrame) -> "FacilityRollup":
+        """A new rollup with rows appended. This one is left as is, since older snapshots still use it."""
+        rollup = FacilityRollup.__new__(FacilityRollup)
+        rollup.valid_rows = self.valid_rows
+        rollup.counts, rollup.sums = dict(self.counts), dict(self.sums)
+        rollup.mins = {col: table.copy() for col, table in self.mins.items()}
+        rollup.extend(rows)
+        return rollup
+
+    def extend(self, rows: pd.DataFrame):
+        """Appends rows that come after the existing ones (by date). Existing prefixes are not recomputed."""
+        valid = ~rows["anomaly_flag"].to_numpy(dtype=bool)
+        self.valid_rows = _prefix(self.valid_rows, valid.astype(np.int64))
+        for col in METRIC_COLUMNS:
+            values = rows[col].to_numpy(dtype=np.float64)
+            ok = valid & ~np.isnan(values)
+            self.counts[col] = _prefix(self.counts[col], ok.astype(np.int64))
+            self.sums[col] = _prefix(self.sums[col], np.where(ok, values, 0.0))
+            if col in self.mins:
+                self.mins[col].extend(np.where(ok, values, np.inf))
+
+
+class RangeSummary:
+    """Stats of the rows [lo, hi) of one facility, read from its rollup."""
+
+    def __init__(self, rollup: FacilityRollup, lo: int, hi: int):
+        self.rollup, self.lo, self.hi = rollup, lo, hi
+
+    @property
+    def rows(self) -> int:
+        return int(self.rollup.valid_rows[self.hi] - self.rollup.valid_rows[self.lo])
+
+    @property
+    def empty(self) -> bool:
+        return self.rows == 0
+
+    def count(self, col: str) -> int:
+        return int(self.rollup.counts[col][self.hi] - self.rollup.counts[col][self.lo])
+
+    def total(self, col: str) -> float:
+        return float(self.rollup.sums[col][self.hi] - self.rollup.sums[col][self.lo])
+
+    def mean(self, col: str) -> float:
+        count = self.count(col)
+        return self.total(col) / count if count else np.nan
+
+    def minimum(self, col: str) -> float:
+        value = self.rollup.mins[col].query(self.lo, self.hi)
+        return float32_value(value) if np.isfinite(value) else np.nan
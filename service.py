@@ -1,6 +1,7 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Query, Form
 from fastapi import Request
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
 import asyncio
 from pydantic import BaseModel
 import pandas as pd
@@ -11,17 +12,25 @@ from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime, timezone, timedelta
 from typing import Literal, Optional
 import joblib
+import httpx
+import json
+import math
 
 
 #Refactor from modules
-from insights import get_percent_changes, trends, global_bench, annual_stats, stats_by_range
-from kenjaAI import get_esg_report
+from insights import get_percent_changes, trends, global_bench, get_global_performance, annual_stats, annual_stats_table, period_stats
+from benchmarks import benchmark_store, compare_facilities, summarize
+from slopes import trend_cache, select_trends, TREND_STABLE_PERCENT
+from kenjaAI import get_cached_esg_report, stream_cached_esg_report, generate_esg_reports, kenja_client, CircuitOpenError, REPORT_BATCH_CONCURRENCY
 from models import LGBM_regressor
-#from rag import RAGPipeline
+from dataset import store, UPLOAD_CHUNK_SIZE
+from jobs import job_queue, job_status, report_job_key, DONE, FAILED
+from model_registry import model_registry, ModelNotFoundError
+from training import train_facility, submit_training, submit_tuning, shutdown_pool
+from rag import RAGPipeline
 
 
 app = FastAPI(title="ESG Reporting")
-#rag = RAGPipeline()
 
 
 app.add_middleware(
@@ -33,6 +42,13 @@ app.add_middleware(
 )
 
 
+#The Kenja AI connection pool lives as long as the app
+@app.on_event("shutdown")
+async def close_kenja_client():
+    await kenja_client.aclose()
+    shutdown_pool()                                  #Training worker processes
+
+
 
 # Expected format for requests___________________________
 class GlobalInput(BaseModel):
@@ -47,49 +63,63 @@ class GlobalInput(BaseModel):
     co2_stored_tonnes           : float | None = None
     capture_efficiency_percent  : float | None = None
     storage_integrity_percent   : float | None = None
-    #anomaly_flag                :
-
+    anomaly_flag                : bool = False
+    notes                       : str | None = None
 
-data = pd.DataFrame()
-csv_path = None
 
-
-#To set a csv as data___________________
+#To get the current source data___________________
+#The dataset store parses the csv once, and only again when the file changes
 
 def use_csv():
-    global csv_path, data
-    csv_path = fr".\csv_dataset.csv"
-    if os.path.exists(csv_path):
-       data = pd.read_csv(csv_path)
-    else:
-       return {"error": "CSV not found on server. Please check the file name."}
+    snapshot = store.get()
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="CSV not found on server. Please upload a csv first.")
+    return snapshot
 
 
 #To upload the data from frontend AND use it as source data
 @app.post("/upload_csv")
 async def upload_csv(file: UploadFile = File(...)):
-    global file_name, file_path, data
+    global file_name, file_path
      
     #timestamp = datetime.now().astimezone().strftime("%Y-%m-%d_%H-%M-%S_%Z")
     #csv_path = f"./{timestamp}_{file.filename}" #save file to local dir
-    file_name = "csv_dataset.csv"
-    file_path = f"./{file_name}"
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
+    file_path = store.path
+    #Streamed in chunks: each chunk is parsed as it is read, the file is never fully in memory. Saved as columnar files
+    #Parsing and saving run in the thread pool, so other requests are served meanwhile
+    try:
+        with store.begin_upload() as upload:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await run_in_threadpool(upload.write, chunk)
+            snapshot = await run_in_threadpool(upload.commit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid csv: {str(e)}")
     """
     if "anomaly_flag" not in data.columns: #check if the anomaly_flag field even exists
         data["anomaly_flag"] = False
         data.to_csv(csv_path, index=False)
     """
-    return {"status": "success", "message": f"Your csv has been uploaded, and saved to {file_path}"}
+    return {"status": "success", "message": f"Your csv has been uploaded, and saved to {file_path}", "version": snapshot.version, "rows": snapshot.row_count}
+
+#To add new readings (e.g. from the IoT feed) without re-uploading the whole csv
+#Only the new rows are parsed and aggregated, the existing data is extended
+@app.post("/append_rows")
+async def append_rows(rows: list[GlobalInput]):
+    if not rows:
+        raise HTTPException(status_code=400, detail="No rows to append.")
+    try:
+        snapshot = await run_in_threadpool(store.append, pd.DataFrame([row.model_dump() for row in rows]))   #File lock + Arrow writes, off the event loop
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid rows: {str(e)}")
+    return {"status": "success", "message": f"{len(rows)} rows appended to {store.path}", "version": snapshot.version, "rows": snapshot.row_count}
 
 #Get the facility names
 def facility_names():
-    global data, names 
-    if data.empty:
+    snapshot = store.get()
+    if snapshot is None or snapshot.empty:
         return "Set a csv source data first"
     else:
-        names = list(set(data["facility_names"]))
+        names = snapshot.facility_names
         return names 
 
 
@@ -99,30 +129,111 @@ def facility_names():
 async def train_lgbm(facility_name:str, 
                      lr:float = Query(0.05, description="The learning rate. Default value is 0.05."), 
                      depth:int = Query(5, description="Depth for the tree. Controls the number of leaves. Default value is 5."), 
-                     verbosity = Query(-1, description="Use 1 if you need verbose. Default is -1, no verbose.")
+                     verbosity = Query(-1, description="Use 1 if you need verbose. Default is -1, no verbose."),
+                     incremental: bool = Query(False, description="Continue the saved model on the new rows only, instead of training from scratch.")
                      ):#verbose is really nor needed, but use it if you dev
 
-          global data
+          data = use_csv()
+          if facility_name not in data.index:
+                  raise HTTPException(status_code=400, detail=f"Facility '{facility_name}' not found in the dataset.")
 
           try:
-            model, encoders = LGBM_regressor(facility_name, data, lr, depth)
-            if not os.path.exists("saved_models"):
-                os.makedirs("saved_models")
-            file_path =  f"saved_models/{facility_name}_lgbm.pkl"
-            joblib.dump({"model": model, "encoders": encoders}, file_path)
+            # Trained in a worker process (see training.py), so the app keeps serving other requests meanwhile
+            result = await train_facility(facility_name, lr, depth, incremental)
+            file_path = result["path"]
             
-            return f"LGBM model for {facility_name} trained, and saved on server at [{file_path}]"
+            return f"LGBM model for {facility_name} trained ({result['mode']}), and saved on server at [{file_path}]"
 
-          except ValueError as e:
-                  raise HTTPException(status_code= 400, detail = "Bad request. Facility name might be invaid")    
-          except ValueError as e:
-                  raise HTTPException(status_code= 500, detail = f"Unexpected error: {str(e)}")    
+          except ValueError as e:                                    #E.g. no usable rows to train on
+                  raise HTTPException(status_code= 400, detail = f"Bad request: {str(e)}")
 
 
 
     
 
  
+#Train many facilities at once, in parallel worker processes. Returns a job per facility: poll /jobs/{job_id}
+class TrainBatchInput(BaseModel):
+    facility_names  : list[str] | None = None          #Default: every facility in the data
+    lr              : float = 0.05
+    depth           : int = 5
+    incremental     : bool = False                     #Continue the saved models on the new rows only
+
+
+@app.post("/train_lgbm_batch")
+async def train_lgbm_batch(request: TrainBatchInput):
+    data = use_csv()
+    facility_names = request.facility_names or data.facility_names
+    missing = [name for name in facility_names if name not in data.index]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Facility '{missing[0]}' not found in the dataset.")
+
+    submitted = submit_training(facility_names, data.version, request.lr, request.depth, request.incremental)
+    return {"jobs": [
+        {"facility_name": name, "job_id": job["id"], "status": job["status"], "deduplicated": deduplicated}
+        for name, (job, deduplicated) in zip(facility_names, submitted)
+    ]}
+
+
+
+#Hyperparameter search for one facility: time-series cross-validation over an lr/depth grid, with early stopping
+#Runs as a job (poll /jobs/{job_id}). The result has the per-fold scores and timings, the best config, and the model trained with it
+class TuneInput(BaseModel):
+    facility_name   : str
+    lrs             : list[float] | None = None        #Default: training.TUNE_LRS
+    depths          : list[int] | None = None          #Default: training.TUNE_DEPTHS
+    n_splits        : int = 5
+
+
+@app.post("/tune_lgbm")
+async def tune_lgbm(request: TuneInput):
+    data = use_csv()
+    if request.facility_name not in data.index:
+        raise HTTPException(status_code=400, detail=f"Facility '{request.facility_name}' not found in the dataset.")
+    if request.n_splits < 2:
+        raise HTTPException(status_code=400, detail="n_splits must be at least 2.")
+
+    job, deduplicated = submit_tuning(request.facility_name, data.version, request.lrs, request.depths, request.n_splits)
+    return {"job_id": job["id"], "status": job["status"], "deduplicated": deduplicated}
+
+
+
+#Predict with a trained model___________________
+#The model is loaded once and kept in memory (see model_registry.py), all rows are scored in one model.predict call
+class PredictRow(BaseModel):
+    co2_emitted_tonnes  : float
+    region              : str
+    storage_site_type   : str
+    season              : str | None = None          #Winter/Spring/Summer/Autumn, or leave it out and give the date
+    date                : str | None = None          #dd/mm/yyyy
+
+
+class PredictInput(BaseModel):
+    facility_name   : str
+    rows            : list[PredictRow]
+
+
+@app.post("/predict_batch")
+async def predict_batch(request: PredictInput):
+    try:
+        model = model_registry.get(request.facility_name)
+    except ModelNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    rows = pd.DataFrame([row.model_dump() for row in request.rows], columns=list(PredictRow.model_fields))
+    try:
+        predictions = model.predict(rows)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "facility_name": request.facility_name,
+        "model_version": model.version,
+        "target": "co2_captured_tonnes",
+        "predictions": predictions.tolist(),
+    }
+
+
+
 #ESG insights for the data. This can use a number of metrics______________________
 @app.get("/get_esg")
 async def get_esg(facility_name: Literal["Alpha CCS Plant", 
@@ -138,14 +249,18 @@ async def get_esg(facility_name: Literal["Alpha CCS Plant",
                                     "capture_efficiency_percent"]
                   ):
 
-    global data, file_path
-    use_csv()
+    data = use_csv()
     match report_type:
           case "Percent changes":
               return get_percent_changes(facility_name, data, variable)
 
           case "Relative performance to global":
-              return get_global_performance(facility_name, data, variable)   
+              try:
+                  return get_global_performance(facility_name, data, variable)
+              except FileNotFoundError:
+                  raise HTTPException(status_code=404, detail="Benchmark file not found on server.")
+              except ValueError as e:
+                  raise HTTPException(status_code=400, detail=str(e))
 
                             
 #Get trends for the data. This can use a number of metrics______________________
@@ -160,25 +275,107 @@ async def get_trends(facility_name: Literal["Alpha CCS Plant",
                                      "capture_efficiency_percent"]
                   ):
 
-    global data, file_path
+    data = use_csv()
     
     report_type ="Percent changes"
     
     return trends(facility_name, data, variable)
 
 
+#Trends of every facility and variable over several windows, in one pass_______________
+#Least-squares slope through the last N readings for each window N; cached per dataset version (see slopes.py)
+@app.get("/get_trends_batch")
+async def get_trends_batch(facility_names: Optional[list[str]] = Query(None, description="Optional. Defaults to every facility in the data"),
+                           variables: Optional[list[str]] = Query(None, description="Optional. Defaults to every metric"),
+                           windows: Optional[list[int]] = Query(None, description="Optional. Number of last readings per fit, e.g. 5, 30, 90"),
+                           stable_percent: float = Query(TREND_STABLE_PERCENT, description="Fitted change (%) under which a trend is Stable")):
+    data = use_csv()
+
+    try:
+        table = select_trends(trend_cache.get(data, windows, stable_percent), facility_names, variables)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    table = table.astype(object).where(table.notna(), None)                 #NaN is not valid json
+    return {
+        "date_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "dataset_version": data.version,
+        "columns": list(table.columns),
+        "rows": table.values.tolist(),
+    }
+
+
 #Get annual metrics for a facility_______________
 """
 
 @app.get("/get_annual_stats")
 def get_annual_stats(facility_name:str):
-    global data, file_path
+    data = use_csv()
 
     return annual_stats(data, facility_name)
 """
 
 
+#Get annual metrics for all (or some) facilities in one pass_______________
+@app.get("/get_annual_stats_batch")
+async def get_annual_stats_batch(facility_names: Optional[list[str]] = Query(None, description="Optional. Defaults to every facility in the data")):
+    data = use_csv()
+
+    try:
+        table = annual_stats_table(data, facility_names)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    table = table.astype(object).where(table.notna(), None)                 #NaN is not valid json
+    return {
+        "date_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "columns": list(table.columns),
+        "rows": table.values.tolist(),
+    }
+
+
+#Compare facilities to the global benchmarks (bench.csv) in one join_______________
+#Per facility: mean value, benchmark and deviation of each variable, and how many readings underperformed
+@app.get("/get_benchmark_comparison")
+async def get_benchmark_comparison(facility_names: Optional[list[str]] = Query(None, description="Optional. Defaults to every facility in the data"),
+                                   variables: Optional[list[str]] = Query(None, description="Optional. Defaults to every metric with a benchmark"),
+                                   include_readings: bool = False):
+    data = use_csv()
+
+    try:
+        bench = benchmark_store.get()
+        compared = compare_facilities(data, bench, facility_names, variables)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Benchmark file not found on server.")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    result = {
+        "date_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "benchmark_version": bench.version,
+        "facilities": summarize(compared, variables or bench.metrics),
+    }
+    if include_readings:                                                     #Every reading with its benchmark, deviation and flag
+        compared = compared.astype(object).where(compared.notna(), None)
+        result["columns"] = list(compared.columns)
+        result["readings"] = compared.values.tolist()
+    return result
+
+
 #Get stats for a given period______________
+#Both are in the annual_stats format, which is what the report prompt reads. Raises HTTPException(400) on bad input
+def report_stats(data, facility_name: str, start_date: Optional[str], end_date: Optional[str], annual: bool) -> dict:
+    try:
+        if annual or (not start_date and not end_date):
+            return annual_stats(data, facility_name) #Return this, if the annual flag is on
+        stats = period_stats(data, [facility_name], start_date, end_date)[0]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if stats["rows"] == 0:
+        raise HTTPException(status_code=400, detail=f"No data available for {facility_name} between {start_date} and {end_date}")
+    return json_safe(stats)
+
+
 @app.get("/generate_esg_report")
 async def generate_esg_report(
                         facility_name: str,
@@ -188,26 +385,141 @@ async def generate_esg_report(
                       ):
     print("Generating esg report...")
 
-    global data, file_path
-    use_csv()
-    stats_data = {}
-    if annual or (not start_date and not end_date):
-        stats_data =  annual_stats(data, facility_name) #Return this, if the annual flag is on
-    else:
-        stats_data = stats_by_range(data, facility_name, start_date, end_date)
+    data = use_csv()
+    stats_data = report_stats(data, facility_name, start_date, end_date, annual)
 
-    esg_report = await get_esg_report(stats_data)
+    try:
+        esg_report = await get_cached_esg_report(stats_data, data.version)   #Reused if the same stats were already reported
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Kenja AI request failed: {str(e)}")
     return {
         "esg_report": esg_report,
         "stats_data": stats_data
     }
-    
 
 
+#Same report, streamed as Server-Sent Events: the stats are sent right away, then the report text as it is generated
+#Events: "stats" (the stats_data json), "report" (a piece of the markdown, as a json string), then "done" or "error"
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@app.get("/generate_esg_report_stream")
+async def generate_esg_report_stream(
+                        facility_name: str,
+                        start_date: Optional[str] = Query(None, description="Optional, but must be in dd/mm/yyyy"),
+                        end_date: Optional[str] = Query(None, description="Optional, but must be in dd/mm/yyyy"),
+                        annual: bool = True
+                      ):
+    print("Streaming esg report...")
+
+    data = use_csv()
+    stats_data = report_stats(data, facility_name, start_date, end_date, annual)
+
+    async def events():
+        yield sse_event("stats", stats_data)
+        try:
+            async for text in stream_cached_esg_report(stats_data, data.version):
+                yield sse_event("report", text)
+        except (CircuitOpenError, httpx.HTTPError) as e:
+            yield sse_event("error", {"detail": f"Kenja AI request failed: {str(e)}"})
+            return
+        yield sse_event("done", {})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},   #No buffering in proxies, or the stream arrives at once
+    )
+
+
+#Reports for many facilities at once (e.g. every facility for a quarter)___________________
+#The stats of all facilities are computed in one pass, then the reports are generated concurrently (max_concurrency at a time)
+#Streamed back as newline-delimited json, one line per facility, in the order the reports complete
+class BatchReportInput(BaseModel):
+    facility_names  : list[str] | None = None          #Default: every facility in the data
+    start_date      : str | None = None                #dd/mm/yyyy. Without dates: the last year, like /generate_esg_report
+    end_date        : str | None = None
+    max_concurrency : int = REPORT_BATCH_CONCURRENCY
+
+
+def json_safe(stats: dict) -> dict:
+    return {key: None if isinstance(value, float) and math.isnan(value) else value for key, value in stats.items()}   #NaN is not valid json
 
-"""
 
+@app.post("/generate_esg_report_batch")
+async def generate_esg_report_batch(batch: BatchReportInput):
+    print("Generating esg report batch...")
 
+    data = use_csv()
+    try:
+        payloads = period_stats(data, batch.facility_names, batch.start_date, batch.end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def lines():
+        async for stats_data, esg_report, error in generate_esg_reports(payloads, data.version, batch.max_concurrency):
+            item = {"facility_name": stats_data["facility_name"], "esg_report": esg_report, "stats_data": json_safe(stats_data)}
+            if error:
+                item["error"] = error
+            yield json.dumps(item, default=str) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+
+#Report as a background job: submit returns a job id at once, then poll /jobs/{job_id} and fetch /jobs/{job_id}/result
+#Identical requests (same facility, period and dataset version) while a job is running share that job
+class ReportJobInput(BaseModel):
+    facility_name   : str
+    start_date      : str | None = None                #dd/mm/yyyy. Without dates: the last year
+    end_date        : str | None = None
+
+
+@app.post("/jobs/esg_report")
+async def submit_esg_report_job(request: ReportJobInput):
+    data = use_csv()
+    try:
+        found = period_stats(data, [request.facility_name], request.start_date, request.end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not found or found[0]["rows"] == 0:
+        raise HTTPException(status_code=404, detail=f"No data available for facility '{request.facility_name}'.")
+    stats_data = found[0]
+
+    key = report_job_key(request.facility_name, request.start_date, request.end_date, data.version)
+    job, deduplicated = job_queue.submit(key, {"stats_data": stats_data, "version": data.version})
+    return {"job_id": job["id"], "status": job["status"], "deduplicated": deduplicated}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job_status(job)
+
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    if job["status"] == FAILED:
+        raise HTTPException(status_code=502, detail=job["error"])
+    if job["status"] != DONE:
+        return JSONResponse(status_code=202, content=job_status(job))        #Not ready yet, poll again
+    result = dict(job["result"])
+    if "stats_data" in result:                                                #Report job (training jobs return the saved model's info)
+        result["stats_data"] = json_safe(result["stats_data"])
+    return result
+    
+
+
+
+#Questions about the data and the ESG guidelines, answered by the local RAG pipeline (rag.py)_______________
+#The models are loaded on the first question, or at startup in the background with RAG_WARMUP=true
 rag = RAGPipeline(
     embedding_model_name="sentence-transformers/all-MiniLM-L6-v2",
     llm_model_name="microsoft/phi-3-mini-128k-instruct",
@@ -216,16 +528,61 @@ rag = RAGPipeline(
 )
 
 
-@app.get("/get_text_query")
-def get_text_query(query: str = Query(..., description="User question")):
-   
+@app.on_event("startup")
+async def warm_up_rag():
+    if os.getenv("RAG_WARMUP", "false").lower() == "true":
+        rag.warm_up()
+
+
+#Concurrent questions are answered in batches by one generate call (see generation.py)
+#The response includes how long the question waited in the queue, and the tokens per second
+def ask_rag(query: str, facility_name: Optional[str], start_date: Optional[str], end_date: Optional[str]):
     if not query.strip():
         raise HTTPException(status_code=400, detail="Query cannot be empty")
+    try:
+        return rag.ask(query, facility_name=facility_name, start_date=start_date, end_date=end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating answer: {str(e)}")
+
 
+@app.get("/get_text_query")
+def get_text_query(query: str = Query(..., description="User question"),
+                   facility_name: Optional[str] = Query(None, description="Optional. Only use this facility's rows as context"),
+                   start_date: Optional[str] = Query(None, description="Optional, but must be in dd/mm/yyyy"),
+                   end_date: Optional[str] = Query(None, description="Optional, but must be in dd/mm/yyyy")):
+   
+    request = ask_rag(query, facility_name, start_date, end_date)
     try:
-        answer = rag.answer_question(query)
+        answer = request.result().strip()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating answer: {str(e)}")
 
-    return {"query": query, "answer": answer}
-"""
+    return {"query": query, "answer": answer, "metrics": request.metrics}
+
+
+#Same answer, streamed as Server-Sent Events while it is generated
+#Events: "token" (a piece of the answer, as a json string), then "done" (the metrics) or "error"
+@app.get("/get_text_query_stream")
+def get_text_query_stream(query: str = Query(..., description="User question"),
+                          facility_name: Optional[str] = Query(None, description="Optional. Only use this facility's rows as context"),
+                          start_date: Optional[str] = Query(None, description="Optional, but must be in dd/mm/yyyy"),
+                          end_date: Optional[str] = Query(None, description="Optional, but must be in dd/mm/yyyy")):
+
+    request = ask_rag(query, facility_name, start_date, end_date)
+
+    def events():
+        try:
+            for text in request.stream():
+                yield sse_event("token", text)
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Error generating answer: {str(e)}"})
+            return
+        yield sse_event("done", request.metrics)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
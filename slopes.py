@@ -0,0 +1,168 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from ingest import METRIC_COLUMNS
+from dataset import as_snapshot
+
+# -------------------------------------------------------------------------------------
+# Trend slopes
+# What it does: For every facility and metric at once, fits a least-squares line through the last N readings,
+# for a few window sizes N (e.g. the last 5, 30 and 90 readings), and classifies it as Rising, Falling or
+# Stable. The fits are done with a handful of np.bincount sums over the whole table (the dataset is sorted by
+# facility and date, so a facility's readings are one block), not one call per facility and metric.
+# The fits are cached per dataset version and window, so polling dashboards don't recompute them. The trend
+# is classified when read, so the threshold is not part of the cache key.
+
+TREND_WINDOWS = [int(w) for w in os.getenv("TREND_WINDOWS", "5,30,90").split(",")]
+TREND_STABLE_PERCENT = float(os.getenv("TREND_STABLE_PERCENT", 1.0))      # Fitted change over the window, below this: Stable
+TREND_CACHE_SIZE = int(os.getenv("TREND_CACHE_SIZE", 64))                   # (dataset version, window) fits kept in memory
+
+TREND_COLUMNS = ["facility_name", "variable", "window", "readings", "slope", "change_percent", "trend"]
+
+
+def facility_groups(data) -> tuple[list[str], np.ndarray]:
+    """Facility names, and for every row the position of its facility in that list (-1 for rows without one)."""
+    names = data.facility_names
+    group = np.full(data.row_count, -1, dtype=np.int64)
+    for number, name in enumerate(names):
+        lo, hi = data.index.ranges[name]
+        group[lo:hi] = number
+    return names, group
+
+
+def window_slopes(values: np.ndarray, group: np.ndarray, n_groups: int, windows: list[int]) -> dict[int, tuple]:
+    """
+    Least-squares slope (per reading) through the last `window` non-missing values of each group, for each window.
+    Returns window → (readings, slope, mean) arrays, one entry per group. Rows must be sorted by group.
+    """
+    valid = ~np.isnan(values) & (group >= 0)
+    g, y = group[valid], values[valid]
+    count = np.bincount(g, minlength=n_groups)
+    start = np.cumsum(count) - count
+    from_end = count[g] - 1 - (np.arange(len(g)) - start[g])          # 0 = newest reading of its group
+    x = -from_end.astype(np.float64)                                  # Reading number, newest = 0
+
+    results = {}
+    for window in windows:
+        keep = from_end < window
+        gk, xk, yk = g[keep], x[keep], y[keep]
+        n = np.bincount(gk, minlength=n_groups).astype(np.float64)
+        sx = np.bincount(gk, xk, minlength=n_groups)
+        sy = np.bincount(gk, yk, minlength=n_groups)
+        sxx = np.bincount(gk, xk * xk, minlength=n_groups)
+        sxy = np.bincount(gk, xk * yk, minlength=n_groups)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = (n * sxy - sx * sy) / (n * sxx - sx * sx)         # NaN with fewer than 2 readings
+            mean = sy / n
+        results[window] = (n.astype(np.int64), slope, mean)
+    return results
+
+
+def classify(change_percent: np.ndarray, threshold: float) -> np.ndarray:
+    trend = np.where(change_percent > threshold, "Rising", np.where(change_percent < -threshold, "Falling", "Stable")).astype(object)
+    trend[np.isnan(change_percent)] = None
+    return trend
+
+
+def trend_windows(windows: list[int] | None) -> list[int]:
+    windows = sorted(set(windows or TREND_WINDOWS))
+    if any(window < 2 for window in windows):
+        raise ValueError("Trend windows must be at least 2 readings.")
+    return windows
+
+
+def with_trends(table: pd.DataFrame, threshold: float) -> pd.DataFrame:
+    return table.assign(trend=classify(table["change_percent"].to_numpy(dtype=np.float64), threshold))
+
+
+def slope_table(data, windows: list[int]) -> pd.DataFrame:
+    """trend_table without the trend column (it doesn't depend on the threshold)."""
+    if data.empty:
+        return pd.DataFrame(columns=TREND_COLUMNS[:-1])
+
+    names, group = facility_groups(data)
+    table = data.select(METRIC_COLUMNS)
+    pieces = []
+    for col in METRIC_COLUMNS:
+        values = table[col].to_numpy(dtype=np.float64)
+        for window, (n, slope, mean) in window_slopes(values, group, len(names), windows).items():
+            with np.errstate(divide="ignore", invalid="ignore"):
+                change_percent = slope * (n - 1) / np.abs(mean) * 100      # First to last point of the fitted line
+            pieces.append(pd.DataFrame({
+                "facility_name": names,
+                "variable": col,
+                "window": window,
+                "readings": n,
+                "slope": slope,
+                "change_percent": change_percent,
+            }))
+    return pd.concat(pieces, ignore_index=True)
+
+
+def trend_table(data, windows: list[int] | None = None, threshold: float = TREND_STABLE_PERCENT) -> pd.DataFrame:
+    """One row per (facility, metric, window): readings used, slope per reading, fitted change in % and the trend."""
+    return with_trends(slope_table(as_snapshot(data), trend_windows(windows)), threshold)
+
+
+class TrendCache:
+    """
+    Slope tables keyed by (dataset version, window), at most max_entries (least recently used dropped first).
+    Data without a version (a plain DataFrame) is not cached.
+    Missing windows are computed outside the lock, so one slow fit doesn't hold up the other requests.
+    """
+
+    def __init__(self, max_entries: int = TREND_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._tables: OrderedDict[tuple, pd.DataFrame] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, data, windows: list[int] | None = None, threshold: float = TREND_STABLE_PERCENT) -> pd.DataFrame:
+        data = as_snapshot(data)
+        windows = trend_windows(windows)
+        if not data.version:                                               # A plain DataFrame: no version to key on
+            return trend_table(data, windows, threshold)
+        found = {}
+        with self._lock:
+            for window in windows:
+                table = self._tables.get((data.version, window))
+                if table is not None:
+                    self._tables.move_to_end((data.version, window))        # Most recently used
+                    found[window] = table
+
+        missing = [window for window in windows if window not in found]
+        if missing:
+            computed = slope_table(data, missing)                          # Outside the lock
+            with self._lock:
+                for window in missing:
+                    found[window] = computed[computed["window"] == window]
+                    self._tables[(data.version, window)] = found[window]
+                    self._tables.move_to_end((data.version, window))
+                while len(self._tables) > self.max_entries:
+                    self._tables.popitem(last=False)                       # Least recently used
+
+        table = pd.concat([found[window] for window in windows], ignore_index=True)
+        order = np.lexsort((table["window"].to_numpy(), table["variable"].map(METRIC_COLUMNS.index).to_numpy()))
+        return with_trends(table.iloc[order].reset_index(drop=True), threshold)   # Same row order as trend_table
+
+
+def select_trends(table: pd.DataFrame, facility_names: list[str] | None = None, variables: list[str] | None = None) -> pd.DataFrame:
+    """Rows of a trend table for some facilities/variables. Raises ValueError for unknown ones."""
+    unknown = [name for name in variables or [] if name not in METRIC_COLUMNS]
+    if unknown:
+        raise ValueError(f"Invalid variable(s): {', '.join(unknown)}")
+    missing = [name for name in facility_names or [] if name not in set(table["facility_name"])]
+    if missing:
+        raise ValueError(f"Facility '{missing[0]}' not found in the dataset.")
+    if facility_names:
+        table = table[table["facility_name"].isin(facility_names)]
+    if variables:
+        table = table[table["variable"].isin(variables)]
+    return table
+
+
+# One cache per process, shared by the FastAPI app and the gRPC servicer
+trend_cache = TrendCache()
@@ -0,0 +1,175 @@
+import glob
+import json
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc
+
+try:
+    import fcntl
+except ImportError:                               # Windows
+    fcntl = None
+    import msvcrt
+
+# -------------------------------------------------------------------------------------
+# Columnar storage of the dataset
+# What it does: The canonical data (see ingest.py) is saved as Arrow IPC files, which are memory-mapped when
+# read back: no text parsing, and a column is only paged in from disk when it is actually used.
+# An upload writes one "base" file. Appended rows go to small "append" files, which are folded into a new
+# base once there are too many. manifest.json says which files make up the current data, and its version.
+# Files are never overwritten (a new name per version), so a file that is still mapped is never replaced.
+# The FastAPI and gRPC processes share the folder: every write (data file, manifest update, cleanup) is done
+# holding an OS lock on a file in the folder, so they never lose each other's manifest entries or files.
+
+DATASET_DIR = os.getenv("DATASET_DIR", os.path.join(".", "data_store"))
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = "manifest.lock"
+MAX_APPEND_FILES = 16
+
+
+def to_table(data: pd.DataFrame | pa.Table, version: str) -> pa.Table:
+    table = single_dictionaries(data) if isinstance(data, pa.Table) else pa.Table.from_pandas(data, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b"version"] = version.encode()
+    return table.replace_schema_metadata(metadata)
+
+
+def single_dictionaries(table: pa.Table) -> pa.Table:
+    """
+    An IPC file has one dictionary per column, but an appended table (see DatasetSnapshot.appended) has one per
+    chunk: they are merged into one (with int32 codes, so the merged categories always fit).
+    """
+    if all(column.num_chunks <= 1 for column in table.columns):
+        return table
+    fields = [
+        field.with_type(pa.dictionary(pa.int32(), field.type.value_type)) if pa.types.is_dictionary(field.type) else field
+        for field in table.schema
+    ]
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata)).unify_dictionaries()
+
+
+def write_table(data: pd.DataFrame | pa.Table, path: str, version: str):
+    table = to_table(data, version)
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)                 # One record batch per chunk: slices of a column stay zero-copy
+    os.replace(tmp_path, path)
+
+
+def read_table(path: str, columns: list[str] | None = None) -> pa.Table:
+    """Memory-mapped read. The buffers point into the mapped file, nothing is copied until it is used."""
+    source = pa.memory_map(path, "r")
+    table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select([col for col in columns if col in table.column_names])
+    return table
+
+
+class FolderLock:
+    """Exclusive lock on the storage folder: an OS lock on a file (across processes) and a lock across threads. Re-entrant."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, "a+b")
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+                else:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._depth -= 1
+        if self._depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+
+class ArrowStorage:
+
+    def __init__(self, folder: str = DATASET_DIR):
+        self.folder = folder
+        self.manifest_path = os.path.join(folder, MANIFEST_NAME)
+        self.lock = FolderLock(os.path.join(folder, LOCK_NAME))   # Hold it to read the manifest and write based on it
+
+    def stat(self):
+        try:
+            st = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def manifest(self) -> dict | None:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.folder, name)
+
+    def read(self, name: str) -> pa.Table:
+        return read_table(self.path(name))
+
+    def write_base(self, data: pd.DataFrame | pa.Table, version: str) -> str:
+        """Replaces the whole dataset (upload, or folding the append files into one base). Returns the file name."""
+        with self.lock:
+            os.makedirs(self.folder, exist_ok=True)
+            name = f"base-{version}.arrow"
+            if not os.path.exists(self.path(name)):     # Same content uploaded again
+                write_table(data, self.path(name), version)
+            self._write_manifest({"version": version, "base": name, "appends": []})
+        return name
+
+    def write_append(self, rows: pd.DataFrame, version: str) -> int:
+        """Saves appended rows next to the base. Returns the number of append files."""
+        with self.lock:
+            manifest = self.manifest()
+            name = f"append-{len(manifest['appends']) + 1:05d}-{version}.arrow"
+            write_table(rows, self.path(name), version)
+            manifest["appends"].append({"name": name, "version": version})
+            manifest["version"] = version
+            self._write_manifest(manifest)
+            return len(manifest["appends"])
+
+    def _write_manifest(self, manifest: dict):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+        self._cleanup(manifest)
+
+    def _cleanup(self, manifest: dict):
+        # Called with the lock held: no other process is between writing a file and listing it in the manifest
+        keep = {manifest["base"]} | {entry["name"] for entry in manifest["appends"]}
+        for path in glob.glob(os.path.join(self.folder, "*.arrow")):
+            if os.path.basename(path) not in keep:
+                try:
+                    os.remove(path)
+                except OSError:                   # Still mapped by another process (Windows), removed next time
+                    pass
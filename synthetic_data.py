@@ -0,0 +1,146 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from ingest import DATE_FORMAT
+
+# -------------------------------------------------------------------------------------
+# Synthetic CCS data
+# What it does: Generates facility readings in the upload csv schema, at any size (10k to 100M+ rows), for
+# load testing and benchmarks (see benchmark_suite.py). The values look like the real data: daily emissions
+# with a seasonal cycle and a slow trend, capture efficiency and storage integrity around their usual levels,
+# and a share of anomalous readings with lower efficiency. Sites use the regions and site types of bench.csv.
+# The output only depends on the seed and the settings: each facility and block of CHUNK_ROWS rows has its own
+# random stream, so generate() in memory and write_csv() streaming to disk give the same rows.
+
+COLUMNS = [
+    "date", "facility_id", "facility_name", "country", "region", "storage_site_type",
+    "co2_emitted_tonnes", "co2_captured_tonnes", "co2_stored_tonnes",
+    "capture_efficiency_percent", "storage_integrity_percent", "anomaly_flag", "notes",
+]
+
+FACILITY_NAMES = ["Alpha CCS Plant", "Beta Capture Hub", "Delta Storage", "Epsilon Capture"]
+
+# (country, region, storage_site_type): the first five have a row in bench.csv
+SITES = [
+    ("USA", "Texas", "Saline Aquifer"),
+    ("Norway", "Rogaland", "Depleted Oil Field"),
+    ("Japan", "Hokkaido", "Basalt Formation"),
+    ("Australia", "Queensland", "Saline Aquifer"),
+    ("UK", "Aberdeenshire", "Depleted Gas Field"),
+    ("UK", "North Sea", "Saline Aquifer"),
+    ("Norway", "North Sea", "Depleted Oil Field"),
+    ("Australia", "Queensland", "Basalt Formation"),
+]
+
+ANOMALY_NOTES = np.array(["Sensor fault", "Compressor trip", "Injection pressure alarm", "Maintenance"], dtype=object)
+
+CHUNK_ROWS = 1_000_000                  # Rows generated (and random streams) per block
+
+
+def facility(number: int) -> dict:
+    country, region, site_type = SITES[number % len(SITES)]
+    name = FACILITY_NAMES[number] if number < len(FACILITY_NAMES) else f"Facility {number + 1:04d}"
+    return {"facility_id": f"F{number + 1}", "facility_name": name, "country": country, "region": region, "storage_site_type": site_type}
+
+
+def facility_profile(seed: int, number: int) -> dict:
+    """The facility's own levels (size, efficiency, growth), fixed by the seed."""
+    rng = np.random.default_rng([seed, number])
+    return {
+        "emitted": rng.uniform(10_500, 13_500),
+        "efficiency": rng.uniform(84, 91),
+        "integrity": rng.uniform(98.6, 99.4),
+        "growth": rng.uniform(-0.03, 0.05),                      # Per year
+        "phase": rng.uniform(0, 2 * np.pi),
+    }
+
+
+def facility_block(seed: int, number: int, start: int, stop: int, rows_per_facility: int, first_day: pd.Timestamp,
+                   days: int, anomaly_rate: float, missing_rate: float) -> pd.DataFrame:
+    """Rows start..stop of one facility. Readings are spread evenly over the days (several per day if needed)."""
+    profile = facility_profile(seed, number)
+    rng = np.random.default_rng([seed, number, start // CHUNK_ROWS])
+    n = stop - start
+
+    day = (np.arange(start, stop, dtype=np.int64) * days) // rows_per_facility
+    years = day / 365.25
+    season = np.sin(2 * np.pi * years + profile["phase"])
+
+    emitted = profile["emitted"] * (1 + profile["growth"] * years) * (1 + 0.08 * season) * rng.lognormal(0, 0.1, n)
+    efficiency = np.clip(profile["efficiency"] + 1.5 * season + rng.normal(0, 3, n), 55, 99.5)
+    anomaly = rng.random(n) < anomaly_rate
+    efficiency[anomaly] *= rng.uniform(0.8, 0.95, int(anomaly.sum()))             # Anomalies capture less
+    captured = emitted * efficiency / 100
+    stored = captured * rng.uniform(0.985, 1.0, n)
+    integrity = np.clip(profile["integrity"] + rng.normal(0, 0.55, n), 95, 100)
+
+    block = pd.DataFrame({
+        "date": (first_day + pd.to_timedelta(day, unit="D")).strftime(DATE_FORMAT),
+        **{key: value for key, value in facility(number).items()},
+        "co2_emitted_tonnes": emitted.round(2),
+        "co2_captured_tonnes": captured.round(2),
+        "co2_stored_tonnes": stored.round(2),
+        "capture_efficiency_percent": efficiency.round(2),
+        "storage_integrity_percent": integrity.round(3),
+        "anomaly_flag": anomaly,
+        "notes": np.where(anomaly, ANOMALY_NOTES[rng.integers(0, len(ANOMALY_NOTES), n)], None),
+    }, columns=COLUMNS)
+
+    if missing_rate > 0:                                                            # Gaps, like a real sensor feed
+        for col in ["co2_emitted_tonnes", "co2_captured_tonnes", "co2_stored_tonnes", "capture_efficiency_percent", "storage_integrity_percent"]:
+            block.loc[rng.random(n) < missing_rate, col] = np.nan
+    block.index = pd.RangeIndex(start, stop)
+    return block
+
+
+def generate_chunks(rows: int, facilities: int = 4, years: int = 3, anomaly_rate: float = 0.05, missing_rate: float = 0.001,
+                    seed: int = 42, start_date: str = "01/01/2023"):
+    """Yields the data in DataFrames of at most CHUNK_ROWS rows, facility by facility (each sorted by date)."""
+    if rows < facilities:
+        raise ValueError("Need at least one row per facility.")
+    first_day = pd.to_datetime(start_date, format=DATE_FORMAT)
+    days = int(round(365.25 * years))
+    for number in range(facilities):
+        rows_per_facility = rows // facilities + (1 if number < rows % facilities else 0)
+        for start in range(0, rows_per_facility, CHUNK_ROWS):
+            stop = min(start + CHUNK_ROWS, rows_per_facility)
+            yield facility_block(seed, number, start, stop, rows_per_facility, first_day, days, anomaly_rate, missing_rate)
+
+
+def generate(rows: int, **options) -> pd.DataFrame:
+    """The whole dataset in memory (upload csv schema, dates as dd/mm/yyyy strings)."""
+    return pd.concat(generate_chunks(rows, **options), ignore_index=True)
+
+
+def write_csv(path: str, rows: int, **options) -> int:
+    """Streams the data to a csv file chunk by chunk, so 100M rows never have to fit in memory. Returns the rows written."""
+    written = 0
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        for chunk in generate_chunks(rows, **options):
+            chunk.to_csv(f, index=False, header=written == 0)
+            written += len(chunk)
+    os.replace(tmp_path, path)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic CCS facility data (upload csv schema).")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--facilities", type=int, default=4)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--anomaly-rate", type=float, default=0.05)
+    parser.add_argument("--missing-rate", type=float, default=0.001)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--start-date", default="01/01/2023", help="dd/mm/yyyy")
+    parser.add_argument("--output", default="synthetic_data.csv")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    written = write_csv(args.output, args.rows, facilities=args.facilities, years=args.years, anomaly_rate=args.anomaly_rate,
+                        missing_rate=args.missing_rate, seed=args.seed, start_date=args.start_date)
+    print(f"Wrote {written} rows to {args.output} in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,154 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from dataset import store
+from jobs import JobQueue, job_queue
+from model_registry import model_registry
+from models import train_and_save, training_rows, encode_features, cv_folds, cv_fold_from_file, save_cv_data, summarize_cv, TARGET_COL
+
+# -------------------------------------------------------------------------------------
+# Training scheduler
+# What it does: Trains the LightGBM models in a pool of worker processes, so training never blocks the API
+# (and the GIL). Many facilities are trained in parallel, each one as a job with its own status, see jobs.py.
+# A worker process only gets the rows of its facility, and writes the model atomically (temp file + rename),
+# so the model registry picks up the new version as soon as it is complete.
+
+TRAIN_WORKERS = int(os.getenv("TRAIN_WORKERS", min(4, os.cpu_count() or 1)))
+TUNE_LRS = [0.02, 0.05, 0.1]
+TUNE_DEPTHS = [3, 5, 7]
+TRAIN_COLUMNS = ["date", "facility_name", "co2_emitted_tonnes", "region", "storage_site_type", "season", "co2_captured_tonnes"]
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def train_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: the workers start clean, instead of forking a process that runs server threads
+            _pool = ProcessPoolExecutor(max_workers=TRAIN_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def threads_per_worker() -> int:
+    # LightGBM uses every core by default: split them between the workers instead of oversubscribing
+    return max(1, (os.cpu_count() or 1) // TRAIN_WORKERS)
+
+
+async def facility_rows(facility_name: str):
+    loop = asyncio.get_running_loop()
+    snapshot = await loop.run_in_executor(None, store.get)
+    if snapshot is None or facility_name not in snapshot.index:
+        raise ValueError(f"No valid data found for facility {facility_name}")
+    return snapshot, snapshot.rows(facility_name, columns=TRAIN_COLUMNS)
+
+
+async def train_facility(facility_name: str, lr: float = 0.05, depth: int = 5, incremental: bool = False, num_rounds: int | None = None) -> dict:
+    """
+    Trains one facility's model in the process pool. Raises ValueError if it has no usable rows.
+    incremental: continue the saved model on the new rows only (see models.train_and_save).
+    """
+    loop = asyncio.get_running_loop()
+    snapshot, rows = await facility_rows(facility_name)
+    options = {"incremental": incremental} if num_rounds is None else {"incremental": incremental, "num_rounds": num_rounds}
+    result = await loop.run_in_executor(
+        train_pool(), functools.partial(
+            train_and_save, facility_name, rows, model_registry.path(facility_name), lr, depth, threads_per_worker(), **options
+        )
+    )
+    model_registry.invalidate(facility_name)
+    return {**result, "dataset_version": snapshot.version}
+
+
+async def tune_facility(facility_name: str, lrs: list[float] | None = None, depths: list[int] | None = None, n_splits: int = 5) -> dict:
+    """
+    Time-series cross-validation over the lr/depth grid, with early stopping. All (config, fold) fits run in
+    parallel in the process pool. The features go to the workers through one temp file, read once per worker,
+    and the tasks only carry the fold's row positions. The facility's model is then trained on all rows with the
+    best config, for the number of rounds early stopping found, and saved.
+    """
+    loop = asyncio.get_running_loop()
+    snapshot, rows = await facility_rows(facility_name)
+    rows = training_rows(facility_name, rows)
+    if len(rows) <= n_splits:
+        raise ValueError(f"Not enough rows for {n_splits} folds for facility {facility_name}")
+    features, _ = encode_features(rows)
+    target = rows[TARGET_COL]
+
+    started = time.perf_counter()
+    fd, path = tempfile.mkstemp(prefix="tune-", suffix=".pkl")
+    os.close(fd)
+    try:
+        await loop.run_in_executor(None, save_cv_data, features, target, path)
+        tasks = [
+            loop.run_in_executor(train_pool(), cv_fold_from_file, path, train_idx, valid_idx, lr, depth, threads_per_worker())
+            for lr in lrs or TUNE_LRS
+            for depth in depths or TUNE_DEPTHS
+            for train_idx, valid_idx in cv_folds(rows, n_splits)
+        ]
+        folds = await asyncio.gather(*tasks)
+    finally:
+        os.remove(path)
+    for fold_number, fold in enumerate(folds):
+        fold["fold"] = fold_number % n_splits
+    best, configs = summarize_cv(folds)
+    search_seconds = time.perf_counter() - started
+
+    model = await train_facility(facility_name, best["lr"], best["depth"], num_rounds=best["best_iteration"])
+    return {
+        "facility_name": facility_name,
+        "best": best,
+        "configs": configs,
+        "folds": folds,
+        "search_seconds": search_seconds,
+        "model": model,
+    }
+
+
+async def run_training_job(params: dict) -> dict:
+    if params["kind"] == "tuning":
+        return await tune_facility(params["facility_name"], params["lrs"], params["depths"], params["n_splits"])
+    return await train_facility(params["facility_name"], params["lr"], params["depth"], params.get("incremental", False))
+
+
+def training_job_key(facility_name: str, lr: float, depth: int, incremental: bool, version: str) -> str:
+    mode = "incremental" if incremental else "full"
+    return f"train|{facility_name}|{mode}|{lr}|{depth}|{version}"
+
+
+def submit_training(facility_names: list[str], version: str, lr: float = 0.05, depth: int = 5, incremental: bool = False) -> list[tuple[dict, bool]]:
+    """One training job per facility. Returns (job, deduplicated) for each, like JobQueue.submit."""
+    return [
+        training_queue.submit(
+            training_job_key(name, lr, depth, incremental, version),
+            {"kind": "training", "facility_name": name, "lr": lr, "depth": depth, "incremental": incremental},
+        )
+        for name in facility_names
+    ]
+
+
+def submit_tuning(facility_name: str, version: str, lrs: list[float] | None = None, depths: list[int] | None = None, n_splits: int = 5) -> tuple[dict, bool]:
+    lrs, depths = sorted(lrs or TUNE_LRS), sorted(depths or TUNE_DEPTHS)
+    return training_queue.submit(
+        f"tune|{facility_name}|{lrs}|{depths}|{n_splits}|{version}",
+        {"kind": "tuning", "facility_name": facility_name, "lrs": lrs, "depths": depths, "n_splits": n_splits},
+    )
+
+
+# Shares the report jobs' backend, so /jobs/{job_id} (and the GetJob RPC) also report on training jobs
+training_queue = JobQueue(run_training_job, job_queue.backend, workers=TRAIN_WORKERS)
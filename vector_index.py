@@ -0,0 +1,242 @@
+import glob
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from ingest import parse_dates
+from storage import read_table
+
+# -------------------------------------------------------------------------------------
+# RAG retrieval backends
+# What it does: Where the RAG pipeline keeps its chunk embeddings and how it finds the closest ones to a question.
+# Two backends with the same methods: ChromaDB, or a local index. The local index keeps the normalized
+# embeddings in a memory-mapped .npy file and the ids/documents/metadata in an Arrow file next to it, so a query
+# is one matrix-vector product and an argpartition, in process. Chunks can be filtered on their facility and
+# date first: a question about one plant only scores that plant's rows.
+# Like storage.py, files are never overwritten (a new name per version, listed in manifest.json).
+
+RAG_VECTOR_BACKEND = os.getenv("RAG_VECTOR_BACKEND", "chroma")          # "chroma" or "numpy"
+RAG_INDEX_DIR = os.getenv("RAG_INDEX_DIR", os.path.join(".", "rag_index"))
+MANIFEST_NAME = "manifest.json"
+
+NO_DATE = 0
+
+
+def date_keys(values) -> np.ndarray:
+    """dd/mm/yyyy dates (or parsed ones) as yyyymmdd integers, NO_DATE if missing. Comparable as numbers, also in ChromaDB filters."""
+    dates = values if pd.api.types.is_datetime64_any_dtype(values) else parse_dates(values)
+    keys = dates.dt.year * 10000 + dates.dt.month * 100 + dates.dt.day
+    return keys.fillna(NO_DATE).to_numpy(dtype=np.int64)
+
+
+def chunk_metadata(source: str, facility_name: str | None = None, date: int = NO_DATE) -> dict:
+    metadata = {"source": source}                                        # ChromaDB metadata can't hold None
+    if facility_name is not None:
+        metadata["facility_name"] = facility_name
+    if date != NO_DATE:
+        metadata["date"] = int(date)
+    return metadata
+
+
+class ChromaBackend:
+    """The ChromaDB collection, behind the same methods as NumpyBackend. get_collection is called on first use."""
+
+    def __init__(self, get_collection):
+        self._get_collection = get_collection
+
+    @property
+    def collection(self):
+        return self._get_collection()
+
+    def existing_ids(self, ids: list[str]) -> set[str]:
+        return set(self.collection.get(ids=ids, include=[])["ids"])
+
+    def source_ids(self, source: str) -> list[str]:
+        return self.collection.get(where={"source": source}, include=[])["ids"]
+
+    def add(self, ids: list[str], documents: list[str], embeddings: np.ndarray, metadatas: list[dict]):
+        self.collection.add(ids=ids, documents=documents, embeddings=np.asarray(embeddings).tolist(), metadatas=metadatas)
+
+    def delete(self, ids: list[str]):
+        self.collection.delete(ids=ids)
+
+    def flush(self):
+        pass                                                             # ChromaDB writes as it goes
+
+    def query(self, embedding: np.ndarray, k: int, facility_name: str | None = None, start: int | None = None, end: int | None = None) -> list[str]:
+        conditions = []
+        if facility_name is not None:
+            conditions.append({"facility_name": facility_name})
+        if start is not None:
+            conditions.append({"date": {"$gte": start}})
+        if end is not None:
+            conditions.append({"date": {"$lte": end}})
+        where = None if not conditions else conditions[0] if len(conditions) == 1 else {"$and": conditions}
+        results = self.collection.query(query_embeddings=[np.asarray(embedding).tolist()], n_results=k, where=where)
+        return results["documents"][0]
+
+
+class NumpyBackend:
+
+    def __init__(self, folder: str = RAG_INDEX_DIR):
+        self.folder = folder
+        self.manifest_path = os.path.join(folder, MANIFEST_NAME)
+        self._loaded = False
+        self._vectors = None                                             # (rows, dim) float32, memory-mapped once saved
+        self._table = None                                               # id, document, source, facility_name, date
+        self._ids = {}                                                   # id → row
+        self._facility_rows = {}                                         # facility → rows
+        self._dates = np.empty(0, dtype=np.int64)
+        self._pending = []                                               # (ids, documents, embeddings, metadatas) not saved yet
+        self._deleted = set()
+        self._lock = threading.Lock()
+
+    # Loading
+
+    def _load(self):
+        if self._loaded:
+            return
+        manifest = self._manifest()
+        if manifest is None:
+            self._set(np.empty((0, 0), dtype=np.float32), None)
+        else:
+            vectors = np.load(os.path.join(self.folder, manifest["vectors"]), mmap_mode="r")
+            self._set(vectors, read_table(os.path.join(self.folder, manifest["chunks"])))
+        self._loaded = True
+
+    def _set(self, vectors: np.ndarray, table: pa.Table | None):
+        self._vectors = vectors
+        self._table = table
+        if table is None:
+            self._ids, self._facility_rows, self._dates = {}, {}, np.empty(0, dtype=np.int64)
+            return
+        ids = table.column("id").to_pylist()
+        self._ids = dict(zip(ids, range(len(ids))))
+        facilities = table.column("facility_name").to_pandas()
+        self._facility_rows = dict(facilities.groupby(facilities, sort=False).indices)
+        self._dates = table.column("date").to_numpy()
+
+    def _manifest(self) -> dict | None:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    # Writing: adds and deletes are kept until flush, which writes a new version of both files
+
+    def existing_ids(self, ids: list[str]) -> set[str]:
+        with self._lock:
+            self._load()
+            pending = {chunk_id for batch in self._pending for chunk_id in batch[0]}
+            return {chunk_id for chunk_id in ids if (chunk_id in self._ids and chunk_id not in self._deleted) or chunk_id in pending}
+
+    def source_ids(self, source: str) -> list[str]:
+        with self._lock:
+            self._load()
+            if self._table is None:
+                return []
+            sources = self._table.column("source").to_numpy(zero_copy_only=False)
+            ids = self._table.column("id").to_numpy(zero_copy_only=False)
+            return [chunk_id for chunk_id in ids[sources == source] if chunk_id not in self._deleted]
+
+    def add(self, ids: list[str], documents: list[str], embeddings: np.ndarray, metadatas: list[dict]):
+        with self._lock:
+            self._pending.append((list(ids), list(documents), np.asarray(embeddings, dtype=np.float32), list(metadatas)))
+
+    def delete(self, ids: list[str]):
+        with self._lock:
+            self._deleted.update(ids)
+
+    def flush(self):
+        with self._lock:
+            self._load()
+            if not self._pending and not self._deleted:
+                return
+            keep = np.array([chunk_id not in self._deleted for chunk_id in self._ids], dtype=bool)
+            vectors, tables = [], []
+            if self._table is not None:
+                vectors.append(np.asarray(self._vectors)[keep])
+                tables.append(self._table.filter(pa.array(keep)))
+            for ids, documents, embeddings, metadatas in self._pending:
+                vectors.append(normalize(embeddings))
+                tables.append(pa.table({
+                    "id": pa.array(ids, pa.string()),
+                    "document": pa.array(documents, pa.string()),
+                    "source": pa.array([m["source"] for m in metadatas], pa.string()),
+                    "facility_name": pa.array([m.get("facility_name") for m in metadatas], pa.string()),
+                    "date": pa.array([m.get("date", NO_DATE) for m in metadatas], pa.int64()),
+                }))
+            vectors = np.concatenate([v for v in vectors if v.size]) if any(v.size for v in vectors) else np.empty((0, 0), dtype=np.float32)
+            table = pa.concat_tables(tables)
+            self._write(vectors, table)
+            self._pending, self._deleted = [], set()
+
+    def _write(self, vectors: np.ndarray, table: pa.Table):
+        os.makedirs(self.folder, exist_ok=True)
+        version = (self._manifest() or {"version": 0})["version"] + 1
+        vectors_name, chunks_name = f"vectors-{version:05d}.npy", f"chunks-{version:05d}.arrow"
+        np.save(os.path.join(self.folder, vectors_name), vectors)
+        with pa.OSFile(os.path.join(self.folder, chunks_name), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": version, "vectors": vectors_name, "chunks": chunks_name}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+        self._set(np.load(os.path.join(self.folder, vectors_name), mmap_mode="r"), read_table(os.path.join(self.folder, chunks_name)))
+        for path in glob.glob(os.path.join(self.folder, "vectors-*.npy")) + glob.glob(os.path.join(self.folder, "chunks-*.arrow")):
+            if os.path.basename(path) not in (vectors_name, chunks_name):
+                try:
+                    os.remove(path)
+                except OSError:                                          # Still mapped (Windows), removed next time
+                    pass
+
+    # Querying
+
+    def candidates(self, facility_name: str | None = None, start: int | None = None, end: int | None = None) -> np.ndarray | None:
+        """Rows that pass the metadata filter, or None for every row. Facility rows come from an index, not a scan."""
+        rows = None
+        if facility_name is not None:
+            rows = self._facility_rows.get(facility_name, np.empty(0, dtype=np.int64))
+        if start is not None or end is not None:
+            dates = self._dates if rows is None else self._dates[rows]
+            mask = np.ones(len(dates), dtype=bool)
+            if start is not None:
+                mask &= dates >= start
+            if end is not None:
+                mask &= dates <= end
+            rows = np.flatnonzero(mask) if rows is None else rows[mask]
+        return rows
+
+    def query(self, embedding: np.ndarray, k: int, facility_name: str | None = None, start: int | None = None, end: int | None = None) -> list[str]:
+        with self._lock:
+            self._load()
+            vectors, table, rows = self._vectors, self._table, self.candidates(facility_name, start, end)
+        if table is None or len(vectors) == 0:
+            return []
+
+        q = normalize(np.asarray(embedding, dtype=np.float32)[None, :])[0]
+        scores = (vectors if rows is None else vectors[rows]) @ q        # Cosine similarity: the vectors are normalized
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]                              # Best first
+        positions = top if rows is None else rows[top]
+        return table.column("document").take(pa.array(positions)).to_pylist()
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.where(norms == 0, 1, norms)).astype(np.float32)
+
+
+def make_backend(get_collection):
+    if RAG_VECTOR_BACKEND == "numpy":
+        return NumpyBackend(RAG_INDEX_DIR)
+    return ChromaBackend(get_collection)